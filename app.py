@@ -13,8 +13,33 @@ def create_app():
         secretKey = 'your-secret-key-here-change-in-production'  # Fallback
     
     flaskApp.config['SECRET_KEY'] = secretKey
-    flaskApp.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///hospital.db'
+    flaskApp.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///hospital.db')
+    # The double-booking guard is a partial unique index - other backends would make it cover every status
+    if not flaskApp.config['SQLALCHEMY_DATABASE_URI'].startswith(('sqlite:', 'postgresql')):
+        raise RuntimeError('DATABASE_URL must point at SQLite or PostgreSQL')
     flaskApp.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False  # Disable tracking to save memory
+    flaskApp.config['APPOINTMENT_SLOT_MINUTES'] = int(os.environ.get('APPOINTMENT_SLOT_MINUTES', 30))
+    flaskApp.config['COMPRESSION_MIN_SIZE'] = int(os.environ.get('COMPRESSION_MIN_SIZE', 500))  # bytes
+    flaskApp.config['COMPRESSION_LEVEL'] = int(os.environ.get('COMPRESSION_LEVEL', 6))
+    # ASGI mode only (asgi.py) - /api thread pool size, wait queue and wait limit
+    flaskApp.config['API_MAX_WORKERS'] = int(os.environ.get('API_MAX_WORKERS', 16))
+    flaskApp.config['API_MAX_QUEUED'] = int(os.environ.get('API_MAX_QUEUED', 200))
+    flaskApp.config['API_QUEUE_TIMEOUT'] = float(os.environ.get('API_QUEUE_TIMEOUT', 5))  # seconds
+    flaskApp.config['MAX_OPEN_STREAMS'] = int(os.environ.get('MAX_OPEN_STREAMS', 64))  # SSE connections, own pool
+    flaskApp.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))  # 0 = only `flask run-jobs` processes
+    # Reminders: sink is 'outbox' (notifications table) or 'file' (JSON lines at NOTIFICATION_FILE)
+    flaskApp.config['NOTIFICATION_SINK'] = os.environ.get('NOTIFICATION_SINK', 'outbox')
+    flaskApp.config['NOTIFICATION_FILE'] = os.environ.get('NOTIFICATION_FILE',
+                                                          os.path.join(flaskApp.instance_path, 'notifications.jsonl'))
+    flaskApp.config['REMINDER_LEAD_DAYS'] = int(os.environ.get('REMINDER_LEAD_DAYS', 1))
+    flaskApp.config['FOLLOW_UP_LEAD_DAYS'] = int(os.environ.get('FOLLOW_UP_LEAD_DAYS', 3))
+    flaskApp.config['REMINDER_INTERVAL_SECONDS'] = int(os.environ.get('REMINDER_INTERVAL_SECONDS', 900))
+    # Nightly close-out of past appointments still 'Booked' - 'No-Show' or 'Expired', at CLOSEOUT_TIME (HH:MM)
+    flaskApp.config['CLOSEOUT_STATUS'] = os.environ.get('CLOSEOUT_STATUS', 'No-Show')
+    flaskApp.config['CLOSEOUT_TIME'] = os.environ.get('CLOSEOUT_TIME', '01:00')
+    # Finished appointments older than ARCHIVE_AFTER_DAYS move to the archive tables nightly at ARCHIVE_TIME
+    flaskApp.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 365))
+    flaskApp.config['ARCHIVE_TIME'] = os.environ.get('ARCHIVE_TIME', '02:00')
     
     # Initialize extensions with app
     db.init_app(flaskApp)
@@ -31,9 +56,33 @@ def create_app():
         import models
         db.create_all()  # Create all tables
         
+        # Indexes/constraints added after the first release
+        from utils import upgrade_schema
+        upgrade_schema()
+        
+        # Full-text search index for doctors and patients
+        from search import setup_full_text_search, warm_autocomplete, register_autocomplete_listeners
+        setup_full_text_search()
+        
         # Create admin user if not exists
         from utils import create_admin
         create_admin()  # Setup default data
+        
+        # Warm the in-memory typeahead index and keep it in sync on commit
+        warm_autocomplete()
+        register_autocomplete_listeners()
+        
+        # Bitset schedule index is updated in place on booking/availability changes
+        from scheduling import register_schedule_listeners
+        register_schedule_listeners()
+        
+        # Push appointment changes to open dashboards (Server-Sent Events)
+        from live import register_live_listeners
+        register_live_listeners()
+        
+        # Cached dashboard parts are dropped when their data changes
+        from dashboards import register_dashboard_listeners
+        register_dashboard_listeners()
     
     # Register blueprints - using dict for cleaner organization
     # More human approach than multiple register calls
@@ -53,6 +102,30 @@ def create_app():
     blueprintConfig['patient'] = {'blueprint': patient_bp, 'prefix': '/patient'}
     blueprintConfig['api'] = {'blueprint': api_bp, 'prefix': '/api'}
     
+    # Command line tools (flask --app app <command>)
+    from bulk_availability import generate_availability_command
+    flaskApp.cli.add_command(generate_availability_command)
+    
+    # Background job workers (jobs table) - also adds `flask run-jobs`
+    from jobs import init_jobs
+    init_jobs(flaskApp)
+    
+    # Appointment reminders / follow-up notices - a periodic job plus `flask send-reminders`
+    from reminders import init_reminders
+    init_reminders(flaskApp)
+    
+    # Stale 'Booked' appointments closed out nightly - also `flask close-stale-bookings`
+    from closeout import init_closeout
+    init_closeout(flaskApp)
+    
+    # Old finished appointments archived nightly - also `flask archive-appointments`
+    from archive import init_archive
+    init_archive(flaskApp)
+    
+    # gzip (zstd/brotli if installed) for HTML and JSON responses
+    from compression import init_compression
+    init_compression(flaskApp)
+    
     # Register each blueprint with its prefix
     for bpName, bpConfig in blueprintConfig.items():
         currentBlueprint = bpConfig['blueprint']
@@ -0,0 +1,155 @@
+from extensions import db
+from models import Appointment, Treatment, ArchivedAppointment, ArchivedTreatment, WaitlistEntry
+from jobs import job_handler, periodic
+from scheduling import scheduleIndex
+from dashboards import partCache
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, insert, delete, exists, literal, union
+from datetime import datetime, timedelta
+import click
+import heapq
+import time as timer
+
+# Hot/cold split for appointments
+# Finished appointments (and their treatments) older than ARCHIVE_AFTER_DAYS
+# move to appointments_archive / treatments_archive, keeping their ids. Each
+# chunk is copied and deleted in one transaction, so a row is always in
+# exactly one of the two tables. Day-to-day queries (booking, dashboards,
+# the API) only see the smaller hot tables; history pages read both through
+# appointment_history(). Appointments a waitlist entry points at stay hot.
+
+ARCHIVE_STATUSES = ('Completed', 'Cancelled', 'No-Show', 'Expired')
+DEFAULT_CHUNK_SIZE = 500
+CHUNK_PAUSE_SECONDS = 0.05
+
+_appointmentColumns = ['id', 'patient_id', 'doctor_id', 'appointment_date', 'appointment_time', 'status', 'reason',
+                       'created_at', 'updated_at']
+_treatmentColumns = ['id', 'appointment_id', 'diagnosis', 'prescription', 'notes', 'follow_up_date', 'created_at',
+                     'updated_at']
+
+
+def _archivable(cutoffDate):
+    return (
+        Appointment.status.in_(ARCHIVE_STATUSES),
+        Appointment.appointment_date < cutoffDate,
+        ~exists().where(WaitlistEntry.appointment_id == Appointment.id)
+    )
+
+
+def archive_old_appointments(afterDays, chunkSize=DEFAULT_CHUNK_SIZE, pauseSeconds=CHUNK_PAUSE_SECONDS, todayDate=None):
+    """Move finished appointments dated more than afterDays ago to the archive tables, returns a summary dict"""
+    if afterDays < 1:
+        raise ValueError('afterDays must be at least 1')
+    cutoffDate = (todayDate or datetime.now().date()) - timedelta(days=afterDays)
+    startedAt = timer.perf_counter()
+    appointmentCount = 0
+    treatmentCount = 0
+    chunkCount = 0
+
+    while True:
+        with db.engine.begin() as conn:
+            chunkIds = conn.execute(
+                select(Appointment.id).where(*_archivable(cutoffDate))
+                .order_by(Appointment.appointment_date, Appointment.id)
+                .limit(chunkSize)
+            ).scalars().all()
+            if not chunkIds:
+                break
+
+            archivedAt = datetime.utcnow()
+            appointmentTable = Appointment.__table__
+            treatmentTable = Treatment.__table__
+            # Conditions repeated on the copy in case a row changed since the SELECT
+            conn.execute(insert(ArchivedAppointment).from_select(
+                _appointmentColumns + ['archived_at'],
+                select(*[appointmentTable.c[name] for name in _appointmentColumns], literal(archivedAt))
+                .where(Appointment.id.in_(chunkIds), *_archivable(cutoffDate))
+            ))
+            movedIds = select(ArchivedAppointment.id).where(ArchivedAppointment.id.in_(chunkIds))
+            treatmentCount += conn.execute(insert(ArchivedTreatment).from_select(
+                _treatmentColumns + ['archived_at'],
+                select(*[treatmentTable.c[name] for name in _treatmentColumns], literal(archivedAt))
+                .where(Treatment.appointment_id.in_(movedIds))
+            )).rowcount
+            conn.execute(delete(Treatment).where(Treatment.appointment_id.in_(movedIds)))
+            appointmentCount += conn.execute(delete(Appointment).where(Appointment.id.in_(movedIds))).rowcount
+        chunkCount += 1
+
+        if len(chunkIds) < chunkSize:
+            break
+        timer.sleep(pauseSeconds)
+
+    if appointmentCount:
+        # Bulk deletes skip the commit hooks - drop what they would have updated
+        from live import adminCounters
+        adminCounters.invalidate()
+        partCache.clear()
+        scheduleIndex.clear()
+
+    return {
+        'cutoff_date': cutoffDate.isoformat(),
+        'appointments': appointmentCount,
+        'treatments': treatmentCount,
+        'chunks': chunkCount,
+        'seconds': round(timer.perf_counter() - startedAt, 3)
+    }
+
+
+# Reading through both tables
+
+def appointment_history(patientId=None, doctorId=None, status=None):
+    """Hot and archived appointments matching the filters, newest first
+
+    Archived rows have the same attributes (doctor, patient, treatment,
+    dates, status), so templates don't need to tell them apart.
+    """
+    criteria = {}
+    if patientId is not None:
+        criteria['patient_id'] = patientId
+    if doctorId is not None:
+        criteria['doctor_id'] = doctorId
+    if status is not None:
+        criteria['status'] = status
+
+    hotRows = Appointment.query.filter_by(**criteria).order_by(
+        Appointment.appointment_date.desc(), Appointment.appointment_time.desc()
+    ).all()
+    coldRows = ArchivedAppointment.query.filter_by(**criteria).order_by(
+        ArchivedAppointment.appointment_date.desc(), ArchivedAppointment.appointment_time.desc()
+    ).all()
+    return list(heapq.merge(hotRows, coldRows, key=lambda apt: (apt.appointment_date, apt.appointment_time),
+                            reverse=True))
+
+
+def doctor_patient_ids(doctorId):
+    """Every patient the doctor has an appointment with, hot or archived"""
+    return db.session.execute(union(
+        select(Appointment.patient_id).where(Appointment.doctor_id == doctorId),
+        select(ArchivedAppointment.patient_id).where(ArchivedAppointment.doctor_id == doctorId)
+    )).scalars().all()
+
+
+@job_handler('archive_appointments', maxAttempts=3)
+def archive_appointments_job(chunk_size=DEFAULT_CHUNK_SIZE):
+    return archive_old_appointments(current_app.config['ARCHIVE_AFTER_DAYS'], chunkSize=chunk_size)
+
+
+def init_archive(flaskApp):
+    """Schedule the nightly archive run and add `flask archive-appointments`"""
+    flaskApp.cli.add_command(archive_appointments_command)
+    periodic('archive_appointments', dailyAt=flaskApp.config['ARCHIVE_TIME'])
+
+
+@click.command('archive-appointments')
+@click.option('--days', 'afterDays', type=int, default=None, help='Archive finished appointments older than this, defaults to ARCHIVE_AFTER_DAYS')
+@click.option('--chunk-size', 'chunkSize', default=DEFAULT_CHUNK_SIZE, show_default=True)
+@with_appcontext
+def archive_appointments_command(afterDays, chunkSize):
+    """Move old finished appointments and their treatments to the archive tables"""
+    try:
+        summary = archive_old_appointments(afterDays or current_app.config['ARCHIVE_AFTER_DAYS'], chunkSize)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    click.echo(f"Archived {summary['appointments']} appointments and {summary['treatments']} treatments "
+               f"before {summary['cutoff_date']} in {summary['chunks']} chunks ({summary['seconds']}s)")
@@ -0,0 +1,279 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import io
+import sys
+
+# Optional ASGI serving mode for the API
+# /api requests go through a bounded thread pool with a concurrency limit: at
+# most maxWorkers run at once, up to maxQueued more wait (for at most
+# queueTimeout seconds) and anything beyond that gets 503 + Retry-After
+# straight away instead of piling up. The event loop itself never blocks on
+# the database. Every other path (the HTML blueprints) is still the plain
+# Flask WSGI app, just run on a separate pool so it can't starve the API.
+# Streamed responses (the SSE dashboards) are pulled on a third pool of
+# their own, at most maxStreams open at once, and are closed as soon as the
+# client disconnects - an open tab never holds a page-serving thread.
+#
+# Run with any ASGI server, e.g.:  uvicorn --factory asgi:create_asgi_app
+# The regular WSGI entry point (python app.py / flask run) is unchanged.
+
+API_PREFIX = '/api'
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+
+class ApiLimiter:
+    """Concurrency limit plus a bounded, time-limited wait queue"""
+
+    def __init__(self, maxConcurrent, maxQueued, queueTimeout):
+        self.maxConcurrent = maxConcurrent
+        self.maxQueued = maxQueued
+        self.queueTimeout = queueTimeout
+        self.semaphore = None  # Created on the server's event loop
+        self.waiting = 0
+        self.inFlight = 0
+        self.stats = {'served': 0, 'rejected_full': 0, 'rejected_timeout': 0, 'peak_in_flight': 0, 'peak_waiting': 0}
+
+    async def acquire(self):
+        """True once a slot is held, False if the request should be rejected"""
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.maxConcurrent)
+        if not self.semaphore.locked():
+            await self.semaphore.acquire()  # Free slot, doesn't suspend
+        elif self.waiting >= self.maxQueued:
+            self.stats['rejected_full'] += 1
+            return False
+        else:
+            self.waiting += 1
+            self.stats['peak_waiting'] = max(self.stats['peak_waiting'], self.waiting)
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), timeout=self.queueTimeout)
+            except asyncio.TimeoutError:
+                self.stats['rejected_timeout'] += 1
+                return False
+            finally:
+                self.waiting -= 1
+
+        self.inFlight += 1
+        self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self.inFlight)
+        return True
+
+    def release(self):
+        self.inFlight -= 1
+        self.stats['served'] += 1
+        self.semaphore.release()
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI http scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('127.0.0.1', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'CONTENT_LENGTH': str(len(body))
+    }
+    for rawName, rawValue in scope.get('headers', []):
+        name = rawName.decode('latin-1').upper().replace('-', '_')
+        value = rawValue.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def _start_wsgi(wsgiApp, environ):
+    """Call the WSGI app (in a worker thread); buffered bodies are read here too"""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+        return lambda data: None
+
+    iterable = wsgiApp(environ, start_response)
+    isBuffered = any(name.lower() == 'content-length' for name, value in started['headers'])
+    if isBuffered:
+        try:
+            return started, [b''.join(iterable)], None
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+    return started, None, iterable
+
+
+def _next_chunk(iterator):
+    try:
+        return next(iterator)
+    except StopIteration:
+        return None
+
+
+class HybridAsgiApp:
+    """ASGI app: /api behind the limiter, everything else plain WSGI"""
+
+    def __init__(self, wsgiApp, maxWorkers=16, maxQueued=200, queueTimeout=5.0, otherWorkers=32, maxStreams=64):
+        self.wsgiApp = wsgiApp
+        self.apiPool = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix='asgi-api')
+        self.otherPool = ThreadPoolExecutor(max_workers=otherWorkers, thread_name_prefix='asgi-wsgi')
+        self.streamPool = ThreadPoolExecutor(max_workers=maxStreams, thread_name_prefix='asgi-stream')
+        self.limiter = ApiLimiter(maxWorkers, maxQueued, queueTimeout)
+        self.retryAfter = max(1, int(queueTimeout))
+        self.maxStreams = maxStreams
+        self.openStreams = 0
+        self.streamStats = {'opened': 0, 'rejected': 0, 'disconnected': 0}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return  # No websockets here
+
+        body = await self._read_body(receive)
+        if body is None:
+            await self._simple_response(send, 413, b'Request body too large')
+            return
+
+        if not scope['path'].startswith(API_PREFIX):
+            await self._run_wsgi(self.otherPool, scope, body, receive, send)
+            return
+
+        if not await self.limiter.acquire():
+            await self._simple_response(send, 503, b'{"success": false, "message": "Server busy, try again shortly"}',
+                                        contentType=b'application/json',
+                                        extraHeaders=[(b'retry-after', str(self.retryAfter).encode())])
+            return
+        try:
+            await self._run_wsgi(self.apiPool, scope, body, receive, send)
+        finally:
+            self.limiter.release()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.apiPool.shutdown(wait=False)
+                self.otherPool.shutdown(wait=False)
+                self.streamPool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, receive):
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                break
+        return b''.join(chunks)
+
+    async def _run_wsgi(self, pool, scope, body, receive, send):
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, body)
+        started, bufferedBody, iterable = await loop.run_in_executor(pool, _start_wsgi, self.wsgiApp, environ)
+
+        if bufferedBody is None and self.openStreams >= self.maxStreams:
+            self.streamStats['rejected'] += 1
+            if hasattr(iterable, 'close'):
+                await loop.run_in_executor(pool, iterable.close)
+            await self._simple_response(send, 503, b'Too many open streams, try again shortly',
+                                        extraHeaders=[(b'retry-after', str(self.retryAfter).encode())])
+            return
+
+        await send({
+            'type': 'http.response.start',
+            'status': started['status'],
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in started['headers']]
+        })
+        if bufferedBody is not None:
+            await send({'type': 'http.response.body', 'body': bufferedBody[0]})
+            return
+        await self._stream(iterable, receive, send)
+
+    async def _stream(self, iterable, receive, send):
+        """Pull a streamed response (e.g. SSE) chunk by chunk on the stream pool until it ends or the client leaves"""
+        loop = asyncio.get_running_loop()
+        self.openStreams += 1
+        self.streamStats['opened'] += 1
+        disconnected = asyncio.ensure_future(self._wait_for_disconnect(receive))
+        iterator = iter(iterable)
+        nextChunk = None
+        try:
+            while True:
+                nextChunk = loop.run_in_executor(self.streamPool, _next_chunk, iterator)
+                await asyncio.wait({nextChunk, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if not nextChunk.done():
+                    # Client gone while the generator waits - it can only be closed once
+                    # this chunk (at the latest the next heartbeat) comes back
+                    self.streamStats['disconnected'] += 1
+                    await nextChunk
+                    break
+                chunk = nextChunk.result()
+                if chunk is None:
+                    await send({'type': 'http.response.body', 'body': b''})
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            disconnected.cancel()
+            self.openStreams -= 1
+            if nextChunk is not None and not nextChunk.done():
+                await asyncio.wait({nextChunk})  # Cancelled by the server - can't close a running generator
+            if hasattr(iterable, 'close'):
+                await loop.run_in_executor(self.streamPool, iterable.close)
+
+    async def _wait_for_disconnect(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    async def _simple_response(self, send, status, body, contentType=b'text/plain', extraHeaders=()):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', contentType), (b'content-length', str(len(body)).encode())] + list(extraHeaders)
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def create_asgi_app(flaskApp=None):
+    """ASGI entry point, limits come from the Flask config"""
+    if flaskApp is None:
+        from app import create_app
+        flaskApp = create_app()
+    config = flaskApp.config
+    asgiApp = HybridAsgiApp(
+        flaskApp,
+        maxWorkers=config.get('API_MAX_WORKERS', 16),
+        maxQueued=config.get('API_MAX_QUEUED', 200),
+        queueTimeout=config.get('API_QUEUE_TIMEOUT', 5.0),
+        maxStreams=config.get('MAX_OPEN_STREAMS', 64)
+    )
+    flaskApp.extensions['asgi'] = asgiApp
+    return asgiApp
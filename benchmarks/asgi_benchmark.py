@@ -0,0 +1,232 @@
+"""Benchmark /api under many concurrent clients: threaded WSGI vs ASGI mode
+
+Usage: python benchmarks/asgi_benchmark.py [clients] [requests_per_client]
+
+Starts the app on a throwaway SQLite database, each run in its own
+process: once on werkzeug's threaded server (what `python app.py` runs, one
+thread per connection) and once as asgi.create_asgi_app() (bounded /api
+pool + wait queue). The ASGI app is served by uvicorn when it's installed,
+otherwise by a minimal HTTP/1.1 loop below, which is enough for
+Connection: close requests. Then `clients` asyncio clients (default 500)
+hit a mix of /api GETs at the same time, logged in as admin, and we report
+throughput, latency percentiles, 503s, connection errors and the server's
+peak thread count. A third run gives the ASGI wait queue room for every
+client, to compare completed work rather than load shedding.
+"""
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+LISTEN_BACKLOG = 1024
+PATHS = ['/api/doctors/{id}', '/api/patients/{id}', '/api/appointments', '/api/departments']
+
+
+# Server side (runs in a child process)
+
+def serve(mode, port):
+    from app import create_app
+    flaskApp = create_app()
+
+    # Peak thread count, printed on stdin EOF
+    peak = {'threads': 0}
+
+    def sample_threads():
+        while True:
+            peak['threads'] = max(peak['threads'], threading.active_count())
+            time.sleep(0.01)
+    threading.Thread(target=sample_threads, daemon=True).start()
+
+    def report_on_eof():
+        sys.stdin.read()
+        asgiApp = flaskApp.extensions.get('asgi')
+        limiterStats = asgiApp.limiter.stats if asgiApp is not None else {}
+        print(f"STATS threads={peak['threads']} {limiterStats}", flush=True)
+        os._exit(0)
+    threading.Thread(target=report_on_eof, daemon=True).start()
+
+    if mode == 'wsgi':
+        import logging
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        from werkzeug.serving import make_server
+        server = make_server('127.0.0.1', port, flaskApp, threaded=True)
+        server.socket.listen(LISTEN_BACKLOG)
+        print('READY', flush=True)
+        server.serve_forever()
+    else:
+        from asgi import create_asgi_app
+        asgiApp = create_asgi_app(flaskApp)
+        try:
+            import uvicorn
+        except ImportError:
+            uvicorn = None
+        print('READY', flush=True)
+        if uvicorn is not None:
+            uvicorn.run(asgiApp, host='127.0.0.1', port=port, log_level='error', backlog=LISTEN_BACKLOG)
+        else:
+            asyncio.run(minimal_asgi_server(asgiApp, port))
+
+
+async def minimal_asgi_server(asgiApp, port):
+    async def handle(reader, writer):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+            requestLine, *headerLines = head.decode('latin-1').split('\r\n')
+            method, target, version = requestLine.split(' ', 2)
+            headers = []
+            for line in headerLines:
+                if line:
+                    name, value = line.split(':', 1)
+                    headers.append((name.strip().lower().encode('latin-1'), value.strip().encode('latin-1')))
+            length = int(dict(headers).get(b'content-length', 0))
+            body = await reader.readexactly(length) if length else b''
+            path, _, query = target.partition('?')
+            scope = {
+                'type': 'http', 'http_version': version.split('/')[1], 'method': method, 'scheme': 'http',
+                'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+                'headers': headers, 'client': writer.get_extra_info('peername'), 'server': ('127.0.0.1', port)
+            }
+
+            async def receive():
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    lines = [f"HTTP/1.1 {message['status']} -"]
+                    lines += [f"{name.decode('latin-1')}: {value.decode('latin-1')}" for name, value in message['headers']]
+                    lines.append('Connection: close')
+                    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+                else:
+                    writer.write(message.get('body', b''))
+                    await writer.drain()
+
+            await asgiApp(scope, receive, send)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', port, backlog=LISTEN_BACKLOG)
+    async with server:
+        await server.serve_forever()
+
+
+# Client side
+
+async def fetch(port, path, cookie):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        response = await reader.read()
+        return int(response[9:12])
+    finally:
+        writer.close()
+
+
+async def run_clients(port, cookie, clientCount, requestsPerClient, ids):
+    latencies = []
+    statuses = {}
+    errors = 0
+    gate = asyncio.Event()
+
+    async def client(clientNo):
+        nonlocal errors
+        rng = random.Random(clientNo)
+        await gate.wait()  # Everybody starts at once
+        for n in range(requestsPerClient):
+            path = rng.choice(PATHS).format(id=rng.choice(ids))
+            startedAt = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(fetch(port, path, cookie), timeout=60)
+            except (OSError, asyncio.TimeoutError):
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - startedAt)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    tasks = [asyncio.create_task(client(n)) for n in range(clientCount)]
+    await asyncio.sleep(0.1)
+    startedAt = time.perf_counter()
+    gate.set()
+    await asyncio.gather(*tasks)
+    return time.perf_counter() - startedAt, latencies, statuses, errors
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def session_cookie():
+    from app import create_app
+    flaskApp = create_app()
+    with flaskApp.app_context():
+        from utils import create_sample_data
+        create_sample_data()
+    client = flaskApp.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    return f"session={client.get_cookie('session').value}"
+
+
+def run_mode(mode, port, clientCount, requestsPerClient, cookie, extraEnv):
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', mode, str(port)],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, cwd=ROOT,
+                              env=dict(os.environ, **extraEnv))
+    try:
+        while server.stdout.readline().strip() != 'READY':
+            if server.poll() is not None:
+                raise RuntimeError(f'{mode} server did not start')
+        time.sleep(0.5)
+        result = asyncio.run(run_clients(port, cookie, clientCount, requestsPerClient, list(range(1, 5))))
+        server.stdin.close()
+        serverStats = ''
+        for line in server.stdout:
+            if line.startswith('STATS'):
+                serverStats = line[6:].strip()
+        return result, serverStats
+    finally:
+        server.kill()
+        server.wait()
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve(sys.argv[2], int(sys.argv[3]))
+        return
+
+    clientCount = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    requestsPerClient = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    dbDir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(dbDir, 'asgi_bench.db')}"
+    cookie = session_cookie()
+
+    print(f'{clientCount} concurrent clients x {requestsPerClient} requests')
+    print(f'{"mode":<16}{"seconds":>9}{"req/s":>9}{"p50 ms":>9}{"p99 ms":>9}{"max ms":>9}{"2xx":>7}{"503":>6}{"errors":>8}')
+    # Default ASGI limits shed load with 503s; the deep-queue run waits instead
+    runs = [
+        ('wsgi', 'wsgi', 5801, {}),
+        ('asgi', 'asgi', 5802, {}),
+        ('asgi deep queue', 'asgi', 5803, {'API_MAX_QUEUED': str(clientCount), 'API_QUEUE_TIMEOUT': '60'}),
+    ]
+    for label, mode, port, extraEnv in runs:
+        (seconds, latencies, statuses, errors), serverStats = run_mode(mode, port, clientCount, requestsPerClient,
+                                                                       cookie, extraEnv)
+        okCount = sum(count for status, count in statuses.items() if 200 <= status < 300)
+        print(f'{label:<16}{seconds:>9.2f}{len(latencies) / seconds:>9.0f}'
+              f'{percentile(latencies, 0.5) * 1000:>9.0f}{percentile(latencies, 0.99) * 1000:>9.0f}'
+              f'{max(latencies, default=0) * 1000:>9.0f}{okCount:>7}{statuses.get(503, 0):>6}{errors:>8}')
+        print(f'{"":<16}server: {serverStats}')
+
+
+if __name__ == '__main__':
+    main()
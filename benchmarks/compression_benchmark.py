@@ -0,0 +1,88 @@
+"""Benchmark response compression: CPU time against bytes saved
+
+Usage: python benchmarks/compression_benchmark.py [rows] [link_kbps]
+
+Builds payloads shaped like the app's responses (an /api/appointments JSON
+list, an admin HTML table) with the given number of rows and compresses each
+with every encoder available here (gzip always, zstd/brotli if installed) at a
+few levels. Transfer time is estimated for a WAN link of link_kbps.
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from compression import available_encoders
+
+NAMES = ['Rahul Verma', 'Sneha Reddy', 'Arjun Singh', 'Pooja Iyer', 'Vikram Sharma', 'Ananya Patel']
+DOCTORS = ['Dr. Rajesh Kumar', 'Dr. Priya Sharma', 'Dr. Amit Patel', 'Dr. Sunita Reddy', 'Dr. Vikram Singh']
+STATUSES = ['Booked', 'Completed', 'Cancelled']
+LEVELS = [1, 6, 9]
+REPEATS = 5
+
+
+def api_payload(rowCount):
+    rng = random.Random(42)
+    appointments = [{
+        'id': n + 1,
+        'patient': {'id': rng.randrange(1, 5000), 'name': rng.choice(NAMES)},
+        'doctor': {'id': rng.randrange(1, 50), 'name': rng.choice(DOCTORS), 'specialization': 'Cardiologist'},
+        'appointment_date': f'2026-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}',
+        'appointment_time': f'{rng.randrange(9, 17):02d}:{rng.choice(["00", "30"])}',
+        'status': rng.choice(STATUSES),
+        'reason': 'Regular checkup and follow-up consultation'
+    } for n in range(rowCount)]
+    return json.dumps({'success': True, 'count': rowCount, 'appointments': appointments}).encode('utf-8')
+
+
+def html_payload(rowCount):
+    rng = random.Random(7)
+    rows = ''.join(
+        f'<tr><td>{n + 1}</td><td>{rng.choice(NAMES)}</td><td>{rng.choice(DOCTORS)}</td>'
+        f'<td>{rng.randrange(1, 29):02d} Oct 2026</td><td>{rng.randrange(9, 12):02d}:00 AM</td>'
+        f'<td><span class="badge badge-booked">Booked</span></td>'
+        f'<td><a href="/admin/appointment/{n + 1}" class="btn btn-sm btn-outline-primary">View</a></td></tr>\n'
+        for n in range(rowCount))
+    return ('<html><body><div class="table-responsive"><table class="table table-hover"><tbody>\n'
+            + rows + '</tbody></table></div></body></html>').encode('utf-8')
+
+
+def time_compress(encoder, data):
+    best = None
+    for _ in range(REPEATS):
+        startedAt = time.perf_counter()
+        compressed = encoder.compress(data)
+        elapsed = time.perf_counter() - startedAt
+        best = elapsed if best is None else min(best, elapsed)
+    return compressed, best
+
+
+def main():
+    rowCount = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    linkKbps = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    bytesPerSecond = linkKbps * 1000 / 8
+
+    payloads = [('api json', api_payload(rowCount)), ('admin html', html_payload(rowCount))]
+    print(f'{rowCount} rows, transfer estimated at {linkKbps} kbit/s')
+    print(f'{"payload":<11} {"encoding":<9} {"level":>5} {"bytes":>10} {"ratio":>6} {"cpu ms":>8} {"MB/s":>7} {"saved ms":>9}')
+
+    for payloadName, data in payloads:
+        plainTransfer = len(data) / bytesPerSecond
+        print(f'{payloadName:<11} {"identity":<9} {"-":>5} {len(data):>10} {1.0:>6.2f} {0.0:>8.2f} {"-":>7} '
+              f'{0.0:>9.1f}  ({plainTransfer * 1000:.0f} ms transfer)')
+        for level in LEVELS:
+            for encoder in available_encoders(level):
+                compressed, seconds = time_compress(encoder, data)
+                ratio = len(data) / len(compressed)
+                throughput = len(data) / seconds / 1e6
+                # Time saved on the wire minus the CPU spent compressing
+                savedMs = (plainTransfer - len(compressed) / bytesPerSecond - seconds) * 1000
+                print(f'{payloadName:<11} {encoder.name:<9} {level:>5} {len(compressed):>10} {ratio:>6.2f} '
+                      f'{seconds * 1000:>8.2f} {throughput:>7.1f} {savedMs:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark FTS5 patient search against the old ILIKE scan
+
+Usage: python benchmarks/search_benchmark.py [patient_count]
+
+Builds a throwaway SQLite database with the real schema, loads the patients
+in batches and times a handful of typical search-box queries both ways.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import create_engine, select, or_, insert
+from extensions import db
+from models import Patient
+from search import install_fts, ranked_matches
+
+FIRST_NAMES = ['Rahul', 'Sneha', 'Arjun', 'Pooja', 'Vikram', 'Ananya', 'Rohan', 'Kavya',
+               'Aditya', 'Meera', 'Karan', 'Isha', 'Siddharth', 'Nisha', 'Varun', 'Priya']
+LAST_NAMES = ['Verma', 'Reddy', 'Singh', 'Iyer', 'Sharma', 'Patel', 'Gupta', 'Nair',
+              'Kumar', 'Das', 'Menon', 'Joshi', 'Rao', 'Bose', 'Mehta', 'Pillai']
+QUERIES = ['rahul', 'sneha red', 'kum', 'arjun singh', '91234', 'xyz']
+BATCH_SIZE = 50000
+
+
+def load_patients(engine, patientCount):
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        for batchStart in range(0, patientCount, BATCH_SIZE):
+            batchEnd = min(batchStart + BATCH_SIZE, patientCount)
+            rows = [{
+                'user_id': n + 1,
+                'full_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {n}',
+                'phone': f'9{rng.randrange(10 ** 9):09d}',
+                'address': 'Sample address',
+            } for n in range(batchStart, batchEnd)]
+            conn.execute(insert(Patient.__table__), rows)
+
+
+def time_query(conn, statement, repeats=5):
+    bestTime = None
+    rowCount = 0
+    for i in range(repeats):
+        startedAt = time.perf_counter()
+        rowCount = len(conn.execute(statement).fetchall())
+        elapsed = time.perf_counter() - startedAt
+        if bestTime is None or elapsed < bestTime:
+            bestTime = elapsed
+    return bestTime, rowCount
+
+
+def main():
+    patientCount = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    dbPath = os.path.join(tempfile.mkdtemp(), 'search_bench.db')
+    engine = create_engine(f'sqlite:///{dbPath}')
+
+    db.metadata.create_all(engine)
+    if not install_fts(engine):
+        print('FTS5 is not available in this SQLite build')
+        return
+
+    print(f'Loading {patientCount} patients (FTS triggers enabled)...')
+    startedAt = time.perf_counter()
+    load_patients(engine, patientCount)
+    print(f'  loaded in {time.perf_counter() - startedAt:.1f}s')
+
+    patients = Patient.__table__
+    print(f'{"query":<14}{"ilike ms":>12}{"fts ms":>12}{"rows":>10}')
+    with engine.connect() as conn:
+        for term in QUERIES:
+            likeStatement = select(patients.c.id).where(or_(
+                patients.c.full_name.ilike(f'%{term}%'),
+                patients.c.phone.ilike(f'%{term}%')
+            ))
+            ranked = ranked_matches('patients', term)
+            ftsStatement = select(ranked.c.id).order_by(ranked.c.rank)
+
+            likeTime, likeRows = time_query(conn, likeStatement)
+            ftsTime, ftsRows = time_query(conn, ftsStatement)
+            print(f'{term:<14}{likeTime * 1000:>12.2f}{ftsTime * 1000:>12.2f}{ftsRows:>10}')
+            if likeRows != ftsRows:
+                print(f'  note: ilike matched {likeRows} rows (substring vs prefix semantics)')
+
+    os.remove(dbPath)
+
+
+if __name__ == '__main__':
+    main()
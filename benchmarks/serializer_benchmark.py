@@ -0,0 +1,124 @@
+"""Benchmark API serialization: ORM instances vs compiled row serializers
+
+Usage: python benchmarks/serializer_benchmark.py [appointment_count]
+
+Builds a throwaway SQLite database with the real schema and serializes every
+appointment the way /api/appointments used to (ORM objects, lazy-loaded
+patient and doctor, strftime) and the way it does now (one joined SELECT of
+row tuples through serializers.APPOINTMENT_SUMMARY). Also times the
+row -> dict step alone on rows already in memory.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, time as dtime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+from extensions import db
+from models import User, Department, Doctor, Patient, Appointment
+from serializers import APPOINTMENT_SUMMARY
+
+DOCTOR_COUNT = 50
+PATIENT_COUNT = 5000
+BATCH_SIZE = 50000
+STATUSES = ['Booked', 'Completed', 'Cancelled']
+
+
+def load_data(engine, appointmentCount):
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(insert(Department.__table__), [{'id': 1, 'name': 'General Medicine'}])
+        conn.execute(insert(User.__table__), [{
+            'id': n + 1, 'username': f'user{n}', 'email': f'user{n}@example.com',
+            'password_hash': '-', 'role': 'doctor' if n < DOCTOR_COUNT else 'patient'
+        } for n in range(DOCTOR_COUNT + PATIENT_COUNT)])
+        conn.execute(insert(Doctor.__table__), [{
+            'id': n + 1, 'user_id': n + 1, 'department_id': 1,
+            'full_name': f'Dr. Doctor {n}', 'specialization': 'General Physician'
+        } for n in range(DOCTOR_COUNT)])
+        conn.execute(insert(Patient.__table__), [{
+            'id': n + 1, 'user_id': DOCTOR_COUNT + n + 1,
+            'full_name': f'Patient {n}', 'phone': f'9{n:09d}'
+        } for n in range(PATIENT_COUNT)])
+        for batchStart in range(0, appointmentCount, BATCH_SIZE):
+            batchEnd = min(batchStart + BATCH_SIZE, appointmentCount)
+            conn.execute(insert(Appointment.__table__), [{
+                'patient_id': rng.randrange(1, PATIENT_COUNT + 1),
+                'doctor_id': rng.randrange(1, DOCTOR_COUNT + 1),
+                'appointment_date': date(2026, 1, 1) + timedelta(days=n % 365),
+                'appointment_time': dtime(9 + n % 8, 30 * (n % 2)),
+                'status': rng.choice(STATUSES),
+                'reason': 'Regular checkup'
+            } for n in range(batchStart, batchEnd)])
+
+
+def orm_serialize(session):
+    """What get_appointments did before serializers.py"""
+    return [{
+        'id': apt.id,
+        'patient_name': apt.patient.full_name,
+        'doctor_name': apt.doctor.full_name,
+        'appointment_date': apt.appointment_date.isoformat(),
+        'appointment_time': apt.appointment_time.strftime('%H:%M'),
+        'status': apt.status,
+        'reason': apt.reason
+    } for apt in session.query(Appointment).all()]
+
+
+def compiled_serialize(conn):
+    row_to_dict = APPOINTMENT_SUMMARY.row_to_dict
+    return [row_to_dict(row) for row in conn.execute(APPOINTMENT_SUMMARY.select())]
+
+
+def timed(fn):
+    startedAt = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - startedAt, result
+
+
+def main():
+    appointmentCount = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    dbPath = os.path.join(tempfile.mkdtemp(), 'serializer_bench.db')
+    engine = create_engine(f'sqlite:///{dbPath}')
+    db.metadata.create_all(engine)
+
+    print(f'Loading {appointmentCount} appointments...')
+    load_data(engine, appointmentCount)
+
+    with Session(engine) as session:
+        ormTime, ormRows = timed(lambda: orm_serialize(session))
+    with engine.connect() as conn:
+        compiledTime, compiledRows = timed(lambda: compiled_serialize(conn))
+        rows = conn.execute(APPOINTMENT_SUMMARY.select()).all()
+
+    # Serialization step alone, rows already fetched
+    row_to_dict = APPOINTMENT_SUMMARY.row_to_dict
+    handTime, handRows = timed(lambda: [{
+        'id': row[0], 'patient_name': row[1], 'doctor_name': row[2],
+        'appointment_date': row[3].isoformat(), 'appointment_time': row[4].strftime('%H:%M'),
+        'status': row[5], 'reason': row[6]
+    } for row in rows])
+    rowTime, rowDicts = timed(lambda: [row_to_dict(row) for row in rows])
+    assert rowDicts == handRows
+    assert sorted(compiledRows, key=lambda d: d['id']) == sorted(ormRows, key=lambda d: d['id'])
+
+    print(f'{"path":<40}{"seconds":>10}{"rows/s":>14}')
+    for label, seconds, count in [
+        ('ORM objects + lazy loads (old)', ormTime, len(ormRows)),
+        ('joined SELECT + compiled serializer', compiledTime, len(compiledRows)),
+        ('row -> dict only, hand-written', handTime, len(handRows)),
+        ('row -> dict only, compiled', rowTime, len(rowDicts)),
+    ]:
+        print(f'{label:<40}{seconds:>10.3f}{count / seconds:>14,.0f}')
+
+    engine.dispose()
+    os.remove(dbPath)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+from extensions import db
+from models import Doctor, User, DoctorAvailability
+from scheduling import scheduleIndex
+from jobs import job_handler
+from flask.cli import with_appcontext
+from sqlalchemy import select
+from datetime import datetime, timedelta
+from itertools import islice
+import click
+import time as timer
+
+# Bulk availability generation
+# Opens schedules for many doctors at once. Rows are built in memory and
+# written as one multi-row upsert per chunk (one commit per chunk), so
+# running it again over the same range just rewrites the same
+# (doctor_id, date) rows instead of duplicating them.
+
+DEFAULT_CHUNK_SIZE = 1000  # 5 bound values per row, well under SQLite's limit
+MAX_RANGE_DAYS = 366
+
+
+def select_doctor_ids(departmentIds=None, doctorIds=None):
+    """Active doctors in the given departments and/or with the given ids (all if neither)"""
+    query = select(Doctor.id).join(User, User.id == Doctor.user_id).where(User.is_active == True)
+    if departmentIds and doctorIds:
+        query = query.where(Doctor.department_id.in_(departmentIds) | Doctor.id.in_(doctorIds))
+    elif departmentIds:
+        query = query.where(Doctor.department_id.in_(departmentIds))
+    elif doctorIds:
+        query = query.where(Doctor.id.in_(doctorIds))
+    return [row[0] for row in db.session.execute(query.order_by(Doctor.id))]
+
+
+def _upsert_statement(rows):
+    """Multi-row INSERT ... ON CONFLICT (doctor_id, date) DO UPDATE, None if unsupported"""
+    dialectName = db.engine.dialect.name
+    if dialectName == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialectName == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+
+    statement = dialect_insert(DoctorAvailability).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=['doctor_id', 'date'],
+        set_={
+            'start_time': statement.excluded.start_time,
+            'end_time': statement.excluded.end_time,
+            'is_available': statement.excluded.is_available
+        }
+    )
+
+
+def _write_chunk(rows):
+    statement = _upsert_statement(rows)
+    if statement is not None:
+        db.session.execute(statement)
+    else:
+        # No native upsert - replace the chunk's keys inside the same transaction
+        for row in rows:
+            DoctorAvailability.query.filter_by(doctor_id=row['doctor_id'], date=row['date']).delete()
+        db.session.execute(DoctorAvailability.__table__.insert(), rows)
+    db.session.commit()
+
+
+def check_range(startDate, endDate, startTime, endTime):
+    """ValueError if the dates/times can't be generated"""
+    if endDate < startDate:
+        raise ValueError('End date must be on or after the start date.')
+    if (endDate - startDate).days + 1 > MAX_RANGE_DAYS:
+        raise ValueError(f'Date range is limited to {MAX_RANGE_DAYS} days.')
+    if endTime <= startTime:
+        raise ValueError('End time must be after start time.')
+
+
+def generate_availability(startDate, endDate, startTime, endTime, departmentIds=None, doctorIds=None,
+                          weekdays=None, isAvailable=True, chunkSize=DEFAULT_CHUNK_SIZE):
+    """Write dated availability for many doctors, returns a summary dict
+
+    weekdays limits the dates written (0 = Monday); None means every day.
+    Each chunk commits on its own - if a run fails part way, just run it
+    again, already written rows are simply overwritten.
+    """
+    check_range(startDate, endDate, startTime, endTime)
+
+    startedAt = timer.perf_counter()
+    selectedDoctors = select_doctor_ids(departmentIds, doctorIds)
+
+    totalDays = (endDate - startDate).days + 1
+    allDates = [startDate + timedelta(days=i) for i in range(totalDays)]
+    if weekdays is not None:
+        allDates = [day for day in allDates if day.weekday() in weekdays]
+
+    rowStream = (
+        {'doctor_id': doctorId, 'date': day, 'start_time': startTime,
+         'end_time': endTime, 'is_available': isAvailable}
+        for doctorId in selectedDoctors for day in allDates
+    )
+
+    rowsWritten = 0
+    chunkCount = 0
+    try:
+        while True:
+            rows = list(islice(rowStream, chunkSize))
+            if not rows:
+                break
+            _write_chunk(rows)
+            rowsWritten += len(rows)
+            chunkCount += 1
+    finally:
+        # Core statements skip ORM events, so refresh cached schedules by hand
+        for doctorId in selectedDoctors:
+            scheduleIndex.invalidate(doctorId)
+
+    return {
+        'doctors': len(selectedDoctors),
+        'days': len(allDates),
+        'rows_written': rowsWritten,
+        'chunks': chunkCount,
+        'seconds': round(timer.perf_counter() - startedAt, 3)
+    }
+
+
+@job_handler('generate_availability', maxAttempts=3)
+def generate_availability_job(start_date, end_date, start_time, end_time, department_ids=(), doctor_ids=(),
+                              weekdays=None, is_available=True):
+    """Background version for the admin page - same arguments as JSON (ISO dates, HH:MM times)"""
+    return generate_availability(
+        datetime.strptime(start_date, '%Y-%m-%d').date(),
+        datetime.strptime(end_date, '%Y-%m-%d').date(),
+        datetime.strptime(start_time, '%H:%M').time(),
+        datetime.strptime(end_time, '%H:%M').time(),
+        departmentIds=list(department_ids), doctorIds=list(doctor_ids),
+        weekdays=set(weekdays) if weekdays is not None else None, isAvailable=is_available
+    )
+
+
+def parse_weekdays(value):
+    """'0,1,2' -> {0, 1, 2}, empty means every day"""
+    if not value:
+        return None
+    return {int(part) for part in value.split(',') if part.strip() != ''}
+
+
+@click.command('generate-availability')
+@click.option('--start', 'startText', default=None, help='First date (YYYY-MM-DD), defaults to today')
+@click.option('--end', 'endText', default=None, help='Last date (YYYY-MM-DD), overrides --weeks')
+@click.option('--weeks', default=13, show_default=True, help='Number of weeks from the start date')
+@click.option('--department', 'departmentIds', multiple=True, type=int, help='Department id (repeatable)')
+@click.option('--doctor', 'doctorIds', multiple=True, type=int, help='Doctor id (repeatable)')
+@click.option('--from-time', 'fromText', default='09:00', show_default=True)
+@click.option('--to-time', 'toText', default='17:00', show_default=True)
+@click.option('--weekdays', 'weekdaysText', default='0,1,2,3,4', show_default=True,
+              help='Comma separated weekdays, 0 = Monday; empty for every day')
+@click.option('--unavailable', is_flag=True, help='Mark the dates as not available instead')
+@click.option('--chunk-size', 'chunkSize', default=DEFAULT_CHUNK_SIZE, show_default=True)
+@with_appcontext
+def generate_availability_command(startText, endText, weeks, departmentIds, doctorIds, fromText, toText,
+                                  weekdaysText, unavailable, chunkSize):
+    """Bulk-create doctor availability over a date range"""
+    try:
+        startDate = datetime.strptime(startText, '%Y-%m-%d').date() if startText else datetime.now().date()
+        if endText:
+            endDate = datetime.strptime(endText, '%Y-%m-%d').date()
+        else:
+            endDate = startDate + timedelta(days=weeks * 7 - 1)
+
+        summary = generate_availability(
+            startDate, endDate,
+            datetime.strptime(fromText, '%H:%M').time(),
+            datetime.strptime(toText, '%H:%M').time(),
+            departmentIds=list(departmentIds), doctorIds=list(doctorIds),
+            weekdays=parse_weekdays(weekdaysText), isAvailable=not unavailable,
+            chunkSize=chunkSize
+        )
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+    click.echo(f"Wrote {summary['rows_written']} rows for {summary['doctors']} doctors "
+               f"over {summary['days']} days in {summary['chunks']} chunks ({summary['seconds']}s)")
@@ -0,0 +1,100 @@
+from extensions import db
+from models import Appointment, CloseoutRun
+from jobs import job_handler, periodic
+from scheduling import scheduleIndex
+from dashboards import partCache
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, update, insert
+from datetime import datetime
+import click
+import time as timer
+
+# Nightly close-out of stale bookings
+# Appointments dated before today that are still 'Booked' never happened (or
+# nobody recorded them). They're moved to CLOSEOUT_STATUS ('No-Show' or
+# 'Expired') a chunk at a time: pick a chunk of ids through the date index,
+# UPDATE just those rows, commit, pause briefly so requests get the write
+# lock in between. Each run is recorded in closeout_runs. A doctor can still
+# complete a closed-out appointment afterwards.
+
+CLOSED_OUT_STATUSES = ('No-Show', 'Expired')
+DEFAULT_CHUNK_SIZE = 500
+CHUNK_PAUSE_SECONDS = 0.05
+
+
+def close_stale_bookings(newStatus, cutoffDate=None, chunkSize=DEFAULT_CHUNK_SIZE, pauseSeconds=CHUNK_PAUSE_SECONDS):
+    """Move 'Booked' appointments dated before cutoffDate (default today) to newStatus, returns a summary dict"""
+    if newStatus not in CLOSED_OUT_STATUSES:
+        raise ValueError(f"Status must be one of {', '.join(CLOSED_OUT_STATUSES)}")
+    cutoffDate = cutoffDate or datetime.now().date()
+    startedAt = timer.perf_counter()
+    closedCount = 0
+    chunkCount = 0
+
+    while True:
+        with db.engine.begin() as conn:
+            rows = conn.execute(
+                select(Appointment.id, Appointment.patient_id, Appointment.doctor_id)
+                .where(Appointment.appointment_date < cutoffDate, Appointment.status == 'Booked')
+                .order_by(Appointment.appointment_date, Appointment.id)
+                .limit(chunkSize)
+            ).all()
+            if not rows:
+                break
+            # Status checked again - a row completed since the SELECT stays completed
+            closedCount += conn.execute(
+                update(Appointment)
+                .where(Appointment.id.in_([row.id for row in rows]), Appointment.status == 'Booked')
+                .values(status=newStatus, updated_at=datetime.utcnow())
+            ).rowcount
+        chunkCount += 1
+
+        # Core UPDATEs skip the commit hooks, so refresh the index they would have
+        for doctorId in {row.doctor_id for row in rows}:
+            scheduleIndex.invalidate(doctorId)
+        if len(rows) < chunkSize:
+            break
+        timer.sleep(pauseSeconds)
+
+    summary = {
+        'cutoff_date': cutoffDate.isoformat(),
+        'new_status': newStatus,
+        'closed_count': closedCount,
+        'chunk_count': chunkCount,
+        'seconds': round(timer.perf_counter() - startedAt, 3)
+    }
+    with db.engine.begin() as conn:
+        conn.execute(insert(CloseoutRun).values(
+            cutoff_date=cutoffDate, new_status=newStatus, closed_count=closedCount,
+            chunk_count=chunkCount, seconds=summary['seconds'], created_at=datetime.utcnow()
+        ))
+    partCache.invalidate('admin_no_shows')
+    return summary
+
+
+@job_handler('close_stale_bookings', maxAttempts=3)
+def close_stale_bookings_job(chunk_size=DEFAULT_CHUNK_SIZE):
+    return close_stale_bookings(current_app.config['CLOSEOUT_STATUS'], chunkSize=chunk_size)
+
+
+def init_closeout(flaskApp):
+    """Schedule the nightly run and add `flask close-stale-bookings`"""
+    if flaskApp.config['CLOSEOUT_STATUS'] not in CLOSED_OUT_STATUSES:
+        raise ValueError(f"CLOSEOUT_STATUS must be one of {', '.join(CLOSED_OUT_STATUSES)}")
+    flaskApp.cli.add_command(close_stale_bookings_command)
+    periodic('close_stale_bookings', dailyAt=flaskApp.config['CLOSEOUT_TIME'])
+
+
+@click.command('close-stale-bookings')
+@click.option('--status', 'newStatus', type=click.Choice(CLOSED_OUT_STATUSES), default=None,
+              help='Defaults to CLOSEOUT_STATUS')
+@click.option('--before', 'beforeText', default=None, help='Cutoff date (YYYY-MM-DD), defaults to today')
+@click.option('--chunk-size', 'chunkSize', default=DEFAULT_CHUNK_SIZE, show_default=True)
+@with_appcontext
+def close_stale_bookings_command(newStatus, beforeText, chunkSize):
+    """Mark past appointments that are still 'Booked' as No-Show/Expired"""
+    cutoffDate = datetime.strptime(beforeText, '%Y-%m-%d').date() if beforeText else None
+    summary = close_stale_bookings(newStatus or current_app.config['CLOSEOUT_STATUS'], cutoffDate, chunkSize)
+    click.echo(f"Closed {summary['closed_count']} appointments before {summary['cutoff_date']} as "
+               f"{summary['new_status']} in {summary['chunk_count']} chunks ({summary['seconds']}s)")
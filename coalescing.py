@@ -0,0 +1,150 @@
+from flask import request, current_app, Response
+from flask_login import current_user
+from functools import wraps
+from collections import OrderedDict
+import threading
+import time
+
+# Single-flight request coalescing
+# When identical requests (same endpoint, URL params, query string and
+# authorization scope) arrive while one is already being computed, they wait
+# for that one and get a copy of its response instead of running the same
+# queries again. Nothing is cached - once the leader finishes, the next
+# request computes fresh.
+
+WAIT_TIMEOUT_SECONDS = 30
+MAX_TRACKED_KEYS = 1000
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs fn once per key at a time, concurrent callers share the outcome"""
+
+    def __init__(self, maxTrackedKeys=MAX_TRACKED_KEYS):
+        self.lock = threading.Lock()
+        self.calls = {}               # key -> _Call in flight
+        self.stats = OrderedDict()    # key -> metrics, least recently used first
+        self.maxTrackedKeys = maxTrackedKeys
+
+    def _key_stats(self, key):
+        keyStats = self.stats.get(key)
+        if keyStats is None:
+            keyStats = {'requests': 0, 'executions': 0, 'shared': 0, 'errors': 0, 'timeouts': 0,
+                        'max_waiters': 0, 'last_seconds': 0.0, 'total_seconds': 0.0}
+            self.stats[key] = keyStats
+            if len(self.stats) > self.maxTrackedKeys:
+                self.stats.popitem(last=False)
+        else:
+            self.stats.move_to_end(key)
+        return keyStats
+
+    def do(self, key, fn):
+        """Return fn()'s result, computed by whichever caller got here first"""
+        with self.lock:
+            keyStats = self._key_stats(key)
+            keyStats['requests'] += 1
+            call = self.calls.get(key)
+            isLeader = call is None
+            if isLeader:
+                call = _Call()
+                self.calls[key] = call
+            else:
+                call.waiters += 1
+                keyStats['max_waiters'] = max(keyStats['max_waiters'], call.waiters)
+
+        if not isLeader:
+            if not call.done.wait(WAIT_TIMEOUT_SECONDS):
+                # Leader is stuck - don't hang with it, do the work ourselves
+                with self.lock:
+                    keyStats['timeouts'] += 1
+                return fn()
+            with self.lock:
+                keyStats['shared'] += 1
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        startedAt = time.perf_counter()
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            with self.lock:
+                keyStats['errors'] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - startedAt
+            with self.lock:
+                keyStats['executions'] += 1
+                keyStats['last_seconds'] = round(elapsed, 6)
+                keyStats['total_seconds'] = round(keyStats['total_seconds'] + elapsed, 6)
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    def metrics(self):
+        with self.lock:
+            return {key: dict(keyStats, in_flight=key in self.calls) for key, keyStats in self.stats.items()}
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+
+
+singleFlight = SingleFlight()
+
+
+def _auth_scope(scope):
+    if not current_user.is_authenticated:
+        return 'anonymous'
+    if scope == 'role':
+        return f'role:{current_user.role}'
+    return f'user:{current_user.id}'
+
+
+def request_key(scope='user'):
+    """endpoint + URL params + sorted query string + who is asking
+
+    Conditional headers are part of the key too, a 304 for one client is not
+    an answer for another.
+    """
+    viewArgs = '&'.join(f'{name}={value}' for name, value in sorted((request.view_args or {}).items()))
+    queryArgs = '&'.join(f'{name}={value}' for name, value in sorted(request.args.items(multi=True)))
+    key = f'{request.endpoint}|{viewArgs}|{queryArgs}|{_auth_scope(scope)}'
+    ifNoneMatch = request.headers.get('If-None-Match')
+    if ifNoneMatch:
+        key += f'|inm={ifNoneMatch}'
+    return key
+
+
+def coalesce(scope='user'):
+    """Decorator - identical concurrent GET requests share one computation
+
+    scope is the authorization scope the response depends on: 'user' (the
+    default, safe for anything personal) or 'role' when every user with the
+    same role gets the same body. Put it below login_required/admin_required
+    so access is still checked on every request. Not for streaming views.
+    """
+    def decorator(view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+
+            def compute():
+                # Freeze the response so every caller can build its own copy -
+                # response objects get per-request cookies and headers later on
+                response = current_app.make_response(view(*args, **kwargs))
+                return response.get_data(), response.status_code, list(response.headers.items())
+
+            body, status, headers = singleFlight.do(request_key(scope), compute)
+            return Response(body, status=status, headers=headers)
+        return decorated_function
+    return decorator
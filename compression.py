@@ -0,0 +1,203 @@
+from flask import request
+from collections import OrderedDict
+import threading
+import zlib
+
+# Optional encoders - used only when the package is installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response compression
+# Negotiated from Accept-Encoding in an after_request hook. Small bodies are
+# sent as they are, generator responses are compressed chunk by chunk as they
+# stream, and compressed bodies of responses with an ETag are kept in a small
+# LRU so a popular resource is compressed once per version, not per request.
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/json', 'application/javascript', 'image/svg+xml'
+}
+DEFAULT_MIN_SIZE = 500
+DEFAULT_LEVEL = 6
+DEFAULT_CACHE_ENTRIES = 256
+
+
+class Encoder:
+    """One content-coding: whole-body compress plus a streaming compressor factory"""
+
+    def __init__(self, name, compress, streamer):
+        self.name = name
+        self.compress = compress
+        self.streamer = streamer  # () -> (compress_chunk(bytes), finish())
+
+
+def _gzip_compress(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = gzip header
+    return compressor.compress(data) + compressor.flush()
+
+
+def _gzip_streamer(level):
+    def make():
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = gzip header
+        # Sync flush per chunk so each piece reaches the client right away
+        return (lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH),
+                compressor.flush)
+    return make
+
+
+def _zstd_streamer(level):
+    def make():
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        return (lambda chunk: compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+                compressor.flush)
+    return make
+
+
+def _brotli_streamer(level):
+    def make():
+        compressor = brotli.Compressor(quality=level)
+        return (lambda chunk: compressor.process(chunk) + compressor.flush(), compressor.finish)
+    return make
+
+
+def available_encoders(level=DEFAULT_LEVEL):
+    """Encoders usable here, in server preference order"""
+    encoders = []
+    if zstandard is not None:
+        zstdLevel = min(level, 19)
+        encoders.append(Encoder('zstd', zstandard.ZstdCompressor(level=zstdLevel).compress, _zstd_streamer(zstdLevel)))
+    if brotli is not None:
+        brotliLevel = min(level, 11)
+        encoders.append(Encoder('br', lambda data: brotli.compress(data, quality=brotliLevel), _brotli_streamer(brotliLevel)))
+    encoders.append(Encoder('gzip', lambda data: _gzip_compress(data, level), _gzip_streamer(level)))
+    return encoders
+
+
+def parse_accept_encoding(header):
+    """{'gzip': 1.0, 'br': 0.5, ...} from an Accept-Encoding header"""
+    accepted = {}
+    for item in (header or '').split(','):
+        parts = item.strip().split(';')
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def choose_encoder(encoders, header):
+    """Best encoder the client accepts, or None"""
+    accepted = parse_accept_encoding(header)
+    best = None
+    for encoder in encoders:
+        quality = accepted.get(encoder.name, accepted.get('*', 0.0))
+        if quality > 0 and (best is None or quality > best[0]):
+            best = (quality, encoder)
+    return best[1] if best else None
+
+
+class CompressedCache:
+    """LRU of compressed bodies keyed by (url, etag, encoding)"""
+
+    def __init__(self, maxEntries=DEFAULT_CACHE_ENTRIES):
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compress(self, key, encoder, data):
+        with self.lock:
+            compressed = self.entries.get(key)
+            if compressed is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return compressed
+            self.misses += 1
+
+        compressed = encoder.compress(data)
+        with self.lock:
+            self.entries[key] = compressed
+            if len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+        return compressed
+
+
+def _stream_compressed(chunks, encoder):
+    compress_chunk, finish = encoder.streamer()
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            compressedChunk = compress_chunk(chunk)
+            if compressedChunk:
+                yield compressedChunk
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def _add_vary(response):
+    if 'accept-encoding' not in response.vary:
+        response.vary.add('Accept-Encoding')
+
+
+def init_compression(flaskApp):
+    """Register the compression hook, settings come from flaskApp.config"""
+    minSize = flaskApp.config.get('COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE)
+    encoders = available_encoders(flaskApp.config.get('COMPRESSION_LEVEL', DEFAULT_LEVEL))
+    cache = CompressedCache(flaskApp.config.get('COMPRESSION_CACHE_ENTRIES', DEFAULT_CACHE_ENTRIES))
+    flaskApp.extensions['compression'] = cache
+
+    @flaskApp.after_request
+    def compress_response(response):
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response  # Includes text/event-stream, which must not be buffered
+        if response.status_code < 200 or response.status_code in (204, 206, 304) or 'Content-Encoding' in response.headers:
+            return response
+        if 'Range' in request.headers or 'Content-Range' in response.headers:
+            return response  # Byte ranges refer to the identity body, compressing would break them
+
+        _add_vary(response)
+        encoder = choose_encoder(encoders, request.headers.get('Accept-Encoding'))
+        if encoder is None or request.method == 'HEAD':
+            return response
+
+        if response.is_streamed:
+            response.response = _stream_compressed(response.response, encoder)
+            response.headers.pop('Content-Length', None)
+            response.headers['Content-Encoding'] = encoder.name
+            return response
+
+        data = response.get_data()
+        if len(data) < minSize:
+            return response
+
+        etag, isWeak = response.get_etag()
+        if etag:
+            compressed = cache.get_or_compress((request.full_path, etag, encoder.name), encoder, data)
+            # Another representation of the same resource - weak from here on,
+            # etags.not_modified compares weakly
+            response.set_etag(etag, weak=True)
+        else:
+            compressed = encoder.compress(data)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoder.name
+        return response
@@ -0,0 +1,282 @@
+from extensions import db
+from models import Doctor, Patient, Appointment, ArchivedAppointment, Department, CloseoutRun
+from sqlalchemy import select, func, union_all
+from datetime import datetime, timedelta
+import threading
+import time
+
+# Dashboard data for asynchronous hydration
+# The dashboard pages render an empty shell straight away and fetch their
+# data from a JSON endpoint. Each part of a dashboard is built on its own.
+# The expensive shared parts are cached, dropped on commits that touch
+# them, with a TTL as a safety net. Commit hooks only reach the process
+# that made the change, so the per-patient/per-doctor lists (one indexed
+# query each) are not cached at all and the admin lists only briefly -
+# other workers would show them stale.
+
+PART_TTL_SECONDS = 300
+LIST_PART_TTL_SECONDS = 15
+NO_SHOW_WINDOW_DAYS = 30
+MAX_CACHED_PARTS = 5000
+
+
+class PartCache:
+    """(part name, key) -> value with expiry, invalidated by name or name+key"""
+
+    def __init__(self, maxEntries=MAX_CACHED_PARTS):
+        self.maxEntries = maxEntries
+        self.entries = {}  # (name, key) -> (expiresAt, value)
+        self.lock = threading.Lock()
+
+    def get(self, name, key, builder, ttl=PART_TTL_SECONDS):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get((name, key))
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+        value = builder()
+        with self.lock:
+            if len(self.entries) >= self.maxEntries:
+                # Drop expired entries first, everything if that's not enough
+                self.entries = {cacheKey: item for cacheKey, item in self.entries.items() if item[0] > now}
+                if len(self.entries) >= self.maxEntries:
+                    self.entries.clear()
+            self.entries[(name, key)] = (now + ttl, value)
+        return value
+
+    def invalidate(self, name, key=None):
+        with self.lock:
+            if key is not None:
+                self.entries.pop((name, key), None)
+            else:
+                for cacheKey in [cacheKey for cacheKey in self.entries if cacheKey[0] == name]:
+                    del self.entries[cacheKey]
+
+    def invalidate_ids(self, name, ids):
+        """Drop entries of a part whose key is one of ids, or a tuple starting with one"""
+        with self.lock:
+            for cacheKey in list(self.entries):
+                partName, key = cacheKey
+                keyId = key[0] if isinstance(key, tuple) else key
+                if partName == name and keyId in ids:
+                    del self.entries[cacheKey]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+partCache = PartCache()
+
+
+def _appointment_item(row):
+    """JSON item for an appointment row with display strings ready for the page"""
+    return {
+        'id': row.id,
+        'date': row.appointment_date.isoformat(),
+        'time': row.appointment_time.strftime('%H:%M'),
+        'date_display': row.appointment_date.strftime('%d %b %Y'),
+        'time_display': row.appointment_time.strftime('%I:%M %p'),
+        'status': row.status,
+        'patient_name': row.patient_name,
+        'doctor_name': row.doctor_name,
+        'specialization': row.specialization
+    }
+
+
+def _appointment_rows(*criteria, order=(), limit=None):
+    statement = (
+        select(Appointment.id, Appointment.appointment_date, Appointment.appointment_time, Appointment.status,
+               Patient.full_name.label('patient_name'), Doctor.full_name.label('doctor_name'),
+               Doctor.specialization)
+        .join(Patient, Patient.id == Appointment.patient_id)
+        .join(Doctor, Doctor.id == Appointment.doctor_id)
+        .where(*criteria)
+        .order_by(*order)
+    )
+    if limit is not None:
+        statement = statement.limit(limit)
+    return [_appointment_item(row) for row in db.session.execute(statement)]
+
+
+# Parts
+
+def departments_part():
+    def build():
+        return [{'id': dept.id, 'name': dept.name, 'description': dept.description or ''}
+                for dept in db.session.execute(select(Department.id, Department.name, Department.description)
+                                               .order_by(Department.id))]
+    return partCache.get('departments', None, build)
+
+
+def patient_upcoming_part(patientId, todayDate):
+    return _appointment_rows(
+        Appointment.patient_id == patientId,
+        Appointment.appointment_date >= todayDate,
+        Appointment.status == 'Booked',
+        order=(Appointment.appointment_date, Appointment.appointment_time)
+    )
+
+
+def patient_recent_part(patientId):
+    return _appointment_rows(
+        Appointment.patient_id == patientId,
+        order=(Appointment.appointment_date.desc(),),
+        limit=5
+    )
+
+
+def doctor_today_part(doctorId, todayDate):
+    return _appointment_rows(
+        Appointment.doctor_id == doctorId,
+        Appointment.appointment_date == todayDate,
+        order=(Appointment.appointment_time,)
+    )
+
+
+def doctor_week_part(doctorId, todayDate):
+    return _appointment_rows(
+        Appointment.doctor_id == doctorId,
+        Appointment.appointment_date >= todayDate,
+        Appointment.appointment_date <= todayDate + timedelta(days=7),
+        Appointment.status == 'Booked',
+        order=(Appointment.appointment_date, Appointment.appointment_time)
+    )
+
+
+def doctor_stats_part(doctorId):
+    def build():
+        # Hot and archived appointments together
+        allAppointments = union_all(
+            select(Appointment.patient_id, Appointment.status).where(Appointment.doctor_id == doctorId),
+            select(ArchivedAppointment.patient_id, ArchivedAppointment.status)
+            .where(ArchivedAppointment.doctor_id == doctorId)
+        ).subquery()
+        patientCount, completedCount = db.session.execute(
+            select(func.count(func.distinct(allAppointments.c.patient_id)),
+                   func.count().filter(allAppointments.c.status == 'Completed'))
+        ).one()
+        return {'patient_count': patientCount, 'completed_count': completedCount}
+    return partCache.get('doctor_stats', doctorId, build)
+
+
+def admin_upcoming_part(todayDate):
+    return partCache.get('admin_upcoming', todayDate, lambda: _appointment_rows(
+        Appointment.appointment_date >= todayDate,
+        Appointment.status == 'Booked',
+        order=(Appointment.appointment_date, Appointment.appointment_time),
+        limit=10
+    ), ttl=LIST_PART_TTL_SECONDS)
+
+
+def admin_recent_patients_part():
+    def build():
+        rows = db.session.execute(
+            select(Patient.id, Patient.full_name, Patient.phone, Patient.created_at)
+            .order_by(Patient.created_at.desc()).limit(5)
+        )
+        return [{'id': row.id, 'full_name': row.full_name, 'phone': row.phone,
+                 'created_display': row.created_at.strftime('%d %b') if row.created_at else ''} for row in rows]
+    return partCache.get('admin_recent_patients', None, build, ttl=LIST_PART_TTL_SECONDS)
+
+
+def admin_no_show_part(todayDate):
+    """No-shows over the last NO_SHOW_WINDOW_DAYS days, worst doctors, and the last close-out run"""
+    def build():
+        windowStart = todayDate - timedelta(days=NO_SHOW_WINDOW_DAYS)
+        inWindow = (Appointment.appointment_date >= windowStart, Appointment.appointment_date < todayDate)
+        byStatus = dict(db.session.execute(
+            select(Appointment.status, func.count(Appointment.id)).where(*inWindow).group_by(Appointment.status)
+        ).all())
+        noShowCount = byStatus.get('No-Show', 0)
+        attendedCount = byStatus.get('Completed', 0)
+        topDoctors = db.session.execute(
+            select(Doctor.id, Doctor.full_name, func.count(Appointment.id).label('no_shows'))
+            .join(Doctor, Doctor.id == Appointment.doctor_id)
+            .where(*inWindow, Appointment.status == 'No-Show')
+            .group_by(Doctor.id, Doctor.full_name)
+            .order_by(func.count(Appointment.id).desc())
+            .limit(5)
+        ).all()
+        lastRun = db.session.execute(
+            select(CloseoutRun.created_at, CloseoutRun.closed_count, CloseoutRun.new_status)
+            .order_by(CloseoutRun.id.desc()).limit(1)
+        ).first()
+        return {
+            'window_days': NO_SHOW_WINDOW_DAYS,
+            'no_shows': noShowCount,
+            'expired': byStatus.get('Expired', 0),
+            'completed': attendedCount,
+            'rate': round(100.0 * noShowCount / (noShowCount + attendedCount), 1) if noShowCount + attendedCount else None,
+            'top_doctors': [{'id': row.id, 'full_name': row.full_name, 'no_shows': row.no_shows} for row in topDoctors],
+            'last_closeout': {
+                'closed_count': lastRun.closed_count,
+                'new_status': lastRun.new_status,
+                'run_display': lastRun.created_at.strftime('%d %b %H:%M')
+            } if lastRun else None
+        }
+    return partCache.get('admin_no_shows', todayDate, build)
+
+
+# Whole dashboards - one round trip each
+
+def patient_dashboard_data(patientId):
+    todayDate = datetime.now().date()
+    return {
+        'departments': departments_part(),
+        'upcoming_appointments': patient_upcoming_part(patientId, todayDate),
+        'recent_appointments': patient_recent_part(patientId)
+    }
+
+
+def doctor_dashboard_data(doctorId):
+    todayDate = datetime.now().date()
+    weekAppointments = doctor_week_part(doctorId, todayDate)
+    return {
+        'stats': dict(doctor_stats_part(doctorId), week_count=len(weekAppointments)),
+        'today_appointments': doctor_today_part(doctorId, todayDate),
+        'week_appointments': weekAppointments[:8]
+    }
+
+
+def admin_dashboard_data():
+    from live import adminCounters  # Counters are kept by the live producer already
+    todayDate = datetime.now().date()
+    counters = adminCounters.snapshot()
+    return {
+        'totals': counters['totals'],
+        'departments': [dict(info, id=deptId) for deptId, info in counters['departments'].items()],
+        'upcoming_appointments': admin_upcoming_part(todayDate),
+        'recent_patients': admin_recent_patients_part(),
+        'no_show_stats': admin_no_show_part(todayDate)
+    }
+
+
+# Invalidation
+
+def _on_appointment_change(changes):
+    doctorIds = set()
+    for change in changes:
+        for values in (change['values'], change['old']):
+            if values.get('doctor_id') is not None:
+                doctorIds.add(values['doctor_id'])
+
+    partCache.invalidate_ids('doctor_stats', doctorIds)
+    partCache.invalidate('admin_upcoming')
+    partCache.invalidate('admin_no_shows')
+
+
+def _on_person_change(changes):
+    partCache.invalidate('admin_recent_patients')
+    # Doctor/patient names appear in lists everywhere, and renames are rare
+    if any('full_name' in change['old'] or 'specialization' in change['old'] for change in changes):
+        partCache.clear()
+
+
+def register_dashboard_listeners():
+    from events import on_commit
+    on_commit(Appointment, _on_appointment_change)
+    on_commit(Patient, _on_person_change)
+    on_commit(Doctor, _on_person_change)
+    on_commit(Department, lambda changes: partCache.invalidate('departments'))
@@ -0,0 +1,29 @@
+from flask import request, Response
+import hashlib
+
+# ETags and conditional GET
+# The tag is a hash of a cheap fingerprint - updated_at values of the rows a
+# response is built from, or max(updated_at)/count for a collection - so it
+# can be checked before loading and serializing anything. A matching
+# If-None-Match gets an empty 304.
+
+
+def make_etag(*parts):
+    """Stable ETag value from fingerprint parts (ids, timestamps, counts)"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+
+
+def not_modified(etag):
+    """304 response if the client already has this version, else None"""
+    # Weak comparison - compressed responses carry W/ tags (see compression.py)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        return tag_response(response, etag)
+    return None
+
+
+def tag_response(response, etag):
+    """Attach the ETag - private since API responses depend on who asks"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,115 @@
+from extensions import db
+from sqlalchemy import event, inspect
+
+# Commit hooks for in-process indexes and caches
+# Changes are collected at flush time (while old values are still known) and
+# handed to listeners only once the outermost transaction actually commits.
+# A rolled-back savepoint (begin_nested) takes its own changes with it.
+
+_listeners = {}  # model class -> list of callbacks
+
+
+def on_commit(modelClass, callback):
+    """Register callback(changes) to run after commits that touched modelClass
+
+    Each change is a dict with 'action' (insert/update/delete), 'id',
+    'values' (column values after the change) and 'old' (previous values of
+    the columns that changed on update). The session cannot emit SQL at that
+    point, so callbacks that need to read must use their own connection.
+    """
+    _listeners.setdefault(modelClass, []).append(callback)
+
+
+def _column_values(state):
+    values = {}
+    for columnAttr in state.mapper.column_attrs:
+        if columnAttr.key in state.dict:
+            values[columnAttr.key] = state.dict[columnAttr.key]
+    return values
+
+
+def _old_values(state):
+    oldValues = {}
+    for columnAttr in state.mapper.column_attrs:
+        history = state.attrs[columnAttr.key].history
+        if history.deleted:
+            oldValues[columnAttr.key] = history.deleted[0]
+    return oldValues
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_changes(session, flushContext):
+    if not _listeners:
+        return
+
+    pendingChanges = session.info.setdefault('committed_changes', [])
+
+    changeSets = [('insert', session.new), ('update', session.dirty), ('delete', session.deleted)]
+    for action, objects in changeSets:
+        for obj in objects:
+            if type(obj) not in _listeners:
+                continue
+
+            state = inspect(obj)
+            oldValues = {}
+            if action == 'update':
+                oldValues = _old_values(state)
+                if not oldValues:
+                    continue  # Touched but nothing actually changed
+
+            columnValues = _column_values(state)
+            pendingChanges.append({
+                'action': action,
+                'model': type(obj),
+                'id': columnValues.get('id'),
+                'values': columnValues,
+                'old': oldValues
+            })
+
+
+@event.listens_for(db.session, 'after_transaction_create')
+def _mark_savepoint(session, transaction):
+    if transaction.nested:
+        # Remember where this savepoint's changes start, in case it's rolled back
+        savepointMarks = session.info.setdefault('savepoint_marks', {})
+        savepointMarks[transaction] = len(session.info.get('committed_changes', ()))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _dispatch_changes(session):
+    if session.in_nested_transaction():
+        # RELEASE SAVEPOINT - nothing is committed yet, the changes wait for the outer commit
+        session.info.get('savepoint_marks', {}).pop(session.get_nested_transaction(), None)
+        return
+
+    session.info.pop('savepoint_marks', None)
+    pendingChanges = session.info.pop('committed_changes', None)
+    if not pendingChanges:
+        return
+
+    # Group by model so each listener sees one batch per commit
+    changesByModel = {}
+    for change in pendingChanges:
+        changesByModel.setdefault(change['model'], []).append(change)
+
+    for modelClass, changes in changesByModel.items():
+        for callback in _listeners.get(modelClass, []):
+            try:
+                callback(changes)
+            except Exception as e:
+                # Data is already committed, never fail the request over a cache
+                print(f"Error in commit listener {callback.__name__}: {e}")
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_changes(session):
+    if session.in_nested_transaction():
+        # ROLLBACK TO SAVEPOINT - drop only what was flushed inside the savepoint
+        savepointMark = session.info.get('savepoint_marks', {}).pop(session.get_nested_transaction(), None)
+        pendingChanges = session.info.get('committed_changes')
+        if savepointMark is not None and pendingChanges is not None:
+            del pendingChanges[savepointMark:]
+        return
+
+    session.info.pop('committed_changes', None)
+    session.info.pop('savepoint_marks', None)
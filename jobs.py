@@ -0,0 +1,364 @@
+from extensions import db
+from models import Job
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, update, insert, delete, func
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+import click
+import json
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+# Background jobs
+# Durable queue in the jobs table, no broker. A worker claims a job with one
+# UPDATE ... WHERE id = (next runnable) AND status = 'Queued', so any number
+# of threads and processes can share the table - whoever's UPDATE matches a
+# row owns it. A claim is a lease: the owning process renews it while the
+# job runs, and jobs whose lease ran out (process died) are queued again.
+# Failures retry with exponential backoff until max_attempts. Handlers
+# raise ValueError for bad input, which fails the job without retrying.
+
+DEFAULT_MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 10
+BACKOFF_MAX_SECONDS = 3600
+LEASE_SECONDS = 300
+POLL_SECONDS = 1.0
+HOUSEKEEPING_SECONDS = 30
+KEEP_FINISHED_DAYS = 14
+
+_handlers = {}  # name -> (fn, maxAttempts)
+_periodic = {}  # name -> {'name', 'everySeconds', 'dailyAt', 'payload', 'priority'}
+_wake = threading.Event()  # Set on enqueue so idle workers don't wait out the poll
+
+
+def job_handler(name, maxAttempts=DEFAULT_MAX_ATTEMPTS):
+    """Register fn(**payload) as the handler for jobs called name
+
+    The handler runs inside an app context and commits its own work. Its
+    return value (JSON-able) is stored as the job result.
+    """
+    def decorator(fn):
+        _handlers[name] = (fn, maxAttempts)
+        return fn
+    return decorator
+
+
+def periodic(name, everySeconds=None, dailyAt=None, payload=None, priority=0):
+    """Enqueue a registered job every N seconds, or once a day at 'HH:MM' (server local time)
+
+    Each run has a unique key (name + time slot), so with several processes
+    running housekeeping the job is still only queued once per slot. A daily
+    run missed while nothing was running is queued when workers next start.
+    Registering the same name again replaces its schedule.
+    """
+    if (everySeconds is None) == (dailyAt is None):
+        raise ValueError('Give exactly one of everySeconds or dailyAt')
+    _periodic[name] = {'name': name, 'everySeconds': everySeconds,
+                       'dailyAt': datetime.strptime(dailyAt, '%H:%M').time() if dailyAt else None,
+                       'payload': payload or {}, 'priority': priority}
+
+
+def registered_jobs():
+    return sorted(_handlers)
+
+
+def enqueue(name, payload=None, priority=0, delaySeconds=0, createdBy=None, maxAttempts=None, commit=True):
+    """Add a job, returns its id. With commit=False it goes in with the caller's transaction."""
+    if name not in _handlers:
+        raise ValueError(f'Unknown job: {name}')
+
+    newJob = Job(
+        name=name,
+        payload=json.dumps(payload or {}),
+        priority=priority,
+        max_attempts=maxAttempts or _handlers[name][1],
+        run_at=datetime.utcnow() + timedelta(seconds=delaySeconds),
+        created_by=createdBy
+    )
+    db.session.add(newJob)
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
+    _wake.set()
+    return newJob.id
+
+
+def backoff_seconds(attempts):
+    """10s, 20s, 40s ... capped at an hour, +-20% so retries don't line up"""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+# Claiming and finishing - Core statements on their own connections
+
+def claim_next(workerId, leaseSeconds=LEASE_SECONDS):
+    """Claim the most urgent runnable job, returns (token, row) or None"""
+    now = datetime.utcnow()
+    token = f'{workerId}:{uuid.uuid4().hex[:12]}'
+    nextId = (
+        select(Job.id)
+        .where(Job.status == 'Queued', Job.run_at <= now)
+        .order_by(Job.priority.desc(), Job.run_at, Job.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    with db.engine.begin() as conn:
+        claimedCount = conn.execute(
+            update(Job)
+            .where(Job.id == nextId, Job.status == 'Queued')
+            .values(status='Running', locked_by=token, locked_until=now + timedelta(seconds=leaseSeconds),
+                    attempts=Job.attempts + 1, started_at=now)
+        ).rowcount
+        if not claimedCount:
+            return None
+        row = conn.execute(
+            select(Job.id, Job.name, Job.payload, Job.attempts, Job.max_attempts).where(Job.locked_by == token)
+        ).one()
+    return token, row
+
+
+def _finish(token, jobId, **values):
+    """Write the outcome, unless the lease was lost and someone else has the job now"""
+    with db.engine.begin() as conn:
+        conn.execute(
+            update(Job).where(Job.id == jobId, Job.locked_by == token)
+            .values(locked_by=None, locked_until=None, **values)
+        )
+
+
+def run_claimed(token, row):
+    """Run a claimed job's handler and record success, retry or failure"""
+    handler = _handlers.get(row.name)
+    try:
+        if handler is None:
+            raise ValueError(f'No handler registered for {row.name}')
+        result = handler[0](**json.loads(row.payload or '{}'))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        errorText = f'{type(e).__name__}: {e}'
+        print(f"Job {row.id} ({row.name}) attempt {row.attempts} failed: {errorText}")
+        if isinstance(e, ValueError) or row.attempts >= row.max_attempts:
+            _finish(token, row.id, status='Failed', finished_at=datetime.utcnow(),
+                    last_error=errorText + '\n' + traceback.format_exc(limit=5))
+        else:
+            _finish(token, row.id, status='Queued', last_error=errorText,
+                    run_at=datetime.utcnow() + timedelta(seconds=backoff_seconds(row.attempts)))
+        return False
+
+    _finish(token, row.id, status='Done', finished_at=datetime.utcnow(), last_error=None,
+            result=json.dumps(result, default=str))
+    return True
+
+
+def renew_leases(tokens, leaseSeconds=LEASE_SECONDS):
+    if not tokens:
+        return
+    with db.engine.begin() as conn:
+        conn.execute(
+            update(Job).where(Job.locked_by.in_(tokens))
+            .values(locked_until=datetime.utcnow() + timedelta(seconds=leaseSeconds))
+        )
+
+
+def requeue_expired():
+    """Jobs whose worker stopped renewing the lease go back in the queue (or fail when out of attempts)"""
+    now = datetime.utcnow()
+    expired = (Job.status == 'Running', Job.locked_until < now)
+    with db.engine.begin() as conn:
+        requeued = conn.execute(
+            update(Job).where(*expired, Job.attempts < Job.max_attempts)
+            .values(status='Queued', locked_by=None, locked_until=None, run_at=now,
+                    last_error='Lease expired before the job finished')
+        ).rowcount
+        failed = conn.execute(
+            update(Job).where(*expired)
+            .values(status='Failed', locked_by=None, locked_until=None, finished_at=now,
+                    last_error='Lease expired before the job finished, no attempts left')
+        ).rowcount
+    return requeued + failed
+
+
+def _slot_key(spec, now):
+    """Unique key for the current slot of a periodic job, None if today's daily run isn't due yet"""
+    if spec['everySeconds'] is not None:
+        return f"{spec['name']}@{spec['everySeconds']}s:{int(now.timestamp() // spec['everySeconds'])}"
+    if now.time() < spec['dailyAt']:
+        return None
+    return f"{spec['name']}@{now.date().isoformat()}"
+
+
+def enqueue_periodic(lastKeys):
+    """Queue periodic jobs whose slot changed; lastKeys (per process) avoids re-trying every tick"""
+    now = datetime.now()
+    for spec in list(_periodic.values()):
+        slotKey = _slot_key(spec, now)
+        if slotKey is None or lastKeys.get(spec['name']) == slotKey:
+            continue
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(insert(Job).values(
+                    name=spec['name'], payload=json.dumps(spec['payload']), status='Queued',
+                    priority=spec['priority'], attempts=0, max_attempts=_handlers[spec['name']][1],
+                    run_at=datetime.utcnow(), unique_key=slotKey, created_at=datetime.utcnow()
+                ))
+            _wake.set()
+        except IntegrityError:
+            pass  # Another process queued this slot already
+        lastKeys[spec['name']] = slotKey
+
+
+class JobWorkers:
+    """Worker threads plus one housekeeping thread for this process"""
+
+    def __init__(self, flaskApp, workerCount, pollSeconds=POLL_SECONDS, leaseSeconds=LEASE_SECONDS):
+        self.flaskApp = flaskApp
+        self.workerCount = workerCount
+        self.pollSeconds = pollSeconds
+        self.leaseSeconds = leaseSeconds
+        self.workerId = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+        self.threads = []
+        self.running = {}  # token -> job id, leases to renew
+        self.lock = threading.Lock()
+        self.started = False
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        for n in range(self.workerCount):
+            self.threads.append(threading.Thread(target=self._work_loop, name=f'job-worker-{n}', daemon=True))
+        self.threads.append(threading.Thread(target=self._housekeeping_loop, name='job-housekeeping', daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self, timeout=10):
+        self.stopping.set()
+        _wake.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def run_one(self):
+        """Claim and run one job in the current thread, False when nothing was runnable"""
+        with self.flaskApp.app_context():
+            claim = claim_next(self.workerId, self.leaseSeconds)
+            if claim is None:
+                return False
+            token, row = claim
+            with self.lock:
+                self.running[token] = row.id
+            try:
+                run_claimed(token, row)
+            finally:
+                with self.lock:
+                    self.running.pop(token, None)
+        return True
+
+    def _work_loop(self):
+        while not self.stopping.is_set():
+            try:
+                if self.run_one():
+                    continue
+            except Exception as e:
+                print(f"Job worker error: {e}")  # Database busy etc. - try again after the poll
+            _wake.wait(self.pollSeconds)
+            _wake.clear()
+
+    def housekeeping(self, lastKeys):
+        with self.flaskApp.app_context():
+            with self.lock:
+                tokens = list(self.running)
+            renew_leases(tokens, self.leaseSeconds)
+            requeue_expired()
+            enqueue_periodic(lastKeys)
+
+    def _housekeeping_loop(self):
+        lastKeys = {}
+        interval = min(HOUSEKEEPING_SECONDS, self.leaseSeconds / 3)
+        while not self.stopping.is_set():
+            try:
+                self.housekeeping(lastKeys)
+            except Exception as e:
+                print(f"Job housekeeping error: {e}")
+            self.stopping.wait(interval)
+
+
+def init_jobs(flaskApp):
+    """Set up this process's workers, started by the first request
+
+    Starting on the first request rather than right here keeps CLI commands,
+    scripts and the reloader's parent process (which all build the app but
+    never serve) from running jobs. JOB_WORKERS = 0 turns them off, e.g.
+    when a separate `flask run-jobs` process does the work.
+    """
+    flaskApp.cli.add_command(run_jobs_command)
+    workerCount = flaskApp.config.get('JOB_WORKERS', 2)
+    if workerCount <= 0:
+        return None
+
+    workers = JobWorkers(flaskApp, workerCount)
+    flaskApp.extensions['jobs'] = workers
+
+    @flaskApp.before_request
+    def start_job_workers():
+        if not workers.started:
+            workers.start()
+
+    return workers
+
+
+@click.command('run-jobs')
+@click.option('--workers', 'workerCount', default=2, show_default=True, help='Worker threads')
+@click.option('--drain', is_flag=True, help='Run whatever is runnable now, then exit')
+@with_appcontext
+def run_jobs_command(workerCount, drain):
+    """Process background jobs (in addition to, or instead of, the web workers)"""
+    workers = JobWorkers(current_app._get_current_object(), workerCount)
+    if drain:
+        workers.housekeeping({})
+        jobCount = 0
+        while workers.run_one():
+            jobCount += 1
+        click.echo(f'Ran {jobCount} jobs')
+        return
+
+    workers.start()
+    click.echo(f'{workerCount} job workers running as {workers.workerId}, Ctrl+C to stop')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        workers.stop()
+
+
+# Built-in jobs
+
+@job_handler('purge_jobs')
+def purge_jobs(keep_days=KEEP_FINISHED_DAYS, chunk_size=1000):
+    """Delete finished jobs older than keep_days, a chunk per transaction"""
+    cutoff = datetime.utcnow() - timedelta(days=keep_days)
+    deletedCount = 0
+    while True:
+        chunkIds = select(Job.id).where(Job.status.in_(['Done', 'Failed']), Job.finished_at < cutoff).limit(chunk_size)
+        with db.engine.begin() as conn:
+            chunkDeleted = conn.execute(delete(Job).where(Job.id.in_(chunkIds))).rowcount
+        deletedCount += chunkDeleted
+        if chunkDeleted < chunk_size:
+            return {'deleted': deletedCount}
+
+
+periodic('purge_jobs', dailyAt='03:30')
+
+
+def job_counts():
+    """Jobs per status"""
+    return dict(db.session.execute(select(Job.status, func.count(Job.id)).group_by(Job.status)).all())
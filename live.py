@@ -0,0 +1,410 @@
+from extensions import db
+from flask import Response, stream_with_context
+from sqlalchemy import select
+from datetime import datetime
+import json
+import queue
+import threading
+import time
+
+# Live updates over Server-Sent Events
+# A small in-process pub/sub: every connected browser gets a bounded queue
+# on a topic, commit listeners publish into it. Nothing is computed for a
+# topic nobody listens to. Being in-process, a viewer only sees changes
+# committed by the same server process.
+
+HEARTBEAT_SECONDS = 15
+QUEUE_SIZE = 100
+COUNTERS_TTL_SECONDS = 60
+
+
+class Broker:
+    """Topic -> set of subscriber queues"""
+
+    def __init__(self, queueSize=QUEUE_SIZE):
+        self.queueSize = queueSize
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, topic):
+        subscriberQueue = queue.Queue(maxsize=self.queueSize)
+        with self.lock:
+            self.subscribers.setdefault(topic, set()).add(subscriberQueue)
+        return subscriberQueue
+
+    def unsubscribe(self, topic, subscriberQueue):
+        with self.lock:
+            topicQueues = self.subscribers.get(topic)
+            if topicQueues is not None:
+                topicQueues.discard(subscriberQueue)
+                if not topicQueues:
+                    del self.subscribers[topic]
+
+    def has_subscribers(self, topic):
+        with self.lock:
+            return bool(self.subscribers.get(topic))
+
+    def publish(self, topic, eventName, data):
+        with self.lock:
+            topicQueues = list(self.subscribers.get(topic, ()))
+        for subscriberQueue in topicQueues:
+            try:
+                subscriberQueue.put_nowait((eventName, data))
+            except queue.Full:
+                # Client is not keeping up - drop its backlog and make it reload
+                self._reset(subscriberQueue)
+
+    def _reset(self, subscriberQueue):
+        try:
+            while True:
+                subscriberQueue.get_nowait()
+        except queue.Empty:
+            pass
+        subscriberQueue.put_nowait(('resync', {}))
+
+
+broker = Broker()
+
+
+def format_event(eventName, data):
+    return f"event: {eventName}\ndata: {json.dumps(data)}\n\n"
+
+
+def event_stream(topic, initialEvents=None, onHeartbeat=None):
+    """Generator of SSE text for one client, with heartbeats so proxies keep it open
+
+    initialEvents may be a callable, it then runs after subscribing so no
+    update published in between is lost. onHeartbeat is called on every
+    quiet heartbeat (e.g. to pick up other processes' changes).
+    """
+    subscriberQueue = broker.subscribe(topic)
+    try:
+        yield 'retry: 5000\n\n'
+        if callable(initialEvents):
+            initialEvents = initialEvents()
+        for eventName, data in (initialEvents or []):
+            yield format_event(eventName, data)
+        while True:
+            try:
+                eventName, data = subscriberQueue.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                if onHeartbeat is not None:
+                    onHeartbeat()
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(eventName, data)
+    finally:
+        broker.unsubscribe(topic, subscriberQueue)
+
+
+def sse_response(topic, initialEvents=None, onHeartbeat=None):
+    return Response(stream_with_context(event_stream(topic, initialEvents, onHeartbeat)), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Don't let nginx buffer the stream
+    })
+
+
+def doctor_topic(doctorId):
+    return f'doctor:{doctorId}'
+
+
+def _appointment_action(change, previousValues):
+    values = change['values']
+    if change['action'] == 'delete':
+        return 'removed'
+    if change['action'] == 'insert':
+        return 'booked'
+    if 'status' in change['old']:
+        return (values.get('status') or '').lower()
+    if any(key in change['old'] for key in ('appointment_date', 'appointment_time', 'doctor_id')):
+        return 'rescheduled'
+    return 'updated'
+
+
+def _patient_names(patientIds):
+    from models import Patient
+    if not patientIds:
+        return {}
+    # After commit the session can't run SQL, use a separate connection
+    with db.engine.connect() as conn:
+        return dict(conn.execute(select(Patient.id, Patient.full_name).where(Patient.id.in_(patientIds))).all())
+
+
+def _on_appointment_change(changes):
+    """Push changes to today's appointments to the affected doctors' dashboards"""
+    todayDate = datetime.now().date()
+    pending = []  # (topic, payload without patient name, patient_id)
+
+    for change in changes:
+        values = change['values']
+        previousValues = dict(values)
+        previousValues.update(change['old'])
+        action = _appointment_action(change, previousValues)
+
+        isToday = values.get('appointment_date') == todayDate and change['action'] != 'delete'
+        wasToday = previousValues.get('appointment_date') == todayDate
+
+        payload = {
+            'id': change['id'],
+            'action': action,
+            'status': values.get('status'),
+            'date': values['appointment_date'].isoformat() if values.get('appointment_date') else None,
+            'time': values['appointment_time'].strftime('%H:%M') if values.get('appointment_time') else None
+        }
+
+        if isToday:
+            pending.append((doctor_topic(values.get('doctor_id')), payload, values.get('patient_id')))
+        # Moved away from this doctor's today list (other day or other doctor)
+        if wasToday and (not isToday or previousValues.get('doctor_id') != values.get('doctor_id')):
+            pending.append((doctor_topic(previousValues.get('doctor_id')), dict(payload, action='removed'), None))
+
+    pending = [item for item in pending if broker.has_subscribers(item[0])]
+    if not pending:
+        return
+
+    patientNames = _patient_names({patientId for topic, payload, patientId in pending if patientId})
+    for topic, payload, patientId in pending:
+        broker.publish(topic, 'appointment', dict(payload, patient_name=patientNames.get(patientId)))
+
+
+# Admin dashboard counters
+# One producer per process keeps the numbers in memory while at least one
+# admin is watching. Commit listeners update it once per commit and publish
+# only what changed, so the cost doesn't grow with the number of viewers.
+# Other processes' commits never reach these listeners, so the numbers are
+# also reloaded once they're COUNTERS_TTL_SECONDS old - on the next read, or
+# from a viewer's heartbeat while a dashboard is open.
+
+ADMIN_TOPIC = 'admin'
+TOTAL_KEYS = ('total_doctors', 'total_patients', 'total_appointments', 'today_appointments')
+
+
+class AdminCounters:
+    """Dashboard totals and per-department numbers, maintained from commits"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.loadedAt = 0.0
+        self.day = None
+        self.totals = {}
+        self.departments = {}   # department id -> {'name', 'doctor_count', 'today_appointments'}
+        self.doctors = {}       # doctor id -> [user id, department id, is active]
+        self.doctorByUser = {}  # user id -> doctor id
+
+    def _load(self):
+        """Rebuild everything with a handful of aggregate queries"""
+        from models import Doctor, Patient, Appointment, ArchivedAppointment, Department, User
+        from sqlalchemy import func
+
+        todayDate = datetime.now().date()
+        with db.engine.connect() as conn:
+            doctorRows = conn.execute(
+                select(Doctor.id, Doctor.user_id, Doctor.department_id, User.is_active)
+                .join(User, User.id == Doctor.user_id)
+            ).all()
+            activePatients = conn.execute(
+                select(func.count(Patient.id)).join(User, User.id == Patient.user_id).where(User.is_active == True)
+            ).scalar()
+            totalAppointments = conn.execute(select(func.count(Appointment.id))).scalar() + \
+                conn.execute(select(func.count(ArchivedAppointment.id))).scalar()  # Archived ones still count
+            todayByDepartment = dict(conn.execute(
+                select(Doctor.department_id, func.count(Appointment.id))
+                .join(Doctor, Doctor.id == Appointment.doctor_id)
+                .where(Appointment.appointment_date == todayDate)
+                .group_by(Doctor.department_id)
+            ).all())
+            departmentRows = conn.execute(select(Department.id, Department.name).order_by(Department.id)).all()
+
+        self.day = todayDate
+        self.doctors = {doctorId: [userId, departmentId, bool(isActive)]
+                        for doctorId, userId, departmentId, isActive in doctorRows}
+        self.doctorByUser = {info[0]: doctorId for doctorId, info in self.doctors.items()}
+        self.departments = {departmentId: {'name': name, 'doctor_count': 0,
+                                           'today_appointments': todayByDepartment.get(departmentId, 0)}
+                            for departmentId, name in departmentRows}
+        for userId, departmentId, isActive in self.doctors.values():
+            if isActive and departmentId in self.departments:
+                self.departments[departmentId]['doctor_count'] += 1
+
+        self.totals = {
+            'total_doctors': len([info for info in self.doctors.values() if info[2]]),
+            'total_patients': activePatients,
+            'total_appointments': totalAppointments,
+            'today_appointments': sum(todayByDepartment.values())
+        }
+        self.loaded = True
+        self.loadedAt = time.monotonic()
+
+    def _is_stale(self):
+        return (not self.loaded or self.day != datetime.now().date()
+                or time.monotonic() - self.loadedAt > COUNTERS_TTL_SECONDS)
+
+    def _state(self):
+        return {
+            'totals': dict(self.totals),
+            'departments': {departmentId: dict(info) for departmentId, info in self.departments.items()}
+        }
+
+    def invalidate(self):
+        """For bulk changes that skip ORM events - reload on next use"""
+        with self.lock:
+            self.loaded = False
+        if broker.has_subscribers(ADMIN_TOPIC):
+            broker.publish(ADMIN_TOPIC, 'snapshot', self.snapshot())
+
+    def snapshot(self):
+        with self.lock:
+            if self._is_stale():
+                self._load()
+            return self._state()
+
+    def refresh_if_stale(self):
+        """Reload expired numbers and send viewers a snapshot if anything changed"""
+        with self.lock:
+            if not self._is_stale():
+                return
+            before = self._state() if self.loaded else None
+            self._load()
+            state = self._state()
+        if state != before:
+            broker.publish(ADMIN_TOPIC, 'snapshot', state)
+
+    def apply(self, handler, changes):
+        """Run handler on the loaded state, publish the difference once"""
+        with self.lock:
+            if not broker.has_subscribers(ADMIN_TOPIC):
+                self.loaded = False  # Nobody watching, stop tracking until someone is
+                return
+            if self._is_stale():
+                self._load()
+                broker.publish(ADMIN_TOPIC, 'snapshot', self._state())
+                return
+            before = self._state()
+            handler(self, changes)
+            delta = _counter_delta(before, self._state())
+
+        if delta['totals'] or delta['departments']:
+            broker.publish(ADMIN_TOPIC, 'counters', delta)
+
+    # Handlers - called with the lock held
+
+    def _department(self, departmentId):
+        return self.departments.setdefault(departmentId, {'name': '', 'doctor_count': 0, 'today_appointments': 0})
+
+    def _count_appointment(self, values, sign):
+        self.totals['total_appointments'] += sign
+        if values.get('appointment_date') == self.day:
+            self.totals['today_appointments'] += sign
+            doctorInfo = self.doctors.get(values.get('doctor_id'))
+            if doctorInfo is not None:
+                self._department(doctorInfo[1])['today_appointments'] += sign
+
+    def on_appointments(self, changes):
+        for change in changes:
+            values = change['values']
+            previousValues = dict(values)
+            previousValues.update(change['old'])
+            if change['action'] == 'insert':
+                self._count_appointment(values, 1)
+            elif change['action'] == 'delete':
+                self._count_appointment(previousValues, -1)
+            elif 'appointment_date' in change['old'] or 'doctor_id' in change['old']:
+                self._count_appointment(previousValues, -1)
+                self._count_appointment(values, 1)
+
+    def _set_doctor_active(self, doctorId, isActive):
+        doctorInfo = self.doctors[doctorId]
+        if doctorInfo[2] == isActive:
+            return
+        sign = 1 if isActive else -1
+        doctorInfo[2] = isActive
+        self.totals['total_doctors'] += sign
+        self._department(doctorInfo[1])['doctor_count'] += sign
+
+    def on_doctors(self, changes):
+        for change in changes:
+            values = change['values']
+            doctorId = change['id']
+            if change['action'] == 'insert':
+                # New doctor accounts start active
+                self.doctors[doctorId] = [values.get('user_id'), values.get('department_id'), False]
+                self.doctorByUser[values.get('user_id')] = doctorId
+                self._set_doctor_active(doctorId, True)
+            elif change['action'] == 'delete':
+                if doctorId in self.doctors:
+                    self._set_doctor_active(doctorId, False)
+                    del self.doctors[doctorId]
+            elif 'department_id' in change['old'] and doctorId in self.doctors:
+                doctorInfo = self.doctors[doctorId]
+                if doctorInfo[2]:
+                    self._department(doctorInfo[1])['doctor_count'] -= 1
+                    self._department(values['department_id'])['doctor_count'] += 1
+                doctorInfo[1] = values['department_id']
+
+    def on_patients(self, changes):
+        for change in changes:
+            if change['action'] == 'insert':
+                self.totals['total_patients'] += 1
+            elif change['action'] == 'delete':
+                self.totals['total_patients'] -= 1
+
+    def on_users(self, changes):
+        for change in changes:
+            if 'is_active' not in change['old']:
+                continue
+            isActive = bool(change['values'].get('is_active'))
+            role = change['values'].get('role')
+            if role == 'doctor' and change['id'] in self.doctorByUser:
+                self._set_doctor_active(self.doctorByUser[change['id']], isActive)
+            elif role == 'patient':
+                self.totals['total_patients'] += 1 if isActive else -1
+
+
+def _counter_delta(before, after):
+    totalsDelta = {}
+    for key in TOTAL_KEYS:
+        difference = after['totals'][key] - before['totals'][key]
+        if difference:
+            totalsDelta[key] = difference
+
+    departmentsDelta = {}
+    for departmentId, info in after['departments'].items():
+        previousInfo = before['departments'].get(departmentId, {'doctor_count': 0, 'today_appointments': 0})
+        changed = {}
+        for key in ('doctor_count', 'today_appointments'):
+            difference = info[key] - previousInfo[key]
+            if difference:
+                changed[key] = difference
+        if changed:
+            departmentsDelta[departmentId] = changed
+
+    return {'totals': totalsDelta, 'departments': departmentsDelta}
+
+
+adminCounters = AdminCounters()
+
+
+def admin_stream_response():
+    """SSE for admin dashboards - starts with the current numbers, then deltas"""
+    return sse_response(ADMIN_TOPIC, initialEvents=lambda: [('snapshot', adminCounters.snapshot())],
+                        onHeartbeat=adminCounters.refresh_if_stale)
+
+
+def _admin_listener(handlerName):
+    def handle_changes(changes):
+        adminCounters.apply(getattr(AdminCounters, handlerName), changes)
+    handle_changes.__name__ = f'admin_counters_{handlerName}'
+    return handle_changes
+
+
+def register_live_listeners():
+    from events import on_commit
+    from models import Appointment, Doctor, Patient, User, Department
+    on_commit(Appointment, _on_appointment_change)
+    on_commit(Appointment, _admin_listener('on_appointments'))
+    on_commit(Doctor, _admin_listener('on_doctors'))
+    on_commit(Patient, _admin_listener('on_patients'))
+    on_commit(User, _admin_listener('on_users'))
+    # New or renamed departments are rare, just send everyone fresh numbers
+    on_commit(Department, lambda changes: adminCounters.invalidate())
@@ -42,6 +42,7 @@ class Department(db.Model):
     name = db.Column(db.String(100), unique=True, nullable=False)
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     doctors = db.relationship('Doctor', backref='department', lazy=True)
@@ -63,10 +64,13 @@ class Doctor(db.Model):
     experience_years = db.Column(db.Integer)
     consultation_fee = db.Column(db.Float)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     appointments = db.relationship('Appointment', backref='doctor', lazy=True)
     availability = db.relationship('DoctorAvailability', backref='doctor', lazy=True, cascade='all, delete-orphan')
+    availability_templates = db.relationship('AvailabilityTemplate', backref='doctor', lazy=True, cascade='all, delete-orphan')
+    availability_exceptions = db.relationship('AvailabilityException', backref='doctor', lazy=True, cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Doctor {self.full_name}>'
@@ -86,6 +90,7 @@ class Patient(db.Model):
     emergency_contact = db.Column(db.String(15))
     medical_history = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     appointments = db.relationship('Appointment', backref='patient', lazy=True)
@@ -104,10 +109,51 @@ class DoctorAvailability(db.Model):
     end_time = db.Column(db.Time, nullable=False)
     is_available = db.Column(db.Boolean, default=True)
     
+    # One row per doctor per day - bulk generation upserts on this
+    __table_args__ = (
+        db.Index('uq_doctor_availability_doctor_date', 'doctor_id', 'date', unique=True),
+    )
+    
     def __repr__(self):
         return f'<Availability Doctor:{self.doctor_id} Date:{self.date}>'
 
 
+# Recurring weekly hours - expanded on demand instead of one row per day
+class AvailabilityTemplate(db.Model):
+    __tablename__ = 'availability_templates'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False, index=True)
+    weekday = db.Column(db.Integer, nullable=False)  # 0 = Monday ... 6 = Sunday
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AvailabilityTemplate Doctor:{self.doctor_id} Weekday:{self.weekday}>'
+
+
+# One-off date overrides - leave, holidays or special hours
+class AvailabilityException(db.Model):
+    __tablename__ = 'availability_exceptions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    is_available = db.Column(db.Boolean, default=False)  # False = day off, True = custom hours
+    start_time = db.Column(db.Time)
+    end_time = db.Column(db.Time)
+    reason = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_availability_exceptions_doctor_date', 'doctor_id', 'date'),
+    )
+    
+    def __repr__(self):
+        return f'<AvailabilityException Doctor:{self.doctor_id} Date:{self.date}>'
+
+
 class Appointment(db.Model):
     __tablename__ = 'appointments'
     
@@ -116,7 +162,7 @@ class Appointment(db.Model):
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
     appointment_date = db.Column(db.Date, nullable=False)
     appointment_time = db.Column(db.Time, nullable=False)
-    status = db.Column(db.String(20), default='Booked')  # Booked, Completed, Cancelled
+    status = db.Column(db.String(20), default='Booked')  # Booked, Completed, Cancelled, No-Show/Expired (closeout.py)
     reason = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -124,6 +170,18 @@ class Appointment(db.Model):
     # Relationships
     treatment = db.relationship('Treatment', backref='appointment', uselist=False, cascade='all, delete-orphan')
     
+    # Date scans (reminders walk this in (date, id) order - the id comes free with the index),
+    # and status + date for 'Booked' lookups and the nightly close-out.
+    # One 'Booked' appointment per doctor and start time, whatever the in-memory index thinks
+    __table_args__ = (
+        db.Index('ix_appointments_date', 'appointment_date'),
+        db.Index('ix_appointments_status_date', 'status', 'appointment_date'),
+        db.Index('uq_appointments_booked_slot', 'doctor_id', 'appointment_date', 'appointment_time',
+                 unique=True, sqlite_where=db.text("status = 'Booked'"),
+                 postgresql_where=db.text("status = 'Booked'")),
+        {'sqlite_autoincrement': True},  # Ids are never reused once archived (archive.py keeps them)
+    )
+    
     def __repr__(self):
         return f'<Appointment {self.id} - {self.status}>'
 
@@ -140,5 +198,162 @@ class Treatment(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_treatments_follow_up_date', 'follow_up_date'),
+        {'sqlite_autoincrement': True},
+    )
+    
     def __repr__(self):
         return f'<Treatment for Appointment {self.appointment_id}>'
+
+
+class WaitlistEntry(db.Model):
+    __tablename__ = 'waitlist_entries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    earliest_time = db.Column(db.Time)  # Optional window within the day
+    latest_time = db.Column(db.Time)
+    priority = db.Column(db.Integer, default=0)  # Higher goes first, then oldest
+    reason = db.Column(db.Text)
+    status = db.Column(db.String(20), default='Waiting')  # Waiting, Promoted, Cancelled
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'))  # Set when promoted
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    promoted_at = db.Column(db.DateTime)
+    
+    # Relationships
+    patient = db.relationship('Patient', backref=db.backref('waitlist_entries', lazy=True))
+    doctor = db.relationship('Doctor', backref=db.backref('waitlist_entries', lazy=True))
+    appointment = db.relationship('Appointment')
+    
+    # Queue order per doctor - the promotion lookup walks this index
+    __table_args__ = (
+        db.Index('ix_waitlist_queue', 'doctor_id', 'status', 'priority', 'created_at'),
+    )
+    
+    def __repr__(self):
+        return f'<WaitlistEntry Doctor:{self.doctor_id} Patient:{self.patient_id} {self.status}>'
+
+
+# Background work - claimed by worker threads/processes (see jobs.py)
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)  # Registered handler name
+    payload = db.Column(db.Text)  # JSON arguments
+    status = db.Column(db.String(20), nullable=False, default='Queued')  # Queued, Running, Done, Failed
+    priority = db.Column(db.Integer, nullable=False, default=0)  # Higher goes first
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Not before (backoff, scheduling)
+    unique_key = db.Column(db.String(200), unique=True)  # Dedupes periodic runs across processes
+    locked_by = db.Column(db.String(100))  # Claim token of the worker running it
+    locked_until = db.Column(db.DateTime)  # Lease - expired leases are picked up again
+    result = db.Column(db.Text)  # JSON
+    last_error = db.Column(db.Text)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    # Claim order - the claiming UPDATE walks this index
+    __table_args__ = (
+        db.Index('ix_jobs_claim', 'status', 'priority', 'run_at'),
+    )
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
+
+
+# Outbound messages waiting for delivery - the local notification sink (see reminders.py)
+class Notification(db.Model):
+    __tablename__ = 'notifications'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)  # appointment_reminder, follow_up
+    source_id = db.Column(db.Integer, nullable=False)  # Appointment or treatment id
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    recipient_email = db.Column(db.String(120))
+    recipient_phone = db.Column(db.String(15))
+    message = db.Column(db.Text, nullable=False)
+    due_date = db.Column(db.Date, nullable=False)  # Date of the appointment / follow-up
+    status = db.Column(db.String(20), nullable=False, default='Pending')  # Pending, Sent
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    
+    # The scanners' ledger - one notification per appointment/treatment and due date
+    __table_args__ = (
+        db.Index('ix_notifications_status', 'status', 'id'),
+        db.Index('uq_notifications_kind_source_due', 'kind', 'source_id', 'due_date', unique=True),
+    )
+    
+    def __repr__(self):
+        return f'<Notification {self.kind} {self.source_id} {self.status}>'
+
+
+# One nightly close-out of past 'Booked' appointments (see closeout.py)
+class CloseoutRun(db.Model):
+    __tablename__ = 'closeout_runs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cutoff_date = db.Column(db.Date, nullable=False)  # Booked appointments before this date were closed
+    new_status = db.Column(db.String(20), nullable=False)  # No-Show or Expired
+    closed_count = db.Column(db.Integer, nullable=False, default=0)
+    chunk_count = db.Column(db.Integer, nullable=False, default=0)
+    seconds = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<CloseoutRun {self.cutoff_date} {self.closed_count} -> {self.new_status}>'
+
+
+# Cold storage for old finished appointments (see archive.py) - same columns and ids as
+# the hot tables, so templates can render either kind of row
+class ArchivedAppointment(db.Model):
+    __tablename__ = 'appointments_archive'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Id from appointments
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    appointment_date = db.Column(db.Date, nullable=False)
+    appointment_time = db.Column(db.Time, nullable=False)
+    status = db.Column(db.String(20))
+    reason = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    patient = db.relationship('Patient')
+    doctor = db.relationship('Doctor')
+    treatment = db.relationship('ArchivedTreatment', backref='appointment', uselist=False)
+    
+    # History pages read by patient, and by doctor + patient
+    __table_args__ = (
+        db.Index('ix_appointments_archive_patient_date', 'patient_id', 'appointment_date'),
+        db.Index('ix_appointments_archive_doctor_patient', 'doctor_id', 'patient_id'),
+    )
+    
+    def __repr__(self):
+        return f'<ArchivedAppointment {self.id} - {self.status}>'
+
+
+class ArchivedTreatment(db.Model):
+    __tablename__ = 'treatments_archive'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Id from treatments
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments_archive.id'), nullable=False, index=True)
+    diagnosis = db.Column(db.Text, nullable=False)
+    prescription = db.Column(db.Text)
+    notes = db.Column(db.Text)
+    follow_up_date = db.Column(db.Date)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ArchivedTreatment for Appointment {self.appointment_id}>'
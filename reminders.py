@@ -0,0 +1,223 @@
+from extensions import db
+from models import Appointment, Treatment, Patient, Doctor, User, Notification
+from jobs import job_handler, periodic
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, insert, exists, tuple_
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+import click
+import json
+import os
+import time as timer
+
+# Appointment reminders and follow-up notices
+# Each run walks the lead window (today .. today + N days) of its table in
+# (date, id) order through the date index, a batch at a time, skipping rows
+# that already have a notification for (kind, source id, due date). The
+# notifications table is the ledger: every notification is recorded there,
+# unique on that key, in the same transaction that hands the batch to the
+# sink. An appointment moved into the window (or a follow-up date that was
+# edited) has a new due date, so it is picked up by the next run, and
+# overlapping runs (job + CLI) can't record the same notification twice -
+# the loser's batch rolls back and is scanned again.
+
+BATCH_SIZE = 1000
+MAX_BATCH_RETRIES = 3
+
+
+# Sinks - where notifications go
+
+class OutboxSink:
+    """The ledger rows themselves, left Pending for delivery (exactly once)"""
+    recordStatus = 'Pending'
+
+    def write(self, conn, notifications):
+        pass  # Already in the notifications table
+
+
+class FileSink:
+    """JSON lines appended to a file. Written before the ledger commits, so at least once."""
+    recordStatus = 'Sent'
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, conn, notifications):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as outFile:
+            for notification in notifications:
+                outFile.write(json.dumps(notification, default=str) + '\n')
+
+
+SINKS = {
+    'outbox': lambda config: OutboxSink(),
+    'file': lambda config: FileSink(config['NOTIFICATION_FILE']),
+}
+
+
+def register_sink(name, factory):
+    """Add a sink type: factory(app config) -> object with write(conn, notifications)
+
+    The sink's recordStatus (default 'Sent') is the status its notifications
+    get in the ledger.
+    """
+    SINKS[name] = factory
+
+
+def make_sink(config):
+    sinkName = config.get('NOTIFICATION_SINK', 'outbox')
+    if sinkName not in SINKS:
+        raise ValueError(f"Unknown NOTIFICATION_SINK {sinkName!r}, available: {', '.join(SINKS)}")
+    return SINKS[sinkName](config)
+
+
+# Scanners - what is due, as notification dicts
+
+def _not_notified(kind, sourceId, dueDate):
+    return ~exists().where(Notification.kind == kind, Notification.source_id == sourceId,
+                           Notification.due_date == dueDate)
+
+
+def _reminder_batch(todayDate, horizon, after, limit):
+    query = (
+        select(Appointment.id, Appointment.appointment_date, Appointment.appointment_time, Appointment.patient_id,
+               Patient.phone, User.email, Doctor.full_name.label('doctor_name'))
+        .join(Patient, Patient.id == Appointment.patient_id)
+        .join(User, User.id == Patient.user_id)
+        .join(Doctor, Doctor.id == Appointment.doctor_id)
+        .where(Appointment.appointment_date >= todayDate,
+               Appointment.appointment_date <= horizon,
+               Appointment.status == 'Booked',
+               _not_notified('appointment_reminder', Appointment.id, Appointment.appointment_date))
+        .order_by(Appointment.appointment_date, Appointment.id)
+        .limit(limit)
+    )
+    if after is not None:
+        query = query.where(tuple_(Appointment.appointment_date, Appointment.id) > after)
+    return [((row.appointment_date, row.id), {
+        'kind': 'appointment_reminder',
+        'source_id': row.id,
+        'patient_id': row.patient_id,
+        'recipient_email': row.email,
+        'recipient_phone': row.phone,
+        'message': f"Reminder: your appointment with Dr. {row.doctor_name} is on "
+                   f"{row.appointment_date.strftime('%d %b %Y')} at {row.appointment_time.strftime('%I:%M %p')}.",
+        'due_date': row.appointment_date
+    }) for row in db.session.execute(query)]
+
+
+def _follow_up_batch(todayDate, horizon, after, limit):
+    query = (
+        select(Treatment.id, Treatment.follow_up_date, Appointment.patient_id,
+               Patient.phone, User.email, Doctor.full_name.label('doctor_name'))
+        .join(Appointment, Appointment.id == Treatment.appointment_id)
+        .join(Patient, Patient.id == Appointment.patient_id)
+        .join(User, User.id == Patient.user_id)
+        .join(Doctor, Doctor.id == Appointment.doctor_id)
+        .where(Treatment.follow_up_date >= todayDate,
+               Treatment.follow_up_date <= horizon,
+               _not_notified('follow_up', Treatment.id, Treatment.follow_up_date))
+        .order_by(Treatment.follow_up_date, Treatment.id)
+        .limit(limit)
+    )
+    if after is not None:
+        query = query.where(tuple_(Treatment.follow_up_date, Treatment.id) > after)
+    return [((row.follow_up_date, row.id), {
+        'kind': 'follow_up',
+        'source_id': row.id,
+        'patient_id': row.patient_id,
+        'recipient_email': row.email,
+        'recipient_phone': row.phone,
+        'message': f"Dr. {row.doctor_name} asked to see you again around "
+                   f"{row.follow_up_date.strftime('%d %b %Y')}. Please book a follow-up appointment.",
+        'due_date': row.follow_up_date
+    }) for row in db.session.execute(query)]
+
+
+SCANNERS = {
+    'appointment_reminders': (_reminder_batch, 'REMINDER_LEAD_DAYS'),
+    'follow_ups': (_follow_up_batch, 'FOLLOW_UP_LEAD_DAYS'),
+}
+
+
+def run_scanner(name, sink, leadDays, todayDate=None, batchSize=BATCH_SIZE):
+    """Send everything due for one scanner, returns (notification count, batch count)"""
+    scanBatch = SCANNERS[name][0]
+    todayDate = todayDate or datetime.now().date()
+    horizon = todayDate + timedelta(days=leadDays)
+    recordStatus = getattr(sink, 'recordStatus', 'Sent')
+    after = None  # (date, id) of the last row handled in this run
+    sentCount = 0
+    batchCount = 0
+    retries = 0
+
+    while True:
+        batch = scanBatch(todayDate, horizon, after, batchSize)
+        db.session.rollback()  # Don't hold the read transaction between batches
+        if not batch:
+            break
+
+        notifications = [notification for position, notification in batch]
+        recordedAt = datetime.utcnow()
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(insert(Notification), [
+                    dict(notification, status=recordStatus, created_at=recordedAt,
+                         sent_at=recordedAt if recordStatus == 'Sent' else None)
+                    for notification in notifications
+                ])
+                sink.write(conn, notifications)
+        except IntegrityError:
+            # Another run recorded some of these meanwhile - scan the same range again
+            retries += 1
+            if retries > MAX_BATCH_RETRIES:
+                print(f"{name}: batch keeps colliding with another run, stopping")
+                break
+            continue
+
+        retries = 0
+        after = batch[-1][0]
+        sentCount += len(batch)
+        batchCount += 1
+        if len(batch) < batchSize:
+            break
+
+    return sentCount, batchCount
+
+
+def send_due_notifications(todayDate=None, batchSize=BATCH_SIZE):
+    """Run every scanner with the app's sink and lead times, returns a summary dict"""
+    config = current_app.config
+    sink = make_sink(config)
+    startedAt = timer.perf_counter()
+    summary = {}
+    for name, (scanBatch, leadConfigKey) in SCANNERS.items():
+        sentCount, batchCount = run_scanner(name, sink, config[leadConfigKey], todayDate, batchSize)
+        summary[name] = {'sent': sentCount, 'batches': batchCount}
+    summary['seconds'] = round(timer.perf_counter() - startedAt, 3)
+    return summary
+
+
+@job_handler('send_reminders', maxAttempts=3)
+def send_reminders_job(batch_size=BATCH_SIZE):
+    return send_due_notifications(batchSize=batch_size)
+
+
+def init_reminders(flaskApp):
+    """Schedule the reminder job and add `flask send-reminders`"""
+    flaskApp.cli.add_command(send_reminders_command)
+    periodic('send_reminders', everySeconds=flaskApp.config['REMINDER_INTERVAL_SECONDS'])
+
+
+@click.command('send-reminders')
+@click.option('--today', 'todayText', default=None, help='Pretend today is this date (YYYY-MM-DD)')
+@click.option('--batch-size', 'batchSize', default=BATCH_SIZE, show_default=True)
+@with_appcontext
+def send_reminders_command(todayText, batchSize):
+    """Queue appointment reminders and follow-up notices that are due"""
+    todayDate = datetime.strptime(todayText, '%Y-%m-%d').date() if todayText else None
+    summary = send_due_notifications(todayDate, batchSize)
+    for name in SCANNERS:
+        click.echo(f"{name}: {summary[name]['sent']} notifications in {summary[name]['batches']} batches")
+    click.echo(f"Done in {summary['seconds']}s")
@@ -0,0 +1,217 @@
+from extensions import db
+from models import Doctor, User, Appointment, AvailabilityException
+from scheduling import free_slots, scheduleIndex, recheck_bookings, slot_minutes_setting, to_minutes
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from datetime import datetime, timedelta
+from bisect import bisect_left
+
+# Bulk rescheduling when a doctor is unavailable
+# Free slots for the doctor and their department colleagues are computed
+# once from the schedule index, then handed out by a small allocator:
+# per-doctor sorted slot lists, a bisect to find the first slot at or after
+# the original time, and removal once a slot is taken. Slots that overlap
+# another booking of the same patient are passed over.
+
+DEFAULT_SEARCH_DAYS = 14
+
+
+class SlotAllocator:
+    """Hands out free (date, time) slots per doctor, each slot at most once"""
+
+    def __init__(self, slotsByDoctor, patientBookings=None, slotMinutes=None):
+        self.slots = {}  # doctor_id -> sorted list of (date, time)
+        for doctorId, slotsByDay in slotsByDoctor.items():
+            self.slots[doctorId] = [(day, slot) for day in sorted(slotsByDay) for slot in slotsByDay[day]]
+        self.patientBookings = patientBookings or {}  # patient_id -> [(appointment_id, date, start minute), ...]
+        self.slotMinutes = slotMinutes or 0
+
+    def patient_clash(self, patientId, appointmentId, day, slotTime):
+        """True if the patient has another booking overlapping this slot"""
+        startMinute = to_minutes(slotTime)
+        for otherId, otherDay, otherStart in self.patientBookings.get(patientId, []):
+            if otherId != appointmentId and otherDay == day and abs(startMinute - otherStart) < self.slotMinutes:
+                return True
+        return False
+
+    def _book(self, patientId, appointmentId, day, slotTime):
+        # The original slot stays listed too, in case the move is dropped later
+        if patientId is not None:
+            self.patientBookings.setdefault(patientId, []).append((appointmentId, day, to_minutes(slotTime)))
+
+    def take_exact(self, doctorIds, day, slotTime, patientId=None, appointmentId=None):
+        """Same date and time with the first doctor in doctorIds that has it free"""
+        if self.patient_clash(patientId, appointmentId, day, slotTime):
+            return None
+        for doctorId in doctorIds:
+            doctorSlots = self.slots.get(doctorId, [])
+            position = bisect_left(doctorSlots, (day, slotTime))
+            if position < len(doctorSlots) and doctorSlots[position] == (day, slotTime):
+                del doctorSlots[position]
+                self._book(patientId, appointmentId, day, slotTime)
+                return doctorId, day, slotTime
+        return None
+
+    def take_earliest(self, doctorIds, notBefore, patientId=None, appointmentId=None):
+        """Earliest free slot at or after notBefore (date, time) across doctorIds"""
+        best = None
+        for doctorId in doctorIds:
+            doctorSlots = self.slots.get(doctorId, [])
+            position = bisect_left(doctorSlots, notBefore)
+            while position < len(doctorSlots) and self.patient_clash(patientId, appointmentId, *doctorSlots[position]):
+                position += 1
+            if position < len(doctorSlots) and (best is None or doctorSlots[position] < best[0]):
+                best = (doctorSlots[position], doctorId, position)
+        if best is None:
+            return None
+        (day, slotTime), doctorId, position = best
+        del self.slots[doctorId][position]
+        self._book(patientId, appointmentId, day, slotTime)
+        return doctorId, day, slotTime
+
+
+def plan_reschedule(doctorId, startDate, endDate, searchDays=DEFAULT_SEARCH_DAYS, allowOtherDoctors=True):
+    """Work out new slots for a doctor's booked appointments in a date range
+
+    Each appointment first tries the same date and time with a colleague
+    from the same department, then the earliest free slot from the original
+    time onwards - with the same doctor outside the range or a colleague.
+    Slots overlapping another booking of the same patient are skipped.
+    Returns a list of move dicts; 'new_*' keys are None when nothing fits.
+    """
+    doctor = Doctor.query.get(doctorId)
+    if doctor is None:
+        raise ValueError('Doctor not found.')
+    if endDate < startDate:
+        raise ValueError('End date must be on or after the start date.')
+
+    # All affected appointments in one query
+    affectedAppointments = Appointment.query.options(joinedload(Appointment.patient)).filter(
+        Appointment.doctor_id == doctorId,
+        Appointment.appointment_date >= startDate,
+        Appointment.appointment_date <= endDate,
+        Appointment.status == 'Booked'
+    ).order_by(Appointment.appointment_date, Appointment.appointment_time).all()
+    if not affectedAppointments:
+        return []
+
+    colleagueIds = []
+    if allowOtherDoctors:
+        colleagueIds = list(db.session.execute(
+            select(Doctor.id).join(User, User.id == Doctor.user_id).where(
+                Doctor.department_id == doctor.department_id,
+                Doctor.id != doctorId,
+                User.is_active == True
+            ).order_by(Doctor.id)
+        ).scalars())
+
+    searchStart = max(startDate, datetime.now().date())
+    searchEnd = endDate + timedelta(days=searchDays)
+    slotsByDoctor = free_slots([doctorId] + colleagueIds, searchStart, searchEnd)
+
+    # The doctor is off for the whole range, only later days count for them
+    slotsByDoctor[doctorId] = {day: slots for day, slots in slotsByDoctor[doctorId].items() if day > endDate}
+
+    # Every booking the affected patients hold in the search window, with any doctor
+    patientBookings = {}
+    for appointmentId, patientId, day, appointmentTime in db.session.execute(
+        select(Appointment.id, Appointment.patient_id, Appointment.appointment_date, Appointment.appointment_time)
+        .where(
+            Appointment.patient_id.in_({appointment.patient_id for appointment in affectedAppointments}),
+            Appointment.appointment_date >= min(startDate, searchStart),
+            Appointment.appointment_date <= searchEnd,
+            Appointment.status == 'Booked'
+        )
+    ):
+        patientBookings.setdefault(patientId, []).append((appointmentId, day, to_minutes(appointmentTime)))
+    allocator = SlotAllocator(slotsByDoctor, patientBookings, slot_minutes_setting())
+
+    moves = []
+    for appointment in affectedAppointments:
+        originalSlot = (appointment.appointment_date, appointment.appointment_time)
+        patientKeys = (appointment.patient_id, appointment.id)
+        placement = allocator.take_exact(colleagueIds, *originalSlot, *patientKeys)
+        if placement is None:
+            placement = allocator.take_earliest([doctorId] + colleagueIds, originalSlot, *patientKeys)
+
+        newDoctorId, newDate, newTime = placement if placement else (None, None, None)
+        moves.append({
+            'appointment': appointment,
+            'old_doctor_id': appointment.doctor_id,
+            'old_date': appointment.appointment_date,
+            'old_time': appointment.appointment_time,
+            'new_doctor_id': newDoctorId,
+            'new_date': newDate,
+            'new_time': newTime
+        })
+    return moves
+
+
+def apply_reschedule(doctorId, startDate, endDate, searchDays=DEFAULT_SEARCH_DAYS, allowOtherDoctors=True,
+                     markUnavailable=True, reason=None):
+    """Plan and apply the moves in one transaction, returns the moves
+
+    With markUnavailable the doctor also gets day-off exceptions for the
+    range in the same commit, so nothing new is booked there afterwards.
+    Appointments without a replacement are left untouched.
+    """
+    moves = plan_reschedule(doctorId, startDate, endDate, searchDays, allowOtherDoctors)
+
+    # The plan comes from the schedule index - a slot the database says is taken stays unplaced
+    placedMoves = [move for move in moves if move['new_date'] is not None]
+    dbProblems = recheck_bookings([(move['new_doctor_id'], move['new_date'], move['new_time']) for move in placedMoves])
+    for move, problem in zip(placedMoves, dbProblems):
+        if problem is not None:
+            move['new_doctor_id'] = move['new_date'] = move['new_time'] = None
+
+    try:
+        for move in moves:
+            if move['new_date'] is None:
+                continue
+            appointment = move['appointment']
+            appointment.doctor_id = move['new_doctor_id']
+            appointment.appointment_date = move['new_date']
+            appointment.appointment_time = move['new_time']
+
+        if markUnavailable:
+            AvailabilityException.query.filter(
+                AvailabilityException.doctor_id == doctorId,
+                AvailabilityException.date >= startDate,
+                AvailabilityException.date <= endDate
+            ).delete()
+            for i in range((endDate - startDate).days + 1):
+                db.session.add(AvailabilityException(
+                    doctor_id=doctorId,
+                    date=startDate + timedelta(days=i),
+                    is_available=False,
+                    reason=reason or 'Unavailable'
+                ))
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if markUnavailable:
+        # Bulk delete above skips ORM events
+        scheduleIndex.invalidate(doctorId)
+
+    return moves
+
+
+def describe_move(move, doctorNames):
+    """JSON friendly view of a move, doctorNames maps doctor id -> name"""
+    appointment = move['appointment']
+    return {
+        'appointment_id': appointment.id,
+        'patient_id': appointment.patient_id,
+        'patient_name': appointment.patient.full_name,
+        'old_doctor_id': move['old_doctor_id'],
+        'old_date': move['old_date'].isoformat(),
+        'old_time': move['old_time'].strftime('%H:%M'),
+        'new_doctor_id': move['new_doctor_id'],
+        'new_doctor_name': doctorNames.get(move['new_doctor_id']),
+        'new_date': move['new_date'].isoformat() if move['new_date'] else None,
+        'new_time': move['new_time'].strftime('%H:%M') if move['new_time'] else None,
+        'placed': move['new_date'] is not None
+    }
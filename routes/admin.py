@@ -5,6 +5,15 @@ from models import User, Doctor, Patient, Appointment, Treatment, Department, Do
 from utils import admin_required
 from datetime import datetime, timedelta
 from sqlalchemy import or_, func
+from search import apply_search
+from bulk_availability import check_range
+from jobs import enqueue
+from rescheduling import plan_reschedule, apply_reschedule
+from waitlist import cancel_and_promote
+from live import admin_stream_response
+from dashboards import admin_dashboard_data
+from coalescing import coalesce
+from archive import appointment_history
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -13,64 +22,25 @@ admin_bp = Blueprint('admin', __name__)
 @login_required
 @admin_required
 def dashboard():
-    # This part is tricky!
-    activeDoctorsCount = 0
-    allDoctors = Doctor.query.join(User).all()
-    for doc in allDoctors:
-        if doc.user.is_active == True:
-            activeDoctorsCount = activeDoctorsCount + 1
-    
-    # Count active patients
-    activePatientsCount = 0
-    allPatients = Patient.query.join(User).all()
-    for pat in allPatients:
-        if pat.user.is_active == True:
-            activePatientsCount = activePatientsCount + 1
-    
-    totalAppointments = Appointment.query.count()
-    
-    # Get today's appointments - debugging is important here !!!!
-    currentDate = datetime.now().date()
-    todayAppointments = Appointment.query.filter_by(appointment_date=currentDate).count()
-    
-    # Get upcoming appointments
-    upcomingBookings = Appointment.query.filter(
-        Appointment.appointment_date >= currentDate,
-        Appointment.status == 'Booked'
-    ).order_by(Appointment.appointment_date, Appointment.appointment_time).limit(10).all()
-    
-    # Get recent patients - using dict for better organization
-    recentPatientsList = Patient.query.order_by(Patient.created_at.desc()).limit(5).all()
-    
-    # Department statistics - more human approach
-    allDepartments = Department.query.all()
-    departmentStats = []
-    
-    # Loop through each department
-    for currentDept in allDepartments:
-        deptId = currentDept.id
-        # Count doctors in this department
-        doctorCount = 0
-        deptDoctors = Doctor.query.filter_by(department_id=deptId).all()
-        for doctor in deptDoctors:
-            if doctor.user.is_active:
-                doctorCount += 1
-        
-        # Store stats
-        deptInfo = {
-            'name': currentDept.name,
-            'doctor_count': doctorCount
-        }
-        departmentStats.append(deptInfo)
-    
-    return render_template('admin/dashboard.html',
-                        total_doctors=activeDoctorsCount,
-                        total_patients=activePatientsCount,
-                        total_appointments=totalAppointments,
-                        today_appointments=todayAppointments,
-                        upcoming_appointments=upcomingBookings,
-                        recent_patients=recentPatientsList,
-                        dept_stats=departmentStats)
+    # Just the shell - the page fetches dashboard_data right after
+    return render_template('admin/dashboard.html')
+
+
+@admin_bp.route('/dashboard/data')
+@login_required
+@admin_required
+@coalesce(scope='role')
+def dashboard_data():
+    """Counters, upcoming appointments and recent patients in one JSON response"""
+    return jsonify(dict(admin_dashboard_data(), success=True))
+
+
+@admin_bp.route('/dashboard/stream')
+@login_required
+@admin_required
+def dashboard_stream():
+    """Server-Sent Events with counter updates for the dashboard"""
+    return admin_stream_response()
 
 
 @admin_bp.route('/doctors')
@@ -93,14 +63,8 @@ def doctors():
     
     # Apply search filter if provided
     if searchQuery:
-        # Search in name or specialization
-        searchPattern = f'%{searchQuery}%'
-        baseQuery = baseQuery.filter(
-            or_(
-                Doctor.full_name.ilike(searchPattern),
-                Doctor.specialization.ilike(searchPattern)
-            )
-        )
+        # Search in name, specialization or phone (best matches first)
+        baseQuery = apply_search(baseQuery, Doctor, searchQuery)
     
     # Apply department filter if selected
     # This part is tricky!
@@ -302,13 +266,9 @@ def patients():
     # 'all' shows both active and inactive
     
     if search_query:
-        query = query.filter(
-            or_(
-                Patient.full_name.ilike(f'%{search_query}%'),
-                Patient.phone.ilike(f'%{search_query}%'),
-                Patient.id == int(search_query) if search_query.isdigit() else False
-            )
-        )
+        # Exact patient ID matches are kept alongside the text matches
+        idCriteria = [Patient.id == int(search_query)] if search_query.isdigit() else []
+        query = apply_search(query, Patient, search_query, idCriteria)
     
     patients = query.all()
     
@@ -431,9 +391,7 @@ def appointments():
 @admin_required
 def view_patient(patient_id):
     patient = Patient.query.get_or_404(patient_id)
-    appointments = Appointment.query.filter_by(patient_id=patient_id).order_by(
-        Appointment.appointment_date.desc()
-    ).all()
+    appointments = appointment_history(patientId=patient_id)
     
     return render_template('admin/view_patient.html', patient=patient, appointments=appointments)
 
@@ -450,6 +408,54 @@ def view_doctor(doctor_id):
     return render_template('admin/view_doctor.html', doctor=doctor, appointments=appointments)
 
 
+@admin_bp.route('/doctor/<int:doctor_id>/reschedule', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def reschedule_doctor(doctor_id):
+    doctor = Doctor.query.get_or_404(doctor_id)
+    moves = None
+    applied = False
+    
+    if request.method == 'POST':
+        try:
+            startDate = datetime.strptime(request.form.get('start_date', ''), '%Y-%m-%d').date()
+            endDate = datetime.strptime(request.form.get('end_date', ''), '%Y-%m-%d').date()
+        except ValueError:
+            flash('Invalid date format.', 'danger')
+            startDate = None
+        
+        allowOtherDoctors = request.form.get('allow_other_doctors') == 'on'
+        
+        if startDate is not None:
+            try:
+                if request.form.get('action') == 'apply':
+                    moves = apply_reschedule(
+                        doctor.id, startDate, endDate,
+                        allowOtherDoctors=allowOtherDoctors,
+                        markUnavailable=request.form.get('mark_unavailable') == 'on',
+                        reason=request.form.get('reason', '').strip() or None
+                    )
+                    applied = True
+                    movedCount = len([move for move in moves if move['new_date'] is not None])
+                    flash(f'Rescheduled {movedCount} of {len(moves)} appointments.', 'success')
+                else:
+                    moves = plan_reschedule(doctor.id, startDate, endDate, allowOtherDoctors=allowOtherDoctors)
+            except ValueError as e:
+                flash(str(e), 'danger')
+            except Exception as e:
+                db.session.rollback()
+                flash('An error occurred while rescheduling appointments.', 'danger')
+                print(f"Error rescheduling appointments: {e}")
+    
+    doctorNames = {doc.id: doc.full_name for doc in Doctor.query.filter_by(department_id=doctor.department_id).all()}
+    
+    return render_template('admin/reschedule_doctor.html',
+                         doctor=doctor,
+                         moves=moves,
+                         applied=applied,
+                         doctor_names=doctorNames)
+
+
 @admin_bp.route('/appointment/<int:appointment_id>')
 @login_required
 @admin_required
@@ -469,9 +475,11 @@ def cancel_appointment(appointment_id):
         return redirect(url_for('admin.appointments'))
     
     try:
-        appointment.status = 'Cancelled'
+        promotedEntry = cancel_and_promote(appointment)
         db.session.commit()
         flash('Appointment cancelled successfully.', 'success')
+        if promotedEntry is not None:
+            flash(f'The slot was given to {promotedEntry.patient.full_name} from the waitlist.', 'info')
     except Exception as e:
         db.session.rollback()
         flash('An error occurred while cancelling the appointment.', 'danger')
@@ -515,3 +523,58 @@ def reset_password(user_type, user_id):
         print(f"Error resetting password: {e}")
     
     return redirect(request.referrer or url_for('admin.dashboard'))
+
+
+@admin_bp.route('/schedules/generate', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def generate_schedules():
+    allDepartments = Department.query.all()
+    activeDoctors = Doctor.query.join(User).filter(User.is_active == True).order_by(Doctor.full_name).all()
+    
+    if request.method == 'POST':
+        try:
+            startDate = datetime.strptime(request.form.get('start_date', ''), '%Y-%m-%d').date()
+            endDate = datetime.strptime(request.form.get('end_date', ''), '%Y-%m-%d').date()
+            startTime = datetime.strptime(request.form.get('start_time', '09:00'), '%H:%M').time()
+            endTime = datetime.strptime(request.form.get('end_time', '17:00'), '%H:%M').time()
+            
+            departmentIds = [int(value) for value in request.form.getlist('department_ids')]
+            doctorIds = [int(value) for value in request.form.getlist('doctor_ids')]
+            weekdays = {int(value) for value in request.form.getlist('weekdays')}
+        except ValueError:
+            flash('Invalid date or time format.', 'danger')
+            weekdays = None
+        
+        if weekdays is not None and not weekdays:
+            flash('Select at least one weekday.', 'danger')
+        elif weekdays:
+            try:
+                check_range(startDate, endDate, startTime, endTime)
+                # Big ranges take a while - a background job writes them, the page polls its status
+                jobId = enqueue('generate_availability', {
+                    'start_date': startDate.isoformat(),
+                    'end_date': endDate.isoformat(),
+                    'start_time': startTime.strftime('%H:%M'),
+                    'end_time': endTime.strftime('%H:%M'),
+                    'department_ids': departmentIds,
+                    'doctor_ids': doctorIds,
+                    'weekdays': sorted(weekdays),
+                    'is_available': request.form.get('mark_unavailable') != 'on'
+                }, priority=5, createdBy=current_user.id)
+                flash(f'Schedule generation queued (job #{jobId}).', 'success')
+                return redirect(url_for('admin.generate_schedules', job=jobId))
+            except ValueError as e:
+                flash(str(e), 'danger')
+            except Exception as e:
+                db.session.rollback()
+                flash('An error occurred while queueing schedule generation.', 'danger')
+                print(f"Error queueing schedule generation: {e}")
+    
+    today = datetime.now().date()
+    return render_template('admin/generate_schedules.html',
+                         departments=allDepartments,
+                         doctors=activeDoctors,
+                         job_id=request.args.get('job', type=int),
+                         default_start=today,
+                         default_end=today + timedelta(weeks=13) - timedelta(days=1))
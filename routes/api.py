@@ -1,72 +1,223 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app, abort
 from flask_login import login_required, current_user
 from extensions import db
-from models import Doctor, Patient, Appointment, Department, User
-from datetime import datetime
-from sqlalchemy import or_
+from models import Doctor, Patient, Appointment, Department, User, Treatment, Job
+from datetime import datetime, timedelta
+from search import apply_search, autocompleteIndexes
+from scheduling import free_slots, earliest_slots, booking_problem, batch_booking_problems, recheck_booking, \
+    recheck_bookings, occupancy, pick_department_slot, department_doctor_ids
+from rescheduling import plan_reschedule, apply_reschedule, describe_move, DEFAULT_SEARCH_DAYS
+from waitlist import cancel_and_promote
+from coalescing import coalesce, singleFlight
+from etags import make_etag, not_modified, tag_response
+from jobs import enqueue, registered_jobs, job_counts
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from serializers import DOCTOR_SUMMARY, DOCTOR_DETAIL, PATIENT_SUMMARY, PATIENT_DETAIL, APPOINTMENT_SUMMARY, APPOINTMENT_DETAIL, \
+    APPOINTMENT_CREATED, TREATMENT_DETAIL, JOB_DETAIL, sparse
 
 api_bp = Blueprint('api', __name__)
 
+# Messages for the reasons returned by booking_problem
+BOOKING_MESSAGES = {
+    'unavailable': 'Doctor is not available on the selected date',
+    'outside_hours': 'Time is outside the doctor\'s available hours',
+    'conflict': 'Time slot already booked'
+}
+
+MAX_MULTI_GET = 100
+
+
+def requested_ids():
+    """?ids=1,2,3 as a list of unique ints in request order (ValueError if malformed)"""
+    idsParam = request.args.get('ids', '').strip()
+    if not idsParam:
+        raise ValueError('ids parameter is required, e.g. ids=1,2,3')
+    
+    ids = []
+    for part in idsParam.split(','):
+        part = part.strip()
+        if not part.isdigit():
+            raise ValueError(f'Invalid id: {part!r}')
+        if int(part) not in ids:
+            ids.append(int(part))
+    
+    if len(ids) > MAX_MULTI_GET:
+        raise ValueError(f'At most {MAX_MULTI_GET} ids per request')
+    return ids
+
+
+def multi_get_results(ids, found, forbiddenIds, key):
+    """One entry per requested id, in request order, with per-id errors"""
+    results = []
+    for requestedId in ids:
+        if requestedId in found:
+            results.append({'id': requestedId, 'success': True, key: found[requestedId]})
+        elif requestedId in forbiddenIds:
+            results.append({'id': requestedId, 'success': False, 'error': 'forbidden', 'message': 'Unauthorized'})
+        else:
+            results.append({'id': requestedId, 'success': False, 'error': 'not_found', 'message': 'Not found'})
+    return results
+
 
 # Doctors API
 @api_bp.route('/doctors', methods=['GET'])
 @login_required
+@coalesce(scope='role')
 def get_doctors():
-    """Get all doctors with optional filtering"""
+    """Get all doctors with optional filtering, ?fields= for a subset of the fields"""
     search = request.args.get('search', '').strip()
     department_id = request.args.get('department_id', type=int)
     
-    query = Doctor.query.join(User).filter(User.is_active == True)
+    try:
+        serializer = sparse(DOCTOR_SUMMARY, request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    query = serializer.select().where(User.is_active == True)
     
     if search:
-        query = query.filter(
-            or_(
-                Doctor.full_name.ilike(f'%{search}%'),
-                Doctor.specialization.ilike(f'%{search}%')
-            )
-        )
+        query = apply_search(query, Doctor, search)
     
     if department_id:
-        query = query.filter(Doctor.department_id == department_id)
+        query = query.where(Doctor.department_id == department_id)
     
-    doctors = query.all()
+    doctors = serializer.all(query)
     
     return jsonify({
         'success': True,
         'count': len(doctors),
-        'doctors': [{
-            'id': doc.id,
-            'full_name': doc.full_name,
-            'specialization': doc.specialization,
-            'department': doc.department.name,
-            'phone': doc.phone,
-            'qualification': doc.qualification,
-            'experience_years': doc.experience_years,
-            'consultation_fee': doc.consultation_fee
-        } for doc in doctors]
+        'doctors': doctors
     })
 
 
 @api_bp.route('/doctors/<int:doctor_id>', methods=['GET'])
 @login_required
+@coalesce(scope='role')
 def get_doctor(doctor_id):
     """Get a specific doctor by ID"""
+    # Fingerprint first - a matching If-None-Match skips loading the doctor
+    fingerprint = db.session.execute(
+        db.select(Doctor.updated_at, Department.updated_at, User.email)
+        .join(Department, Department.id == Doctor.department_id)
+        .join(User, User.id == Doctor.user_id)
+        .where(Doctor.id == doctor_id)
+    ).first()
+    if fingerprint is None:
+        abort(404)
+    
+    etag = make_etag('doctor', doctor_id, *fingerprint)
+    notModified = not_modified(etag)
+    if notModified:
+        return notModified
+    
+    doctor = DOCTOR_DETAIL.first(DOCTOR_DETAIL.select().where(Doctor.id == doctor_id))
+    
+    return tag_response(jsonify({
+        'success': True,
+        'doctor': doctor
+    }), etag)
+
+
+@api_bp.route('/doctors/batch', methods=['GET'])
+@login_required
+def get_doctors_batch():
+    """Several doctors in one call - ?ids=1,2,3, results in the same order"""
+    try:
+        ids = requested_ids()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    found = {doctor['id']: doctor for doctor in DOCTOR_DETAIL.all(DOCTOR_DETAIL.select().where(Doctor.id.in_(ids)))}
+    
+    return jsonify({
+        'success': True,
+        'count': len(found),
+        'results': multi_get_results(ids, found, set(), 'doctor')
+    })
+
+
+@api_bp.route('/doctors/<int:doctor_id>/slots', methods=['GET'])
+@login_required
+def get_doctor_slots(doctor_id):
+    """Get open appointment slots for a doctor over a date range (max 31 days)"""
     doctor = Doctor.query.get_or_404(doctor_id)
     
+    try:
+        today = datetime.now().date()
+        start_str = request.args.get('start', '').strip()
+        end_str = request.args.get('end', '').strip()
+        start_date = datetime.strptime(start_str, '%Y-%m-%d').date() if start_str else today
+        end_date = datetime.strptime(end_str, '%Y-%m-%d').date() if end_str else start_date + timedelta(days=6)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date format'}), 400
+    
+    if end_date < start_date or (end_date - start_date).days > 30:
+        return jsonify({'success': False, 'message': 'Date range must be between 1 and 31 days'}), 400
+    
+    slot_minutes = request.args.get('slot_minutes', type=int)
+    if slot_minutes is not None and not 5 <= slot_minutes <= 240:
+        return jsonify({'success': False, 'message': 'slot_minutes must be between 5 and 240'}), 400
+    
+    slots_by_day = free_slots([doctor.id], start_date, end_date, slot_minutes)[doctor.id]
+    
     return jsonify({
         'success': True,
-        'doctor': {
-            'id': doctor.id,
-            'full_name': doctor.full_name,
-            'specialization': doctor.specialization,
-            'department': doctor.department.name,
-            'department_id': doctor.department_id,
-            'phone': doctor.phone,
-            'qualification': doctor.qualification,
-            'experience_years': doctor.experience_years,
-            'consultation_fee': doctor.consultation_fee,
-            'email': doctor.user.email
-        }
+        'doctor_id': doctor.id,
+        'slot_minutes': slot_minutes or current_app.config['APPOINTMENT_SLOT_MINUTES'],
+        'days': [{
+            'date': day.isoformat(),
+            'slots': [slot.strftime('%H:%M') for slot in slots]
+        } for day, slots in sorted(slots_by_day.items())]
+    })
+
+
+@api_bp.route('/doctors/<int:doctor_id>/reschedule', methods=['POST'])
+@login_required
+def reschedule_doctor_appointments(doctor_id):
+    """Move a doctor's booked appointments in a date range (Admin only, dry run by default)"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    doctor = Doctor.query.get_or_404(doctor_id)
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        start_date = datetime.strptime(data.get('start', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(data.get('end', ''), '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'start and end dates (YYYY-MM-DD) are required'}), 400
+    
+    search_days = data.get('search_days', DEFAULT_SEARCH_DAYS)
+    if not isinstance(search_days, int) or not 1 <= search_days <= 60:
+        return jsonify({'success': False, 'message': 'search_days must be between 1 and 60'}), 400
+    
+    dry_run = data.get('dry_run', True)
+    allow_other_doctors = data.get('allow_other_doctors', True)
+    
+    try:
+        if dry_run:
+            moves = plan_reschedule(doctor.id, start_date, end_date, search_days, allow_other_doctors)
+        else:
+            moves = apply_reschedule(doctor.id, start_date, end_date, search_days, allow_other_doctors,
+                                     markUnavailable=data.get('mark_unavailable', True),
+                                     reason=data.get('reason'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+    
+    doctorNames = dict(db.session.execute(
+        db.select(Doctor.id, Doctor.full_name).where(Doctor.department_id == doctor.department_id)
+    ).all())
+    
+    return jsonify({
+        'success': True,
+        'dry_run': bool(dry_run),
+        'total': len(moves),
+        'placed': len([move for move in moves if move['new_date'] is not None]),
+        'moves': [describe_move(move, doctorNames) for move in moves]
     })
 
 
@@ -139,6 +290,7 @@ def delete_doctor(doctor_id):
 # Patients API
 @api_bp.route('/patients', methods=['GET'])
 @login_required
+@coalesce(scope='role')
 def get_patients():
     """Get all patients (Admin only)"""
     if current_user.role != 'admin':
@@ -146,30 +298,22 @@ def get_patients():
     
     search = request.args.get('search', '').strip()
     
-    query = Patient.query.join(User).filter(User.is_active == True)
+    try:
+        serializer = sparse(PATIENT_SUMMARY, request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    query = serializer.select().where(User.is_active == True)
     
     if search:
-        query = query.filter(
-            or_(
-                Patient.full_name.ilike(f'%{search}%'),
-                Patient.phone.ilike(f'%{search}%')
-            )
-        )
+        query = apply_search(query, Patient, search)
     
-    patients = query.all()
+    patients = serializer.all(query)
     
     return jsonify({
         'success': True,
         'count': len(patients),
-        'patients': [{
-            'id': pat.id,
-            'full_name': pat.full_name,
-            'phone': pat.phone,
-            'email': pat.user.email,
-            'gender': pat.gender,
-            'blood_group': pat.blood_group,
-            'date_of_birth': pat.date_of_birth.isoformat() if pat.date_of_birth else None
-        } for pat in patients]
+        'patients': patients
     })
 
 
@@ -183,22 +327,66 @@ def get_patient(patient_id):
         if not patient or patient.id != patient_id:
             return jsonify({'success': False, 'message': 'Unauthorized'}), 403
     
-    patient = Patient.query.get_or_404(patient_id)
+    patient = PATIENT_DETAIL.first(PATIENT_DETAIL.select().where(Patient.id == patient_id))
+    if patient is None:
+        abort(404)
     
     return jsonify({
         'success': True,
-        'patient': {
-            'id': patient.id,
-            'full_name': patient.full_name,
-            'phone': patient.phone,
-            'email': patient.user.email,
-            'date_of_birth': patient.date_of_birth.isoformat() if patient.date_of_birth else None,
-            'gender': patient.gender,
-            'address': patient.address,
-            'blood_group': patient.blood_group,
-            'emergency_contact': patient.emergency_contact,
-            'medical_history': patient.medical_history
-        }
+        'patient': patient
+    })
+
+
+@api_bp.route('/patients/batch', methods=['GET'])
+@login_required
+def get_patients_batch():
+    """Several patients in one call - ?ids=1,2,3 (patients only get their own record)"""
+    try:
+        ids = requested_ids()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    query = PATIENT_DETAIL.select().where(Patient.id.in_(ids))
+    if current_user.role == 'patient':
+        query = query.where(Patient.user_id == current_user.id)
+    found = {patient['id']: patient for patient in PATIENT_DETAIL.all(query)}
+    
+    # Patients see other ids as forbidden, whether they exist or not
+    forbiddenIds = set(ids) - set(found) if current_user.role == 'patient' else set()
+    
+    return jsonify({
+        'success': True,
+        'count': len(found),
+        'results': multi_get_results(ids, found, forbiddenIds, 'patient')
+    })
+
+
+# Autocomplete API
+@api_bp.route('/autocomplete', methods=['GET'])
+@login_required
+def autocomplete():
+    """Typeahead suggestions for patients (Admin only) and doctors by name or phone prefix"""
+    prefix = request.args.get('q', '').strip()
+    search_type = request.args.get('type', 'all').strip()
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    
+    if search_type not in ('all', 'patients', 'doctors'):
+        return jsonify({'success': False, 'message': 'Invalid type'}), 400
+    
+    # Patient lookups follow the same rule as get_patients
+    if search_type == 'patients' and current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    results = {}
+    if search_type in ('all', 'doctors'):
+        results['doctors'] = autocompleteIndexes['doctors'].search(prefix, limit)
+    if search_type in ('all', 'patients') and current_user.role == 'admin':
+        results['patients'] = autocompleteIndexes['patients'].search(prefix, limit)
+    
+    return jsonify({
+        'success': True,
+        'query': prefix,
+        'results': results
     })
 
 
@@ -206,45 +394,43 @@ def get_patient(patient_id):
 @api_bp.route('/appointments', methods=['GET'])
 @login_required
 def get_appointments():
-    """Get appointments based on user role"""
+    """Get appointments based on user role, ?fields= for a subset of the fields"""
     status = request.args.get('status', '').strip()
     date = request.args.get('date', '').strip()
     
+    try:
+        serializer = sparse(APPOINTMENT_SUMMARY, request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    query = serializer.select()
     if current_user.role == 'admin':
-        query = Appointment.query
+        pass
     elif current_user.role == 'doctor':
         doctor = Doctor.query.filter_by(user_id=current_user.id).first()
-        query = Appointment.query.filter_by(doctor_id=doctor.id)
+        query = query.where(Appointment.doctor_id == doctor.id)
     elif current_user.role == 'patient':
         patient = Patient.query.filter_by(user_id=current_user.id).first()
-        query = Appointment.query.filter_by(patient_id=patient.id)
+        query = query.where(Appointment.patient_id == patient.id)
     else:
         return jsonify({'success': False, 'message': 'Unauthorized'}), 403
     
     if status:
-        query = query.filter_by(status=status)
+        query = query.where(Appointment.status == status)
     
     if date:
         try:
             filter_date = datetime.strptime(date, '%Y-%m-%d').date()
-            query = query.filter_by(appointment_date=filter_date)
+            query = query.where(Appointment.appointment_date == filter_date)
         except ValueError:
             return jsonify({'success': False, 'message': 'Invalid date format'}), 400
     
-    appointments = query.order_by(Appointment.appointment_date.desc()).all()
+    appointments = serializer.all(query.order_by(Appointment.appointment_date.desc()))
     
     return jsonify({
         'success': True,
         'count': len(appointments),
-        'appointments': [{
-            'id': apt.id,
-            'patient_name': apt.patient.full_name,
-            'doctor_name': apt.doctor.full_name,
-            'appointment_date': apt.appointment_date.isoformat(),
-            'appointment_time': apt.appointment_time.strftime('%H:%M'),
-            'status': apt.status,
-            'reason': apt.reason
-        } for apt in appointments]
+        'appointments': appointments
     })
 
 
@@ -252,50 +438,45 @@ def get_appointments():
 @login_required
 def get_appointment(appointment_id):
     """Get a specific appointment"""
-    appointment = Appointment.query.get_or_404(appointment_id)
+    # One row with everything the response depends on - enough to authorize
+    # and to answer If-None-Match without loading the appointment
+    fingerprint = db.session.execute(
+        db.select(Appointment.doctor_id, Appointment.patient_id, Appointment.updated_at,
+                  Patient.updated_at, Doctor.updated_at, Treatment.updated_at)
+        .join(Patient, Patient.id == Appointment.patient_id)
+        .join(Doctor, Doctor.id == Appointment.doctor_id)
+        .outerjoin(Treatment, Treatment.appointment_id == Appointment.id)
+        .where(Appointment.id == appointment_id)
+    ).first()
+    if fingerprint is None:
+        abort(404)
     
     # Check authorization
     if current_user.role == 'doctor':
         doctor = Doctor.query.filter_by(user_id=current_user.id).first()
-        if appointment.doctor_id != doctor.id:
+        if fingerprint.doctor_id != doctor.id:
             return jsonify({'success': False, 'message': 'Unauthorized'}), 403
     elif current_user.role == 'patient':
         patient = Patient.query.filter_by(user_id=current_user.id).first()
-        if appointment.patient_id != patient.id:
+        if fingerprint.patient_id != patient.id:
             return jsonify({'success': False, 'message': 'Unauthorized'}), 403
     
-    result = {
-        'id': appointment.id,
-        'patient': {
-            'id': appointment.patient.id,
-            'name': appointment.patient.full_name,
-            'phone': appointment.patient.phone
-        },
-        'doctor': {
-            'id': appointment.doctor.id,
-            'name': appointment.doctor.full_name,
-            'specialization': appointment.doctor.specialization
-        },
-        'appointment_date': appointment.appointment_date.isoformat(),
-        'appointment_time': appointment.appointment_time.strftime('%H:%M'),
-        'status': appointment.status,
-        'reason': appointment.reason,
-        'created_at': appointment.created_at.isoformat()
-    }
+    etag = make_etag('appointment', appointment_id, *fingerprint)
+    notModified = not_modified(etag)
+    if notModified:
+        return notModified
+    
+    result = APPOINTMENT_DETAIL.first(APPOINTMENT_DETAIL.select().where(Appointment.id == appointment_id))
     
     # Include treatment if completed
-    if appointment.treatment:
-        result['treatment'] = {
-            'diagnosis': appointment.treatment.diagnosis,
-            'prescription': appointment.treatment.prescription,
-            'notes': appointment.treatment.notes,
-            'follow_up_date': appointment.treatment.follow_up_date.isoformat() if appointment.treatment.follow_up_date else None
-        }
+    treatment = TREATMENT_DETAIL.first(TREATMENT_DETAIL.select().where(Treatment.appointment_id == appointment_id))
+    if treatment is not None:
+        result['treatment'] = treatment
     
-    return jsonify({
+    return tag_response(jsonify({
         'success': True,
         'appointment': result
-    })
+    }), etag)
 
 
 @api_bp.route('/appointments', methods=['POST'])
@@ -316,16 +497,12 @@ def create_appointment():
         appointment_date = datetime.strptime(data['appointment_date'], '%Y-%m-%d').date()
         appointment_time = datetime.strptime(data['appointment_time'], '%H:%M').time()
         
-        # Check for conflicts
-        existing = Appointment.query.filter_by(
-            doctor_id=data['doctor_id'],
-            appointment_date=appointment_date,
-            appointment_time=appointment_time,
-            status='Booked'
-        ).first()
+        # Check availability and conflicts against the schedule index, then the database
+        problem = booking_problem(int(data['doctor_id']), appointment_date, appointment_time) or \
+            recheck_booking(int(data['doctor_id']), appointment_date, appointment_time)
         
-        if existing:
-            return jsonify({'success': False, 'message': 'Time slot already booked'}), 400
+        if problem is not None:
+            return jsonify({'success': False, 'message': BOOKING_MESSAGES[problem[0]]}), 400
         
         appointment = Appointment(
             patient_id=patient.id,
@@ -342,18 +519,222 @@ def create_appointment():
         return jsonify({
             'success': True,
             'message': 'Appointment booked successfully',
-            'appointment': {
-                'id': appointment.id,
-                'appointment_date': appointment.appointment_date.isoformat(),
-                'appointment_time': appointment.appointment_time.strftime('%H:%M')
-            }
+            'appointment': APPOINTMENT_CREATED.row_to_dict((appointment.id, appointment_date, appointment_time))
         }), 201
     
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': BOOKING_MESSAGES['conflict']}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
+@api_bp.route('/appointments/batch', methods=['GET'])
+@login_required
+def get_appointments_batch():
+    """Several appointments in one call - ?ids=1,2,3, results in the same order
+
+    One IN query fetches the appointments together with their doctor and
+    patient ids, which is all the authorization check needs.
+    """
+    try:
+        ids = requested_ids()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    ownDoctorId = None
+    ownPatientId = None
+    if current_user.role == 'doctor':
+        ownDoctorId = db.session.execute(db.select(Doctor.id).where(Doctor.user_id == current_user.id)).scalar()
+    elif current_user.role == 'patient':
+        ownPatientId = db.session.execute(db.select(Patient.id).where(Patient.user_id == current_user.id)).scalar()
+    elif current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    ownerPosition = len(APPOINTMENT_DETAIL.columns)
+    rows = db.session.execute(
+        APPOINTMENT_DETAIL.select()
+        .add_columns(Appointment.doctor_id, Appointment.patient_id)
+        .where(Appointment.id.in_(ids))
+    ).all()
+    
+    found = {}
+    forbiddenIds = set()
+    for row in rows:
+        doctorId, patientId = row[ownerPosition], row[ownerPosition + 1]
+        if (current_user.role == 'doctor' and doctorId != ownDoctorId) or \
+                (current_user.role == 'patient' and patientId != ownPatientId):
+            forbiddenIds.add(row[0])
+            continue
+        found[row[0]] = APPOINTMENT_DETAIL.row_to_dict(row)
+    
+    # Treatments for all of them in one more query
+    if found:
+        treatmentRows = db.session.execute(
+            TREATMENT_DETAIL.select().add_columns(Treatment.appointment_id)
+            .where(Treatment.appointment_id.in_(list(found)))
+        ).all()
+        treatmentPosition = len(TREATMENT_DETAIL.columns)
+        for row in treatmentRows:
+            found[row[treatmentPosition]]['treatment'] = TREATMENT_DETAIL.row_to_dict(row)
+    
+    return jsonify({
+        'success': True,
+        'count': len(found),
+        'results': multi_get_results(ids, found, forbiddenIds, 'appointment')
+    })
+
+
+MAX_BATCH_APPOINTMENTS = 100
+
+
+@api_bp.route('/appointments/batch', methods=['POST'])
+@login_required
+def create_appointments_batch():
+    """Book several appointments in one transaction (Patient, or Admin for a patient)
+
+    mode 'atomic' (default) books all or nothing, 'best_effort' books the
+    items that pass and reports the rest.
+    """
+    data = request.get_json(silent=True) or {}
+
+    if current_user.role == 'patient':
+        patient = Patient.query.filter_by(user_id=current_user.id).first()
+    elif current_user.role == 'admin':
+        patient = Patient.query.get(data.get('patient_id') or 0)
+        if patient is None:
+            return jsonify({'success': False, 'message': 'patient_id is required'}), 400
+    else:
+        return jsonify({'success': False, 'message': 'Only patients or admins can book appointments'}), 403
+
+    mode = data.get('mode', 'atomic')
+    if mode not in ('atomic', 'best_effort'):
+        return jsonify({'success': False, 'message': 'mode must be atomic or best_effort'}), 400
+
+    items = data.get('appointments')
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'message': 'appointments must be a non-empty list'}), 400
+    if len(items) > MAX_BATCH_APPOINTMENTS:
+        return jsonify({'success': False, 'message': f'At most {MAX_BATCH_APPOINTMENTS} appointments per batch'}), 400
+
+    # Parse everything first, one result slot per item
+    results = [None] * len(items)
+    parsedItems = []  # (index, doctor_id, date, time, reason)
+    todayDate = datetime.now().date()
+    for index, item in enumerate(items):
+        try:
+            doctorId = int(item['doctor_id'])
+            appointmentDate = datetime.strptime(item['appointment_date'], '%Y-%m-%d').date()
+            appointmentTime = datetime.strptime(item['appointment_time'], '%H:%M').time()
+        except (KeyError, TypeError, ValueError):
+            results[index] = {'index': index, 'success': False, 'message': 'Missing or invalid fields'}
+            continue
+        if appointmentDate < todayDate:
+            results[index] = {'index': index, 'success': False, 'message': 'Cannot book appointments in the past'}
+            continue
+        parsedItems.append((index, doctorId, appointmentDate, appointmentTime, item.get('reason', '')))
+
+    # One query for the doctors, one load of every doctor-day involved
+    requestedDoctorIds = {doctorId for index, doctorId, day, slot, reason in parsedItems}
+    activeDoctorIds = set()
+    if requestedDoctorIds:
+        activeDoctorIds = set(db.session.execute(
+            db.select(Doctor.id).join(User, User.id == Doctor.user_id)
+            .where(Doctor.id.in_(requestedDoctorIds), User.is_active == True)
+        ).scalars())
+
+    checkableItems = []
+    for parsedItem in parsedItems:
+        if parsedItem[1] in activeDoctorIds:
+            checkableItems.append(parsedItem)
+        else:
+            results[parsedItem[0]] = {'index': parsedItem[0], 'success': False, 'message': 'Doctor not found'}
+
+    requestedSlots = [(doctorId, day, slot) for index, doctorId, day, slot, reason in checkableItems]
+    problems = batch_booking_problems(requestedSlots)
+    # Slots the index cleared are checked against the database as well
+    for position, dbProblem in enumerate(recheck_bookings(requestedSlots)):
+        problems[position] = problems[position] or dbProblem
+
+    newAppointments = []  # (index, appointment)
+    for parsedItem, problem in zip(checkableItems, problems):
+        index, doctorId, appointmentDate, appointmentTime, reason = parsedItem
+        if problem is not None:
+            results[index] = {'index': index, 'success': False, 'message': BOOKING_MESSAGES[problem[0]]}
+            continue
+        newAppointments.append((index, Appointment(
+            patient_id=patient.id,
+            doctor_id=doctorId,
+            appointment_date=appointmentDate,
+            appointment_time=appointmentTime,
+            reason=reason,
+            status='Booked'
+        )))
+
+    failedCount = len(items) - len(newAppointments)
+    if mode == 'atomic' and failedCount:
+        for index, appointment in newAppointments:
+            results[index] = {'index': index, 'success': False, 'message': 'Not booked because other items failed'}
+        return jsonify({
+            'success': False,
+            'message': f'{failedCount} of {len(items)} appointments cannot be booked, nothing was booked',
+            'booked': 0,
+            'results': results
+        }), 409
+
+    try:
+        # Each insert gets its own savepoint, so a slot taken by a racing request only fails that item
+        bookedAppointments = []
+        for index, appointment in newAppointments:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(appointment)
+            except IntegrityError:
+                results[index] = {'index': index, 'success': False, 'message': BOOKING_MESSAGES['conflict']}
+                continue
+            bookedAppointments.append((index, appointment))
+
+        conflictCount = len(newAppointments) - len(bookedAppointments)
+        if mode == 'atomic' and conflictCount:
+            db.session.rollback()
+            for index, appointment in bookedAppointments:
+                results[index] = {'index': index, 'success': False, 'message': 'Not booked because other items failed'}
+            return jsonify({
+                'success': False,
+                'message': f'{conflictCount} of {len(items)} appointments cannot be booked, nothing was booked',
+                'booked': 0,
+                'results': results
+            }), 409
+
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+    newAppointments = bookedAppointments
+    failedCount = len(items) - len(newAppointments)
+
+    for index, appointment in newAppointments:
+        results[index] = {
+            'index': index,
+            'success': True,
+            'appointment': {
+                'id': appointment.id,
+                'doctor_id': appointment.doctor_id,
+                'appointment_date': appointment.appointment_date.isoformat(),
+                'appointment_time': appointment.appointment_time.strftime('%H:%M')
+            }
+        }
+
+    return jsonify({
+        'success': failedCount == 0,
+        'message': f'{len(newAppointments)} of {len(items)} appointments booked',
+        'booked': len(newAppointments),
+        'results': results
+    }), 201 if newAppointments else 400
+
+
 @api_bp.route('/appointments/<int:appointment_id>', methods=['PUT'])
 @login_required
 def update_appointment(appointment_id):
@@ -411,12 +792,13 @@ def cancel_appointment_api(appointment_id):
         return jsonify({'success': False, 'message': 'Cannot cancel this appointment'}), 400
     
     try:
-        appointment.status = 'Cancelled'
+        promotedEntry = cancel_and_promote(appointment)
         db.session.commit()
         
         return jsonify({
             'success': True,
-            'message': 'Appointment cancelled successfully'
+            'message': 'Appointment cancelled successfully',
+            'waitlist_promoted': promotedEntry is not None
         })
     
     except Exception as e:
@@ -424,14 +806,75 @@ def cancel_appointment_api(appointment_id):
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
+# Reports API
+@api_bp.route('/reports/occupancy', methods=['GET'])
+@login_required
+@coalesce(scope='role')
+def get_occupancy_report():
+    """Booked vs available time per active doctor (Admin only)"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    try:
+        start_str = request.args.get('start', '').strip()
+        start_date = datetime.strptime(start_str, '%Y-%m-%d').date() if start_str else datetime.now().date()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date format'}), 400
+    
+    days = request.args.get('days', 7, type=int)
+    if not 1 <= days <= 31:
+        return jsonify({'success': False, 'message': 'days must be between 1 and 31'}), 400
+    end_date = start_date + timedelta(days=days - 1)
+    
+    doctors = db.session.execute(
+        db.select(Doctor.id, Doctor.full_name, Doctor.department_id)
+        .join(User, User.id == Doctor.user_id)
+        .where(User.is_active == True)
+    ).all()
+    report = occupancy([doc.id for doc in doctors], start_date, end_date)
+    
+    return jsonify({
+        'success': True,
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'doctors': [dict(report[doc.id], doctor_id=doc.id, doctor_name=doc.full_name,
+                         department_id=doc.department_id) for doc in doctors]
+    })
+
+
+@api_bp.route('/reports/coalescing', methods=['GET'])
+@login_required
+def get_coalescing_report():
+    """Per-key single-flight metrics - how many requests shared a computation (Admin only)"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    keyMetrics = singleFlight.metrics()
+    return jsonify({
+        'success': True,
+        'count': len(keyMetrics),
+        'keys': [dict(metrics, key=key) for key, metrics in keyMetrics.items()]
+    })
+
+
 # Departments API
 @api_bp.route('/departments', methods=['GET'])
 @login_required
+@coalesce(scope='role')
 def get_departments():
     """Get all departments"""
+    # Collection fingerprint: count and newest change of departments and of
+    # doctors (doctor_count depends on them)
+    departmentStamp = db.session.execute(db.select(func.count(Department.id), func.max(Department.updated_at))).one()
+    doctorStamp = db.session.execute(db.select(func.count(Doctor.id), func.max(Doctor.updated_at))).one()
+    etag = make_etag('departments', *departmentStamp, *doctorStamp)
+    notModified = not_modified(etag)
+    if notModified:
+        return notModified
+    
     departments = Department.query.all()
     
-    return jsonify({
+    return tag_response(jsonify({
         'success': True,
         'count': len(departments),
         'departments': [{
@@ -440,11 +883,109 @@ def get_departments():
             'description': dept.description,
             'doctor_count': len(dept.doctors)
         } for dept in departments]
+    }), etag)
+
+
+@api_bp.route('/departments/<int:department_id>/earliest-slots', methods=['GET'])
+@login_required
+def get_department_earliest_slots(department_id):
+    """Get the earliest open slots across all active doctors in a department"""
+    department = Department.query.get_or_404(department_id)
+    days = request.args.get('days', 7, type=int)
+    limit = request.args.get('limit', 5, type=int)
+    
+    if not 1 <= days <= 31 or not 1 <= limit <= 100:
+        return jsonify({'success': False, 'message': 'days must be 1-31 and limit 1-100'}), 400
+    
+    start_date = datetime.now().date()
+    end_date = start_date + timedelta(days=days - 1)
+    
+    doctors = {row.id: row for row in db.session.execute(
+        db.select(Doctor.id, Doctor.full_name, Doctor.specialization)
+        .join(User, User.id == Doctor.user_id)
+        .where(Doctor.department_id == department.id, User.is_active == True)
+    )}
+    
+    slots = earliest_slots(list(doctors), start_date, end_date, limit)
+    
+    return jsonify({
+        'success': True,
+        'department': department.name,
+        'count': len(slots),
+        'slots': [{
+            'doctor_id': doctor_id,
+            'doctor_name': doctors[doctor_id].full_name,
+            'specialization': doctors[doctor_id].specialization,
+            'date': day.isoformat(),
+            'time': slot.strftime('%H:%M')
+        } for day, slot, doctor_id in slots]
     })
 
 
+@api_bp.route('/departments/<int:department_id>/appointments', methods=['POST'])
+@login_required
+def book_department_appointment(department_id):
+    """Book with whichever department doctor is least loaded or free earliest (Patient only)"""
+    if current_user.role != 'patient':
+        return jsonify({'success': False, 'message': 'Only patients can book appointments'}), 403
+    
+    department = Department.query.get_or_404(department_id)
+    patient = Patient.query.filter_by(user_id=current_user.id).first()
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        appointment_date = datetime.strptime(data.get('appointment_date', ''), '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'appointment_date (YYYY-MM-DD) is required'}), 400
+    
+    if appointment_date < datetime.now().date():
+        return jsonify({'success': False, 'message': 'Cannot book appointments in the past'}), 400
+    
+    strategy = data.get('strategy', 'capacity')
+    if strategy not in ('capacity', 'earliest'):
+        return jsonify({'success': False, 'message': 'strategy must be capacity or earliest'}), 400
+    
+    assignment = pick_department_slot(department_doctor_ids(department.id), appointment_date, strategy)
+    if assignment is None:
+        return jsonify({'success': False, 'message': 'No doctor in this department has a free slot on that date'}), 409
+    
+    doctor_id, slot_time = assignment
+    if recheck_booking(doctor_id, appointment_date, slot_time) is not None:
+        return jsonify({'success': False, 'message': 'That slot was just taken, please try again'}), 409
+    try:
+        appointment = Appointment(
+            patient_id=patient.id,
+            doctor_id=doctor_id,
+            appointment_date=appointment_date,
+            appointment_time=slot_time,
+            reason=data.get('reason', ''),
+            status='Booked'
+        )
+        db.session.add(appointment)
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'message': 'Appointment booked successfully',
+            'appointment': {
+                'id': appointment.id,
+                'doctor_id': doctor_id,
+                'appointment_date': appointment.appointment_date.isoformat(),
+                'appointment_time': appointment.appointment_time.strftime('%H:%M')
+            }
+        }), 201
+    
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'That slot was just taken, please try again'}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
 @api_bp.route('/departments/<int:department_id>', methods=['GET'])
 @login_required
+@coalesce(scope='role')
 def get_department(department_id):
     """Get a specific department with its doctors"""
     department = Department.query.get_or_404(department_id)
@@ -462,3 +1003,81 @@ def get_department(department_id):
             } for doc in department.doctors if doc.user.is_active]
         }
     })
+
+
+# Background jobs API
+@api_bp.route('/jobs', methods=['GET'])
+@login_required
+def get_jobs():
+    """Recent jobs, newest first, optionally ?status= and ?name= (Admin only)"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    statement = JOB_DETAIL.select().order_by(Job.id.desc()).limit(limit)
+    if request.args.get('status'):
+        statement = statement.where(Job.status == request.args['status'])
+    if request.args.get('name'):
+        statement = statement.where(Job.name == request.args['name'])
+    
+    jobs = JOB_DETAIL.all(statement)
+    return jsonify({
+        'success': True,
+        'counts': job_counts(),
+        'registered': registered_jobs(),
+        'count': len(jobs),
+        'jobs': jobs
+    })
+
+
+@api_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def get_job(job_id):
+    """Status and result of one job (Admin, or whoever queued it)"""
+    job = JOB_DETAIL.first(JOB_DETAIL.select().where(Job.id == job_id))
+    if job is None:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    if current_user.role != 'admin' and job['created_by'] != current_user.id:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    return jsonify({'success': True, 'job': job})
+
+
+@api_bp.route('/jobs', methods=['POST'])
+@login_required
+def create_job():
+    """Queue a registered job by name (Admin only)"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    if data.get('name') not in registered_jobs():
+        return jsonify({'success': False, 'message': f"Unknown job. Available: {', '.join(registered_jobs())}"}), 400
+    if not isinstance(data.get('payload', {}), dict):
+        return jsonify({'success': False, 'message': 'payload must be an object'}), 400
+    
+    try:
+        jobId = enqueue(data['name'], data.get('payload'), priority=int(data.get('priority', 0)),
+                        delaySeconds=max(0, int(data.get('delay_seconds', 0))), createdBy=current_user.id)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'priority and delay_seconds must be integers'}), 400
+    
+    return jsonify({'success': True, 'job_id': jobId, 'status_url': f'/api/jobs/{jobId}'}), 202
+
+
+@api_bp.route('/jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+def retry_job(job_id):
+    """Queue a failed job again with a fresh set of attempts (Admin only)"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    retriedCount = db.session.execute(
+        db.update(Job).where(Job.id == job_id, Job.status == 'Failed')
+        .values(status='Queued', attempts=0, run_at=datetime.utcnow(), finished_at=None)
+    ).rowcount
+    db.session.commit()
+    if not retriedCount:
+        return jsonify({'success': False, 'message': 'Only failed jobs can be retried'}), 409
+    
+    return jsonify({'success': True, 'job_id': job_id}), 202
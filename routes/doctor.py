@@ -1,8 +1,14 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash
+from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify
 from flask_login import login_required, current_user
 from extensions import db
-from models import Doctor, Appointment, Treatment, Patient, DoctorAvailability
+from models import Doctor, Appointment, Treatment, Patient, DoctorAvailability, AvailabilityTemplate, AvailabilityException
 from utils import doctor_required
+from scheduling import availability_days, expand_availability, slot_minutes_setting, to_minutes
+from waitlist import cancel_and_promote
+from live import sse_response, doctor_topic
+from dashboards import doctor_dashboard_data
+from closeout import CLOSED_OUT_STATUSES
+from archive import appointment_history, doctor_patient_ids
 from datetime import datetime, timedelta, time
 
 doctor_bp = Blueprint('doctor', __name__)
@@ -19,46 +25,30 @@ def dashboard():
         flash('Doctor profile not found.', 'danger')
         return redirect(url_for('auth.logout'))
     
-    todayDate = datetime.now().date()
-    doctorId = currentDoctor.id
-    
-    todayAppointments = Appointment.query.filter_by(
-        doctor_id=doctorId,
-        appointment_date=todayDate
-    ).order_by(Appointment.appointment_time).all()
-    
-    # Get this week's appointments
-    weekStartDate = todayDate
-    weekEndDate = todayDate + timedelta(days=7)
-    
-    weekAppointments = Appointment.query.filter(
-        Appointment.doctor_id == doctorId,
-        Appointment.appointment_date >= weekStartDate,
-        Appointment.appointment_date <= weekEndDate,
-        Appointment.status == 'Booked'
-    ).order_by(Appointment.appointment_date, Appointment.appointment_time).all()
-    
-    allAppointments = Appointment.query.filter_by(doctor_id=doctorId).all()
-    uniquePatients = set()
-    for appointment in allAppointments:
-        patientId = appointment.patient_id
-        uniquePatients.add(patientId)
-    
-    patientCount = len(uniquePatients)
-    
-    # Get completed appointments count
-    completedAppointments = Appointment.query.filter_by(
-        doctor_id=doctorId,
-        status='Completed'
-    ).all()
-    completedCount = len(completedAppointments)
-    
-    return render_template('doctor/dashboard.html',
-                        doctor=currentDoctor,
-                        today_appointments=todayAppointments,
-                        week_appointments=weekAppointments,
-                        patient_count=patientCount,
-                        completed_count=completedCount)
+    # Just the shell - the page fetches dashboard_data right after
+    return render_template('doctor/dashboard.html', doctor=currentDoctor)
+
+
+@doctor_bp.route('/dashboard/data')
+@login_required
+@doctor_required
+def dashboard_data():
+    """Stats, today's list and the week ahead in one JSON response"""
+    currentDoctor = Doctor.query.filter_by(user_id=current_user.id).first()
+    if currentDoctor is None:
+        return jsonify({'success': False, 'message': 'Doctor profile not found'}), 404
+    return jsonify(dict(doctor_dashboard_data(currentDoctor.id), success=True))
+
+
+@doctor_bp.route('/dashboard/stream')
+@login_required
+@doctor_required
+def dashboard_stream():
+    """Server-Sent Events with changes to today's appointments"""
+    currentDoctor = Doctor.query.filter_by(user_id=current_user.id).first()
+    if currentDoctor is None:
+        return ('', 404)
+    return sse_response(doctor_topic(currentDoctor.id))
 
 
 @doctor_bp.route('/appointments')
@@ -117,7 +107,8 @@ def complete_appointment(appointment_id):
     selectedAppointment = Appointment.query.filter_by(id=appointment_id, doctor_id=currentDoctor.id).first_or_404()
     
     appointmentStatus = selectedAppointment.status
-    isBookedStatus = appointmentStatus == 'Booked'
+    # Closed-out appointments can still be completed when the visit is recorded late
+    isBookedStatus = appointmentStatus == 'Booked' or appointmentStatus in CLOSED_OUT_STATUSES
     
     if not isBookedStatus:
         flash('This appointment cannot be completed.', 'warning')
@@ -183,9 +174,11 @@ def cancel_appointment(appointment_id):
         return redirect(url_for('doctor.appointments'))
     
     try:
-        appointment.status = 'Cancelled'
+        promotedEntry = cancel_and_promote(appointment)
         db.session.commit()
         flash('Appointment cancelled successfully.', 'success')
+        if promotedEntry is not None:
+            flash(f'The slot was given to {promotedEntry.patient.full_name} from the waitlist.', 'info')
     except Exception as e:
         db.session.rollback()
         flash('An error occurred while cancelling the appointment.', 'danger')
@@ -253,14 +246,8 @@ def edit_treatment(appointment_id):
 def patients():
     currentDoctor = Doctor.query.filter_by(user_id=current_user.id).first()
     
-    allAppointments = Appointment.query.filter_by(doctor_id=currentDoctor.id).all()
-    
-    uniquePatientIds = set()
-    for booking in allAppointments:
-        patientId = booking.patient_id
-        uniquePatientIds.add(patientId)
-    
-    patientIdsList = list(uniquePatientIds)
+    # Patients seen before the archive cutoff still count
+    patientIdsList = doctor_patient_ids(currentDoctor.id)
     
     patientsList = Patient.query.filter(Patient.id.in_(patientIdsList)).all()
     
@@ -274,17 +261,17 @@ def view_patient(patient_id):
     doctor = Doctor.query.filter_by(user_id=current_user.id).first()
     patient = Patient.query.get_or_404(patient_id)
     
-    # Get patient's appointment history with this doctor
-    appointments = Appointment.query.filter_by(
-        patient_id=patient_id,
-        doctor_id=doctor.id
-    ).order_by(Appointment.appointment_date.desc()).all()
+    # Get patient's appointment history with this doctor (hot + archived)
+    appointments = appointment_history(patientId=patient_id, doctorId=doctor.id)
     
     return render_template('doctor/view_patient.html',
                         patient=patient,
                         appointments=appointments)
 
 
+WEEKDAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
 @doctor_bp.route('/availability', methods=['GET', 'POST'])
 @login_required
 @doctor_required
@@ -293,69 +280,217 @@ def availability():
     
     if request.method == 'POST':
         try:
-            # Clear existing availability for next 7 days
-            today = datetime.now().date()
-            week_end = today + timedelta(days=7)
-            
-            DoctorAvailability.query.filter(
-                DoctorAvailability.doctor_id == doctor.id,
-                DoctorAvailability.date >= today,
-                DoctorAvailability.date <= week_end
-            ).delete()
-            
-            # Add new availability
-            for i in range(7):
-                date = today + timedelta(days=i)
-                date_str = date.strftime('%Y-%m-%d')
-                
-                is_available = request.form.get(f'available_{date_str}') == 'on'
+            # Weekly hours are stored once per weekday and expanded on demand
+            newTemplates = []
+            for weekday in range(7):
+                is_available = request.form.get(f'available_{weekday}') == 'on'
                 
                 if is_available:
-                    start_time_str = request.form.get(f'start_time_{date_str}', '09:00')
-                    end_time_str = request.form.get(f'end_time_{date_str}', '17:00')
+                    start_time_str = request.form.get(f'start_time_{weekday}', '09:00')
+                    end_time_str = request.form.get(f'end_time_{weekday}', '17:00')
                     
                     start_time = datetime.strptime(start_time_str, '%H:%M').time()
                     end_time = datetime.strptime(end_time_str, '%H:%M').time()
                     
-                    availability = DoctorAvailability(
+                    if end_time <= start_time:
+                        flash(f'End time must be after start time for {WEEKDAY_NAMES[weekday]}.', 'danger')
+                        return redirect(url_for('doctor.availability'))
+                    
+                    newTemplates.append(AvailabilityTemplate(
                         doctor_id=doctor.id,
-                        date=date,
+                        weekday=weekday,
                         start_time=start_time,
-                        end_time=end_time,
-                        is_available=True
-                    )
-                    db.session.add(availability)
+                        end_time=end_time
+                    ))
             
+            for template in doctor.availability_templates:
+                db.session.delete(template)
+            db.session.add_all(newTemplates)
             db.session.commit()
+            
             flash('Availability updated successfully!', 'success')
+            
+            # Dated rows (e.g. bulk-generated by the admin) still take precedence until the doctor clears them
+            datedCount = DoctorAvailability.query.filter(
+                DoctorAvailability.doctor_id == doctor.id,
+                DoctorAvailability.date >= datetime.now().date()
+            ).count()
+            if datedCount:
+                flash(f'{datedCount} upcoming dates have their own schedule set and keep it - use '
+                      f'"Use weekly hours from" below to switch them over.', 'info')
             return redirect(url_for('doctor.availability'))
         
+        except ValueError:
+            db.session.rollback()
+            flash('Invalid time format.', 'danger')
         except Exception as e:
             db.session.rollback()
             flash('An error occurred while updating availability.', 'danger')
             print(f"Error updating availability: {e}")
     
-    # Get current availability for next 7 days
+    # Current weekly template
+    templatesByWeekday = {template.weekday: template for template in doctor.availability_templates}
+    weekly_data = []
+    
+    for weekday in range(7):
+        template = templatesByWeekday.get(weekday)
+        weekly_data.append({
+            'weekday': weekday,
+            'name': WEEKDAY_NAMES[weekday],
+            'available': template is not None,
+            'start_time': template.start_time.strftime('%H:%M') if template else '09:00',
+            'end_time': template.end_time.strftime('%H:%M') if template else '17:00'
+        })
+    
+    # Upcoming exceptions and what the next two weeks actually look like
     today = datetime.now().date()
-    availability_data = []
+    exceptions = AvailabilityException.query.filter(
+        AvailabilityException.doctor_id == doctor.id,
+        AvailabilityException.date >= today
+    ).order_by(AvailabilityException.date).all()
     
-    for i in range(7):
-        date = today + timedelta(days=i)
-        avail = DoctorAvailability.query.filter_by(
-            doctor_id=doctor.id,
-            date=date
-        ).first()
-        
-        availability_data.append({
-            'date': date,
-            'available': avail is not None and avail.is_available,
-            'start_time': avail.start_time.strftime('%H:%M') if avail else '09:00',
-            'end_time': avail.end_time.strftime('%H:%M') if avail else '17:00'
-        })
+    upcoming_days = availability_days([doctor.id], today, today + timedelta(days=13), includeClosed=True)[doctor.id]
+    
+    # Dated schedule rows (bulk-generated by the admin) that override the weekly hours
+    datedDates = db.session.execute(
+        db.select(DoctorAvailability.date)
+        .where(DoctorAvailability.doctor_id == doctor.id, DoctorAvailability.date >= today)
+        .order_by(DoctorAvailability.date)
+    ).scalars().all()
     
     return render_template('doctor/availability.html',
                         doctor=doctor,
-                        availability_data=availability_data)
+                        weekly_data=weekly_data,
+                        exceptions=exceptions,
+                        upcoming_days=upcoming_days,
+                        dated_count=len(datedDates),
+                        dated_first=datedDates[0] if datedDates else None,
+                        dated_last=datedDates[-1] if datedDates else None)
+
+
+@doctor_bp.route('/availability/use-weekly', methods=['POST'])
+@login_required
+@doctor_required
+def use_weekly_hours():
+    """Drop dated schedule rows from a date on, so the weekly hours apply again"""
+    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+    
+    try:
+        from_date = datetime.strptime(request.form.get('from_date', ''), '%Y-%m-%d').date()
+        from_date = max(from_date, datetime.now().date())
+        
+        # Row by row so the schedule index hears about every date
+        datedRows = DoctorAvailability.query.filter(
+            DoctorAvailability.doctor_id == doctor.id,
+            DoctorAvailability.date >= from_date
+        ).all()
+        for row in datedRows:
+            db.session.delete(row)
+        db.session.commit()
+        flash(f"Weekly hours now apply from {from_date.strftime('%d %b %Y')} "
+              f"({len(datedRows)} dated schedules removed).", 'success')
+        
+        # Existing bookings are kept even if the weekly hours no longer cover them
+        bookedAppointments = Appointment.query.filter(
+            Appointment.doctor_id == doctor.id,
+            Appointment.appointment_date >= from_date,
+            Appointment.status == 'Booked'
+        ).all()
+        if bookedAppointments:
+            slotMinutes = slot_minutes_setting()
+            windowsByDay = expand_availability([doctor.id], from_date,
+                                               max(appointment.appointment_date for appointment in bookedAppointments))
+            outsideCount = 0
+            for appointment in bookedAppointments:
+                startMinute = to_minutes(appointment.appointment_time)
+                windows = windowsByDay[(doctor.id, appointment.appointment_date)][0]
+                if not any(start <= startMinute and startMinute + slotMinutes <= end for start, end in windows):
+                    outsideCount += 1
+            if outsideCount:
+                flash(f'{outsideCount} booked appointments now fall outside your hours and are kept.', 'warning')
+    
+    except ValueError:
+        db.session.rollback()
+        flash('Invalid date format.', 'danger')
+    except Exception as e:
+        db.session.rollback()
+        flash('An error occurred while switching to weekly hours.', 'danger')
+        print(f"Error switching to weekly hours: {e}")
+    
+    return redirect(url_for('doctor.availability'))
+
+
+@doctor_bp.route('/availability/exceptions', methods=['POST'])
+@login_required
+@doctor_required
+def add_availability_exception():
+    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+    
+    try:
+        exception_date = datetime.strptime(request.form.get('date', ''), '%Y-%m-%d').date()
+        is_available = request.form.get('exception_type') == 'custom'
+        reason = request.form.get('reason', '').strip()
+        
+        if exception_date < datetime.now().date():
+            flash('Cannot add an exception for a past date.', 'danger')
+            return redirect(url_for('doctor.availability'))
+        
+        start_time = None
+        end_time = None
+        if is_available:
+            start_time = datetime.strptime(request.form.get('start_time', ''), '%H:%M').time()
+            end_time = datetime.strptime(request.form.get('end_time', ''), '%H:%M').time()
+            if end_time <= start_time:
+                flash('End time must be after start time.', 'danger')
+                return redirect(url_for('doctor.availability'))
+        
+        # One exception per date - replace whatever was there
+        for existing in AvailabilityException.query.filter_by(doctor_id=doctor.id, date=exception_date).all():
+            db.session.delete(existing)
+        
+        db.session.add(AvailabilityException(
+            doctor_id=doctor.id,
+            date=exception_date,
+            is_available=is_available,
+            start_time=start_time,
+            end_time=end_time,
+            reason=reason or None
+        ))
+        db.session.commit()
+        flash(f"Exception saved for {exception_date.strftime('%d %b %Y')}.", 'success')
+    
+    except ValueError:
+        db.session.rollback()
+        flash('Invalid date or time format.', 'danger')
+    except Exception as e:
+        db.session.rollback()
+        flash('An error occurred while saving the exception.', 'danger')
+        print(f"Error saving availability exception: {e}")
+    
+    return redirect(url_for('doctor.availability'))
+
+
+@doctor_bp.route('/availability/exceptions/<int:exception_id>/delete', methods=['POST'])
+@login_required
+@doctor_required
+def delete_availability_exception(exception_id):
+    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+    exception = AvailabilityException.query.get_or_404(exception_id)
+    
+    if exception.doctor_id != doctor.id:
+        flash('Unauthorized access.', 'danger')
+        return redirect(url_for('doctor.availability'))
+    
+    try:
+        db.session.delete(exception)
+        db.session.commit()
+        flash('Exception removed.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash('An error occurred while removing the exception.', 'danger')
+        print(f"Error removing availability exception: {e}")
+    
+    return redirect(url_for('doctor.availability'))
 
 
 @doctor_bp.route('/profile', methods=['GET', 'POST'])
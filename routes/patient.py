@@ -1,10 +1,16 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash
+from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify
 from flask_login import login_required, current_user
 from extensions import db
-from models import Patient, Doctor, Appointment, Department, DoctorAvailability, Treatment
+from models import Patient, Doctor, Appointment, Department, Treatment, WaitlistEntry
 from utils import patient_required
 from datetime import datetime, timedelta
-from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from search import apply_search
+from scheduling import free_slots, earliest_slots, booking_problem, recheck_booking, availability_days, pick_department_slot, \
+    department_doctor_ids
+from waitlist import cancel_and_promote
+from dashboards import patient_dashboard_data
+from archive import appointment_history
 
 patient_bp = Blueprint('patient', __name__)
 
@@ -20,27 +26,19 @@ def dashboard():
         flash('Patient profile not found.', 'danger')
         return redirect(url_for('auth.logout'))
     
-    allDepartments = Department.query.all()
-    
-    todayDate = datetime.now().date()
-    patientId = currentPatient.id
-    
-    # Find booked appointments
-    upcomingBookings = Appointment.query.filter(
-        Appointment.patient_id == patientId,
-        Appointment.appointment_date >= todayDate,
-        Appointment.status == 'Booked'
-    ).order_by(Appointment.appointment_date, Appointment.appointment_time).all()
-    
-    recentBookings = Appointment.query.filter_by(
-        patient_id=patientId
-    ).order_by(Appointment.appointment_date.desc()).limit(5).all()
-    
-    return render_template('patient/dashboard.html',
-                         patient=currentPatient,
-                         departments=allDepartments,
-                         upcoming_appointments=upcomingBookings,
-                         recent_appointments=recentBookings)
+    # Just the shell - the page fetches dashboard_data right after
+    return render_template('patient/dashboard.html', patient=currentPatient)
+
+
+@patient_bp.route('/dashboard/data')
+@login_required
+@patient_required
+def dashboard_data():
+    """Everything the dashboard shows, in one JSON response"""
+    currentPatient = Patient.query.filter_by(user_id=current_user.id).first()
+    if currentPatient is None:
+        return jsonify({'success': False, 'message': 'Patient profile not found'}), 404
+    return jsonify(dict(patient_dashboard_data(currentPatient.id), success=True))
 
 
 @patient_bp.route('/doctors')
@@ -56,31 +54,13 @@ def doctors():
     # Build query - only active doctors
     baseQuery = Doctor.query.join(Doctor.user).filter(Doctor.user.has(is_active=True))
     
-    # Apply search filter if provided
+    # Apply search filter if provided - ranked full-text match
     if searchQuery:
-        searchPattern = f'%{searchQuery}%'
-        baseQuery = baseQuery.filter(
-            or_(
-                Doctor.full_name.ilike(searchPattern),
-                Doctor.specialization.ilike(searchPattern)
-            )
-        )
+        baseQuery = apply_search(baseQuery, Doctor, searchQuery)
     
     if departmentId:
         baseQuery = baseQuery.filter(Doctor.department_id == departmentId)
     
-    # Apply availability date filter
-    if availabilityDate:
-        try:
-            searchDate = datetime.strptime(availabilityDate, '%Y-%m-%d').date()
-            # Filter doctors who have availability on this date
-            baseQuery = baseQuery.join(DoctorAvailability).filter(
-                DoctorAvailability.date == searchDate,
-                DoctorAvailability.is_available == True
-            ).distinct()
-        except ValueError:
-            pass  # Invalid date format, ignore filter
-    
     # Execute query
     doctorsList = baseQuery.all()
     allDepartments = Department.query.all()
@@ -88,27 +68,42 @@ def doctors():
     todayDate = datetime.now().date()
     weekEndDate = todayDate + timedelta(days=7)
     
+    # Expanded weekly hours for every listed doctor in one go (no per-doctor queries)
+    availabilityByDoctor = availability_days([doc.id for doc in doctorsList], todayDate, weekEndDate)
+    
+    # Apply availability date filter
+    if availabilityDate:
+        try:
+            searchDate = datetime.strptime(availabilityDate, '%Y-%m-%d').date()
+            # Keep doctors who work on this date
+            dateHours = availability_days([doc.id for doc in doctorsList], searchDate, searchDate)
+            doctorsList = [doc for doc in doctorsList if dateHours[doc.id]]
+        except ValueError:
+            pass  # Invalid date format, ignore filter
+    
     doctorsWithAvailability = []
     
-    # Loop through each doctor
     for currentDoctor in doctorsList:
-        doctorId = currentDoctor.id
-        
-        availableSlots = DoctorAvailability.query.filter(
-            DoctorAvailability.doctor_id == doctorId,
-            DoctorAvailability.date >= todayDate,
-            DoctorAvailability.date <= weekEndDate,
-            DoctorAvailability.is_available == True
-        ).order_by(DoctorAvailability.date).all()
-        
         doctorInfo = {
             'doctor': currentDoctor,
-            'availability': availableSlots
+            'availability': availabilityByDoctor[currentDoctor.id]
         }
         doctorsWithAvailability.append(doctorInfo)
     
+    # "First free doctor" across the chosen department
+    earliestOpenings = []
+    if departmentId and doctorsList:
+        doctorsById = {doc.id: doc for doc in doctorsList}
+        for slotDate, slotTime, slotDoctorId in earliest_slots(list(doctorsById), todayDate, weekEndDate, 5):
+            earliestOpenings.append({
+                'doctor': doctorsById[slotDoctorId],
+                'date': slotDate,
+                'time': slotTime
+            })
+    
     return render_template('patient/doctors.html',
                          doctors_with_availability=doctorsWithAvailability,
+                         earliest_openings=earliestOpenings,
                          departments=allDepartments,
                          patient=currentPatient)
 
@@ -124,19 +119,163 @@ def view_doctor(doctor_id):
     today = datetime.now().date()
     week_end = today + timedelta(days=7)
     
-    availability = DoctorAvailability.query.filter(
-        DoctorAvailability.doctor_id == doctor.id,
-        DoctorAvailability.date >= today,
-        DoctorAvailability.date <= week_end,
-        DoctorAvailability.is_available == True
-    ).order_by(DoctorAvailability.date).all()
+    availability = availability_days([doctor.id], today, week_end)[doctor.id]
+    
+    # Is any slot still open this week? Otherwise offer the waitlist
+    slotsByDay = free_slots([doctor.id], today, week_end)[doctor.id]
+    hasOpenSlots = any(len(daySlots) > 0 for daySlots in slotsByDay.values())
+    
+    waitlistEntry = WaitlistEntry.query.filter_by(
+        patient_id=patient.id,
+        doctor_id=doctor.id,
+        status='Waiting'
+    ).first()
     
     return render_template('patient/view_doctor.html',
                          doctor=doctor,
                          availability=availability,
+                         has_open_slots=hasOpenSlots,
+                         waitlist_entry=waitlistEntry,
+                         default_waitlist_start=today,
+                         default_waitlist_end=week_end,
                          patient=patient)
 
 
+@patient_bp.route('/doctor/<int:doctor_id>/waitlist', methods=['POST'])
+@login_required
+@patient_required
+def join_waitlist(doctor_id):
+    patient = Patient.query.filter_by(user_id=current_user.id).first()
+    doctor = Doctor.query.get_or_404(doctor_id)
+    
+    try:
+        startDate = datetime.strptime(request.form.get('start_date', ''), '%Y-%m-%d').date()
+        endDate = datetime.strptime(request.form.get('end_date', ''), '%Y-%m-%d').date()
+        earliestStr = request.form.get('earliest_time', '').strip()
+        latestStr = request.form.get('latest_time', '').strip()
+        earliestTime = datetime.strptime(earliestStr, '%H:%M').time() if earliestStr else None
+        latestTime = datetime.strptime(latestStr, '%H:%M').time() if latestStr else None
+    except ValueError:
+        flash('Invalid date or time format.', 'danger')
+        return redirect(url_for('patient.view_doctor', doctor_id=doctor.id))
+    
+    todayDate = datetime.now().date()
+    if startDate < todayDate or endDate < startDate or (endDate - startDate).days > 60:
+        flash('Choose a future date range of at most 60 days.', 'danger')
+        return redirect(url_for('patient.view_doctor', doctor_id=doctor.id))
+    
+    existingEntry = WaitlistEntry.query.filter_by(
+        patient_id=patient.id,
+        doctor_id=doctor.id,
+        status='Waiting'
+    ).first()
+    if existingEntry:
+        flash('You are already on this doctor\'s waitlist.', 'info')
+        return redirect(url_for('patient.view_doctor', doctor_id=doctor.id))
+    
+    try:
+        entry = WaitlistEntry(
+            patient_id=patient.id,
+            doctor_id=doctor.id,
+            start_date=startDate,
+            end_date=endDate,
+            earliest_time=earliestTime,
+            latest_time=latestTime,
+            reason=request.form.get('reason', '').strip() or None
+        )
+        db.session.add(entry)
+        db.session.commit()
+        flash('You are on the waitlist. A freed slot will be booked for you automatically.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash('An error occurred while joining the waitlist.', 'danger')
+        print(f"Error joining waitlist: {e}")
+    
+    return redirect(url_for('patient.view_doctor', doctor_id=doctor.id))
+
+
+@patient_bp.route('/waitlist/<int:entry_id>/leave', methods=['POST'])
+@login_required
+@patient_required
+def leave_waitlist(entry_id):
+    patient = Patient.query.filter_by(user_id=current_user.id).first()
+    entry = WaitlistEntry.query.filter_by(id=entry_id, patient_id=patient.id).first_or_404()
+    
+    if entry.status == 'Waiting':
+        try:
+            entry.status = 'Cancelled'
+            db.session.commit()
+            flash('You have left the waitlist.', 'success')
+        except Exception as e:
+            db.session.rollback()
+            flash('An error occurred while leaving the waitlist.', 'danger')
+            print(f"Error leaving waitlist: {e}")
+    
+    return redirect(request.referrer or url_for('patient.appointments'))
+
+
+@patient_bp.route('/book-by-department', methods=['GET', 'POST'])
+@login_required
+@patient_required
+def book_by_department():
+    currentPatient = Patient.query.filter_by(user_id=current_user.id).first()
+    allDepartments = Department.query.all()
+    
+    if request.method == 'POST':
+        departmentId = request.form.get('department_id', type=int)
+        strategy = request.form.get('strategy', 'capacity')
+        reasonText = request.form.get('reason', '').strip()
+        
+        try:
+            appointmentDate = datetime.strptime(request.form.get('appointment_date', ''), '%Y-%m-%d').date()
+        except ValueError:
+            flash('Invalid date format.', 'danger')
+            return redirect(url_for('patient.book_by_department'))
+        
+        if appointmentDate < datetime.now().date():
+            flash('Cannot book appointments in the past.', 'danger')
+            return redirect(url_for('patient.book_by_department'))
+        
+        # Least loaded (or earliest free) doctor of the department on that date
+        assignment = pick_department_slot(department_doctor_ids(departmentId), appointmentDate, strategy)
+        if assignment is None:
+            flash('No doctor in this department has a free slot on that date.', 'warning')
+            return redirect(url_for('patient.book_by_department', department=departmentId))
+        
+        assignedDoctorId, slotTime = assignment
+        if recheck_booking(assignedDoctorId, appointmentDate, slotTime) is not None:
+            flash('That slot was just taken, please try again.', 'warning')
+            return redirect(url_for('patient.book_by_department', department=departmentId))
+        try:
+            newAppointment = Appointment(
+                patient_id=currentPatient.id,
+                doctor_id=assignedDoctorId,
+                appointment_date=appointmentDate,
+                appointment_time=slotTime,
+                reason=reasonText,
+                status='Booked'
+            )
+            db.session.add(newAppointment)
+            db.session.commit()
+            
+            assignedDoctor = Doctor.query.get(assignedDoctorId)
+            flash(f"Appointment booked with Dr. {assignedDoctor.full_name} on {appointmentDate.strftime('%d %b %Y')} "
+                  f"at {slotTime.strftime('%I:%M %p')}.", 'success')
+            return redirect(url_for('patient.appointments'))
+        except IntegrityError:
+            db.session.rollback()
+            flash('That slot was just taken, please try again.', 'warning')
+        except Exception as e:
+            db.session.rollback()
+            flash('An error occurred while booking the appointment.', 'danger')
+            print(f"Error booking by department: {e}")
+    
+    return render_template('patient/book_by_department.html',
+                         departments=allDepartments,
+                         today=datetime.now().date(),
+                         patient=currentPatient)
+
+
 @patient_bp.route('/book-appointment/<int:doctor_id>', methods=['GET', 'POST'])
 @login_required
 @patient_required
@@ -168,39 +307,21 @@ def book_appointment(doctor_id):
                 flash('Cannot book appointment for past dates.', 'danger')
                 return redirect(url_for('patient.book_appointment', doctor_id=doctor_id))
             
-            doctorAvailability = DoctorAvailability.query.filter_by(
-                doctor_id=doctor_id,
-                date=parsedDate,
-                is_available=True
-            ).first()
-            
-            # Verify availability exists
-            availabilityExists = doctorAvailability is not None
-            if not availabilityExists:
-                flash('Doctor is not available on the selected date.', 'danger')
-                return redirect(url_for('patient.book_appointment', doctor_id=doctor_id))
-            
-            # Check if time is within availability window
-            startTime = doctorAvailability.start_time
-            endTime = doctorAvailability.end_time
-            isTimeInRange = (parsedTime >= startTime) and (parsedTime <= endTime)
-            
-            if not isTimeInRange:
-                startTimeStr = startTime.strftime("%H:%M")
-                endTimeStr = endTime.strftime("%H:%M")
-                flash(f'Please select a time between {startTimeStr} and {endTimeStr}.', 'danger')
-                return redirect(url_for('patient.book_appointment', doctor_id=doctor_id))
-            
-            conflictingBooking = Appointment.query.filter_by(
-                doctor_id=doctor_id,
-                appointment_date=parsedDate,
-                appointment_time=parsedTime,
-                status='Booked'
-            ).first()
+            # Availability and conflicts from the in-memory schedule index, then the
+            # database for bookings the index hasn't seen yet
+            problem = booking_problem(doctor_id, parsedDate, parsedTime) or \
+                recheck_booking(doctor_id, parsedDate, parsedTime)
             
-            hasConflict = conflictingBooking is not None
-            if hasConflict:
-                flash('This time slot is already booked. Please choose another time.', 'danger')
+            if problem is not None:
+                reason, detail = problem
+                if reason == 'unavailable':
+                    flash('Doctor is not available on the selected date.', 'danger')
+                elif reason == 'outside_hours':
+                    startTimeStr = detail[0].strftime("%H:%M")
+                    endTimeStr = detail[1].strftime("%H:%M")
+                    flash(f'Please select a time between {startTimeStr} and {endTimeStr}.', 'danger')
+                else:
+                    flash('This time slot is already booked. Please choose another time.', 'danger')
                 return redirect(url_for('patient.book_appointment', doctor_id=doctor_id))
             
             # Create new appointment object
@@ -220,6 +341,9 @@ def book_appointment(doctor_id):
             flash('Appointment booked successfully!', 'success')
             return redirect(url_for('patient.appointments'))
         
+        except IntegrityError:
+            db.session.rollback()
+            flash('This time slot is already booked. Please choose another time.', 'danger')
         except ValueError:
             flash('Invalid date or time format.', 'danger')
         except Exception as e:
@@ -231,17 +355,19 @@ def book_appointment(doctor_id):
     todayDate = datetime.now().date()
     futureDate = todayDate + timedelta(days=7)
     
-    # Fetch available slots
-    availableSlots = DoctorAvailability.query.filter(
-        DoctorAvailability.doctor_id == doctor_id,
-        DoctorAvailability.date >= todayDate,
-        DoctorAvailability.date <= futureDate,
-        DoctorAvailability.is_available == True
-    ).order_by(DoctorAvailability.date).all()
+    # Working hours expanded from the weekly template and exceptions
+    availableSlots = availability_days([doctor_id], todayDate, futureDate)[doctor_id]
+    
+    # Concrete open times per date so the form can offer them directly
+    slotsByDay = free_slots([doctor_id], todayDate, futureDate)[doctor_id]
+    openSlots = {}
+    for slotDay, daySlots in slotsByDay.items():
+        openSlots[slotDay.isoformat()] = [slot.strftime('%H:%M') for slot in daySlots]
     
     return render_template('patient/book_appointment.html',
                          doctor=selectedDoctor,
                          availability=availableSlots,
+                         open_slots=openSlots,
                          patient=currentPatient)
 
 
@@ -267,8 +393,14 @@ def appointments():
         Appointment.appointment_time.desc()
     ).all()
     
+    waitlistEntries = WaitlistEntry.query.filter_by(
+        patient_id=currentPatient.id,
+        status='Waiting'
+    ).order_by(WaitlistEntry.start_date).all()
+    
     return render_template('patient/appointments.html',
                          appointments=patientAppointments,
+                         waitlist_entries=waitlistEntries,
                          patient=currentPatient)
 
 
@@ -302,7 +434,8 @@ def cancel_appointment(appointment_id):
         return redirect(url_for('patient.appointments'))
     
     try:
-        appointment.status = 'Cancelled'
+        # Freed slot goes to the first matching waitlisted patient in the same commit
+        cancel_and_promote(appointment)
         db.session.commit()
         flash('Appointment cancelled successfully.', 'success')
     except Exception as e:
@@ -346,28 +479,20 @@ def reschedule_appointment(appointment_id):
                 flash('Appointment date must be in the future.', 'danger')
                 return redirect(url_for('patient.reschedule_appointment', appointment_id=appointment_id))
             
-            # Check doctor availability
-            availability = DoctorAvailability.query.filter_by(
-                doctor_id=appointment.doctor_id,
-                date=appointmentDate,
-                is_available=True
-            ).first()
+            # Check availability and conflicts (ignoring this appointment's own slot)
+            problem = booking_problem(appointment.doctor_id, appointmentDate, appointmentTime,
+                                      ignoreAppointmentId=appointment.id) or \
+                recheck_booking(appointment.doctor_id, appointmentDate, appointmentTime,
+                                ignoreAppointmentId=appointment.id)
             
-            if not availability:
-                flash('Doctor is not available on the selected date.', 'danger')
-                return redirect(url_for('patient.reschedule_appointment', appointment_id=appointment_id))
-            
-            # Check for conflicting appointments
-            conflictingAppointment = Appointment.query.filter(
-                Appointment.doctor_id == appointment.doctor_id,
-                Appointment.appointment_date == appointmentDate,
-                Appointment.appointment_time == appointmentTime,
-                Appointment.status == 'Booked',
-                Appointment.id != appointment.id
-            ).first()
-            
-            if conflictingAppointment:
-                flash('This time slot is already booked. Please select another time.', 'danger')
+            if problem is not None:
+                reason, detail = problem
+                if reason == 'unavailable':
+                    flash('Doctor is not available on the selected date.', 'danger')
+                elif reason == 'outside_hours':
+                    flash(f'Please select a time between {detail[0].strftime("%H:%M")} and {detail[1].strftime("%H:%M")}.', 'danger')
+                else:
+                    flash('This time slot is already booked. Please select another time.', 'danger')
                 return redirect(url_for('patient.reschedule_appointment', appointment_id=appointment_id))
             
             # Update appointment
@@ -378,6 +503,9 @@ def reschedule_appointment(appointment_id):
             flash('Appointment rescheduled successfully!', 'success')
             return redirect(url_for('patient.view_appointment', appointment_id=appointment.id))
             
+        except IntegrityError:
+            db.session.rollback()
+            flash('This time slot is already booked. Please select another time.', 'danger')
         except Exception as e:
             db.session.rollback()
             flash('An error occurred while rescheduling the appointment.', 'danger')
@@ -387,12 +515,7 @@ def reschedule_appointment(appointment_id):
     today = datetime.now().date()
     endDate = today + timedelta(days=30)
     
-    availability = DoctorAvailability.query.filter(
-        DoctorAvailability.doctor_id == appointment.doctor_id,
-        DoctorAvailability.date >= today,
-        DoctorAvailability.date <= endDate,
-        DoctorAvailability.is_available == True
-    ).order_by(DoctorAvailability.date).all()
+    availability = availability_days([appointment.doctor_id], today, endDate)[appointment.doctor_id]
     
     return render_template('patient/reschedule_appointment.html',
                          appointment=appointment,
@@ -406,11 +529,8 @@ def reschedule_appointment(appointment_id):
 def medical_history():
     patient = Patient.query.filter_by(user_id=current_user.id).first()
     
-    # Get all completed appointments with treatments
-    appointments = Appointment.query.filter_by(
-        patient_id=patient.id,
-        status='Completed'
-    ).order_by(Appointment.appointment_date.desc()).all()
+    # Get all completed appointments with treatments, archived ones included
+    appointments = appointment_history(patientId=patient.id, status='Completed')
     
     return render_template('patient/medical_history.html',
                          appointments=appointments,
@@ -0,0 +1,550 @@
+from extensions import db
+from models import Appointment, DoctorAvailability, AvailabilityTemplate, AvailabilityException
+from flask import current_app
+from sqlalchemy import select
+from datetime import datetime, timedelta, time
+from itertools import islice
+import heapq
+import threading
+
+# In-memory schedule index
+# Every doctor-day is kept as two bitsets at GRANULARITY_MINUTES resolution
+# (288 bits, i.e. a few machine words, for a full day): which minutes the
+# doctor works and which are already booked. Conflict checks, open-slot
+# listings and occupancy numbers are then plain bit operations.
+#
+# Working hours come from weekly templates, expanded lazily per date, with
+# dated DoctorAvailability rows and AvailabilityException rows on top.
+
+DEFAULT_SLOT_MINUTES = 30
+GRANULARITY_MINUTES = 5
+
+
+def to_minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def from_minutes(minutes):
+    return time(minutes // 60, minutes % 60)
+
+
+def slot_minutes_setting():
+    return current_app.config.get('APPOINTMENT_SLOT_MINUTES', DEFAULT_SLOT_MINUTES)
+
+
+def span_mask(startMinute, endMinute):
+    """Bits touched by [startMinute, endMinute) - rounded outwards"""
+    firstBit = startMinute // GRANULARITY_MINUTES
+    lastBit = -(-endMinute // GRANULARITY_MINUTES)
+    if lastBit <= firstBit:
+        return 0
+    return ((1 << (lastBit - firstBit)) - 1) << firstBit
+
+
+def window_mask(startMinute, endMinute):
+    """Bits fully inside [startMinute, endMinute) - rounded inwards"""
+    firstBit = -(-startMinute // GRANULARITY_MINUTES)
+    lastBit = endMinute // GRANULARITY_MINUTES
+    if lastBit <= firstBit:
+        return 0
+    return ((1 << (lastBit - firstBit)) - 1) << firstBit
+
+
+def expand_availability(doctorIds, startDate, endDate):
+    """Working windows per doctor-day without materializing rows
+
+    Returns {(doctor_id, date): (windows, source)} with windows as sorted
+    (start, end) minute pairs. Precedence per date: an exception (leave or
+    custom hours) wins, then dated DoctorAvailability rows, then the weekly
+    template for that weekday. One query per table for the whole range.
+    """
+    templatesByDoctor = {}
+    templateRows = db.session.execute(
+        select(AvailabilityTemplate.doctor_id, AvailabilityTemplate.weekday,
+               AvailabilityTemplate.start_time, AvailabilityTemplate.end_time).where(
+            AvailabilityTemplate.doctor_id.in_(doctorIds)
+        )
+    )
+    for doctorId, weekday, startTime, endTime in templateRows:
+        templatesByDoctor.setdefault(doctorId, {}).setdefault(weekday, []).append(
+            (to_minutes(startTime), to_minutes(endTime)))
+
+    exceptionsByDay = {}
+    exceptionRows = db.session.execute(
+        select(AvailabilityException.doctor_id, AvailabilityException.date, AvailabilityException.is_available,
+               AvailabilityException.start_time, AvailabilityException.end_time).where(
+            AvailabilityException.doctor_id.in_(doctorIds),
+            AvailabilityException.date >= startDate,
+            AvailabilityException.date <= endDate
+        )
+    )
+    for doctorId, day, isAvailable, startTime, endTime in exceptionRows:
+        dayWindows = exceptionsByDay.setdefault((doctorId, day), [])
+        if not isAvailable:
+            dayWindows.append(None)  # Day off beats any custom hours
+        elif startTime and endTime:
+            dayWindows.append((to_minutes(startTime), to_minutes(endTime)))
+
+    datedByDay = {}
+    datedRows = db.session.execute(
+        select(DoctorAvailability.doctor_id, DoctorAvailability.date, DoctorAvailability.is_available,
+               DoctorAvailability.start_time, DoctorAvailability.end_time).where(
+            DoctorAvailability.doctor_id.in_(doctorIds),
+            DoctorAvailability.date >= startDate,
+            DoctorAvailability.date <= endDate
+        )
+    )
+    for doctorId, day, isAvailable, startTime, endTime in datedRows:
+        dayWindows = datedByDay.setdefault((doctorId, day), [])
+        if isAvailable:
+            dayWindows.append((to_minutes(startTime), to_minutes(endTime)))
+
+    expanded = {}
+    totalDays = (endDate - startDate).days + 1
+    for doctorId in doctorIds:
+        weeklyHours = templatesByDoctor.get(doctorId, {})
+        for i in range(totalDays):
+            day = startDate + timedelta(days=i)
+            key = (doctorId, day)
+            if key in exceptionsByDay:
+                dayWindows = exceptionsByDay[key]
+                windows, source = ([] if None in dayWindows else dayWindows), 'exception'
+            elif key in datedByDay:
+                windows, source = datedByDay[key], 'dated'
+            else:
+                windows, source = weeklyHours.get(day.weekday(), []), 'weekly'
+            expanded[key] = (sorted(w for w in windows if w[1] > w[0]), source)
+
+    return expanded
+
+
+class AvailabilityDay:
+    """One date's expanded hours, shaped like a DoctorAvailability row for templates"""
+
+    def __init__(self, day, windows, source):
+        self.date = day
+        self.windows = [(from_minutes(start), from_minutes(end)) for start, end in windows]
+        self.is_available = len(windows) > 0
+        self.start_time = self.windows[0][0] if windows else None
+        self.end_time = self.windows[-1][1] if windows else None
+        self.source = source
+
+
+class DaySchedule:
+    """Availability and bookings for one doctor on one date"""
+
+    __slots__ = ('windows', 'source', 'availableMask', 'bookings', 'bookedMask', 'freeUnits', 'loadedAt')
+
+    def __init__(self, windows, bookings, slotMinutes, loadedAt, source='dated'):
+        self.windows = sorted(windows)
+        self.source = source
+        self.availableMask = 0
+        for windowStart, windowEnd in self.windows:
+            self.availableMask |= window_mask(windowStart, windowEnd)
+        self.bookings = dict(bookings)  # appointment id -> start minute
+        self.loadedAt = loadedAt
+        self.rebuild_booked(slotMinutes)
+
+    def rebuild_booked(self, slotMinutes):
+        bookedMask = 0
+        for startMinute in self.bookings.values():
+            bookedMask |= span_mask(startMinute, startMinute + slotMinutes)
+        self.bookedMask = bookedMask
+        self.update_load()
+
+    def update_load(self):
+        # Free working time in GRANULARITY_MINUTES units, kept current on every booking change
+        self.freeUnits = (self.availableMask & ~self.bookedMask).bit_count()
+
+    def booked_mask_without(self, appointmentId, slotMinutes):
+        if appointmentId not in self.bookings:
+            return self.bookedMask
+        bookedMask = 0
+        for otherId, startMinute in self.bookings.items():
+            if otherId != appointmentId:
+                bookedMask |= span_mask(startMinute, startMinute + slotMinutes)
+        return bookedMask
+
+    def open_slots(self, slotMinutes):
+        """Start minutes of free slots, on a grid aligned to each window start"""
+        slotStarts = []
+        for windowStart, windowEnd in self.windows:
+            slotStart = windowStart
+            while slotStart + slotMinutes <= windowEnd:
+                if not self.bookedMask & span_mask(slotStart, slotStart + slotMinutes):
+                    slotStarts.append(slotStart)
+                slotStart += slotMinutes
+        return slotStarts
+
+
+class ScheduleIndex:
+    """Lazily built doctor-day bitsets, updated in place on booking changes"""
+
+    def __init__(self, ttlSeconds=300, maxDays=200000):
+        self.ttlSeconds = ttlSeconds
+        self.maxDays = maxDays
+        self.slotMinutes = DEFAULT_SLOT_MINUTES
+        self.days = {}  # (doctor_id, date) -> DaySchedule
+        self.lock = threading.Lock()
+
+    def configure(self, slotMinutes):
+        with self.lock:
+            self.slotMinutes = slotMinutes
+            self.days.clear()
+
+    def _is_fresh(self, schedule, nowTimestamp):
+        # Entries expire so other worker processes' bookings show up eventually
+        return schedule is not None and nowTimestamp - schedule.loadedAt <= self.ttlSeconds
+
+    def ensure_loaded(self, doctorIds, startDate, endDate):
+        """Load every missing doctor-day in range with a single query per table (cached)"""
+        nowTimestamp = datetime.now().timestamp()
+        totalDays = (endDate - startDate).days + 1
+        allDays = [startDate + timedelta(days=i) for i in range(totalDays)]
+
+        with self.lock:
+            missing = [(doctorId, day) for doctorId in doctorIds for day in allDays
+                       if not self._is_fresh(self.days.get((doctorId, day)), nowTimestamp)]
+        if not missing:
+            return
+
+        missingDoctors = sorted({doctorId for doctorId, day in missing})
+        firstDay = min(day for doctorId, day in missing)
+        lastDay = max(day for doctorId, day in missing)
+
+        expanded = expand_availability(missingDoctors, firstDay, lastDay)
+
+        bookingsByDay = {}
+        appointmentRows = db.session.execute(
+            select(Appointment.id, Appointment.doctor_id, Appointment.appointment_date,
+                   Appointment.appointment_time).where(
+                Appointment.doctor_id.in_(missingDoctors),
+                Appointment.appointment_date >= firstDay,
+                Appointment.appointment_date <= lastDay,
+                Appointment.status == 'Booked'
+            )
+        )
+        for appointmentId, doctorId, day, appointmentTime in appointmentRows:
+            bookingsByDay.setdefault((doctorId, day), {})[appointmentId] = to_minutes(appointmentTime)
+
+        with self.lock:
+            if len(self.days) + len(missing) > self.maxDays:
+                self.days.clear()  # Crude but bounded, days are cheap to rebuild
+            for key in missing:
+                windows, source = expanded[key]
+                self.days[key] = DaySchedule(windows, bookingsByDay.get(key, {}),
+                                             self.slotMinutes, nowTimestamp, source)
+
+    def day(self, doctorId, day):
+        self.ensure_loaded([doctorId], day, day)
+        with self.lock:
+            schedule = self.days.get((doctorId, day))
+        if schedule is None:
+            # Evicted between load and read, rebuild just this one
+            self.ensure_loaded([doctorId], day, day)
+            with self.lock:
+                schedule = self.days.get((doctorId, day))
+        return schedule
+
+    def invalidate(self, doctorId, day=None):
+        with self.lock:
+            if day is not None:
+                self.days.pop((doctorId, day), None)
+                return
+            staleKeys = [key for key in self.days if key[0] == doctorId]
+            for key in staleKeys:
+                del self.days[key]
+
+    def clear(self):
+        with self.lock:
+            self.days.clear()
+
+    def remove_booking(self, doctorId, day, appointmentId):
+        with self.lock:
+            schedule = self.days.get((doctorId, day))
+            if schedule is not None and schedule.bookings.pop(appointmentId, None) is not None:
+                schedule.rebuild_booked(self.slotMinutes)
+
+    def add_booking(self, doctorId, day, appointmentId, startMinute):
+        with self.lock:
+            schedule = self.days.get((doctorId, day))
+            if schedule is not None:
+                schedule.bookings[appointmentId] = startMinute
+                schedule.bookedMask |= span_mask(startMinute, startMinute + self.slotMinutes)
+                schedule.update_load()
+
+
+scheduleIndex = ScheduleIndex()
+
+
+def booking_problem(doctorId, day, startTime, ignoreAppointmentId=None):
+    """Check a proposed booking against the schedule index
+
+    Returns None when the slot can be booked, otherwise a tuple of
+    (reason, detail) where reason is 'unavailable', 'outside_hours' (detail
+    is the earliest and latest allowed start time) or 'conflict'.
+    """
+    schedule = scheduleIndex.day(doctorId, day)
+    slotMinutes = scheduleIndex.slotMinutes
+
+    if not schedule.windows:
+        return 'unavailable', None
+
+    startMinute = to_minutes(startTime)
+    neededMask = span_mask(startMinute, startMinute + slotMinutes)
+    if neededMask & schedule.availableMask != neededMask:
+        earliestStart = from_minutes(schedule.windows[0][0])
+        latestStart = from_minutes(max(schedule.windows[-1][1] - slotMinutes, schedule.windows[-1][0]))
+        return 'outside_hours', (earliestStart, latestStart)
+
+    if neededMask & schedule.booked_mask_without(ignoreAppointmentId, slotMinutes):
+        return 'conflict', None
+
+    return None
+
+
+def recheck_bookings(requestedSlots, ignoreAppointmentId=None):
+    """Check (doctor_id, date, time) slots against the 'Booked' rows in the database
+
+    The schedule index is only a fast pre-filter: another worker process's
+    bookings reach it when its entries expire. Writers call this in their
+    own session right before the INSERT/UPDATE. Returns a list of None /
+    ('conflict', None) aligned with requestedSlots; index days that turn out
+    stale are dropped so they reload. Two requests racing past this check
+    for the same start time are stopped by uq_appointments_booked_slot.
+    """
+    if not requestedSlots:
+        return []
+
+    slotMinutes = scheduleIndex.slotMinutes
+    doctorIds = {doctorId for doctorId, day, startTime in requestedSlots}
+    allDays = {day for doctorId, day, startTime in requestedSlots}
+    bookedQuery = select(Appointment.doctor_id, Appointment.appointment_date, Appointment.appointment_time).where(
+        Appointment.doctor_id.in_(doctorIds),
+        Appointment.appointment_date.in_(allDays),
+        Appointment.status == 'Booked'
+    )
+    if ignoreAppointmentId is not None:
+        bookedQuery = bookedQuery.where(Appointment.id != ignoreAppointmentId)
+
+    bookedStarts = {}  # (doctor_id, date) -> [start minute, ...]
+    for doctorId, day, appointmentTime in db.session.execute(bookedQuery):
+        bookedStarts.setdefault((doctorId, day), []).append(to_minutes(appointmentTime))
+
+    problems = []
+    for doctorId, day, startTime in requestedSlots:
+        startMinute = to_minutes(startTime)
+        if any(abs(startMinute - otherStart) < slotMinutes for otherStart in bookedStarts.get((doctorId, day), [])):
+            scheduleIndex.invalidate(doctorId, day)
+            problems.append(('conflict', None))
+        else:
+            problems.append(None)
+    return problems
+
+
+def recheck_booking(doctorId, day, startTime, ignoreAppointmentId=None):
+    """recheck_bookings for a single slot"""
+    return recheck_bookings([(doctorId, day, startTime)], ignoreAppointmentId)[0]
+
+
+def batch_booking_problems(requestedSlots):
+    """Check many (doctor_id, date, time) bookings at once
+
+    Every doctor-day involved is loaded together, then each slot is checked
+    like booking_problem. Slots that pass claim their time, so a later slot
+    overlapping an earlier one in the same batch comes back as a conflict.
+    Returns a list of None / (reason, detail) aligned with requestedSlots.
+    """
+    if not requestedSlots:
+        return []
+
+    doctorIds = sorted({doctorId for doctorId, day, startTime in requestedSlots})
+    allDays = [day for doctorId, day, startTime in requestedSlots]
+    scheduleIndex.ensure_loaded(doctorIds, min(allDays), max(allDays))
+    slotMinutes = scheduleIndex.slotMinutes
+
+    claimedMasks = {}  # (doctor_id, date) -> bits taken by earlier slots in this batch
+    problems = []
+    for doctorId, day, startTime in requestedSlots:
+        problem = booking_problem(doctorId, day, startTime)
+        if problem is None:
+            startMinute = to_minutes(startTime)
+            neededMask = span_mask(startMinute, startMinute + slotMinutes)
+            if claimedMasks.get((doctorId, day), 0) & neededMask:
+                problem = ('conflict', None)
+            else:
+                claimedMasks[(doctorId, day)] = claimedMasks.get((doctorId, day), 0) | neededMask
+        problems.append(problem)
+    return problems
+
+
+def availability_days(doctorIds, startDate, endDate, includeClosed=False):
+    """Expanded working hours as {doctor_id: [AvailabilityDay, ...]} sorted by date"""
+    scheduleIndex.ensure_loaded(doctorIds, startDate, endDate)
+    totalDays = (endDate - startDate).days + 1
+
+    result = {}
+    for doctorId in doctorIds:
+        result[doctorId] = []
+        for i in range(totalDays):
+            day = startDate + timedelta(days=i)
+            schedule = scheduleIndex.day(doctorId, day)
+            if schedule.windows or includeClosed:
+                result[doctorId].append(AvailabilityDay(day, schedule.windows, schedule.source))
+    return result
+
+
+def pick_department_slot(doctorIds, day, strategy='capacity', slotMinutes=None):
+    """Choose a doctor and time on one date for a department booking
+
+    'capacity' picks the doctor with the most free time left that day (from
+    the per-day load counters), 'earliest' the earliest open slot; each uses
+    the other as tie-breaker. Returns (doctor_id, time) or None.
+    """
+    if not doctorIds:
+        return None
+    slotsByDoctor = free_slots(doctorIds, day, day, slotMinutes)
+
+    candidates = []
+    for doctorId in doctorIds:
+        daySlots = slotsByDoctor[doctorId][day]
+        if not daySlots:
+            continue
+        freeUnits = scheduleIndex.day(doctorId, day).freeUnits
+        if strategy == 'earliest':
+            candidates.append(((daySlots[0], -freeUnits, doctorId), doctorId, daySlots[0]))
+        else:
+            candidates.append(((-freeUnits, daySlots[0], doctorId), doctorId, daySlots[0]))
+
+    if not candidates:
+        return None
+    sortKey, doctorId, slotTime = min(candidates)
+    return doctorId, slotTime
+
+
+def department_doctor_ids(departmentId):
+    """Active doctors of a department"""
+    from models import Doctor, User
+    return list(db.session.execute(
+        select(Doctor.id).join(User, User.id == Doctor.user_id).where(
+            Doctor.department_id == departmentId,
+            User.is_active == True
+        ).order_by(Doctor.id)
+    ).scalars())
+
+
+def free_slots(doctorIds, startDate, endDate, slotMinutes=None):
+    """Open slots as {doctor_id: {date: [time, ...]}} for every day in range
+
+    Missing doctor-days are loaded into the schedule index together (one
+    query per table); after that everything is answered from the bitsets.
+    Slots already in the past are left out.
+    """
+    slotMinutes = slotMinutes or slot_minutes_setting()
+    scheduleIndex.ensure_loaded(doctorIds, startDate, endDate)
+
+    currentTime = datetime.now()
+    todayDate = currentTime.date()
+    nowMinutes = currentTime.hour * 60 + currentTime.minute
+    totalDays = (endDate - startDate).days + 1
+
+    result = {}
+    for doctorId in doctorIds:
+        result[doctorId] = {}
+        for i in range(totalDays):
+            day = startDate + timedelta(days=i)
+            slotStarts = []
+            if day >= todayDate:
+                slotStarts = scheduleIndex.day(doctorId, day).open_slots(slotMinutes)
+            if day == todayDate:
+                slotStarts = [start for start in slotStarts if start >= nowMinutes]
+            result[doctorId][day] = [from_minutes(start) for start in slotStarts]
+
+    return result
+
+
+def _slot_stream(doctorId, slotsByDay):
+    """Yield (date, time, doctor_id) for one doctor in chronological order"""
+    for day in sorted(slotsByDay):
+        for slot in slotsByDay[day]:
+            yield day, slot, doctorId
+
+
+def earliest_slots(doctorIds, startDate, endDate, limit, slotMinutes=None):
+    """Earliest open slots across several doctors as (date, time, doctor_id)
+
+    Each doctor's slots already come out sorted, so a heap merge of the
+    per-doctor streams gives the global order without sorting everything.
+    """
+    if not doctorIds:
+        return []
+    slotsByDoctor = free_slots(doctorIds, startDate, endDate, slotMinutes)
+    slotStreams = [_slot_stream(doctorId, days) for doctorId, days in slotsByDoctor.items()]
+    return list(islice(heapq.merge(*slotStreams), limit))
+
+
+def occupancy(doctorIds, startDate, endDate):
+    """Available vs booked minutes per doctor over a date range"""
+    scheduleIndex.ensure_loaded(doctorIds, startDate, endDate)
+    totalDays = (endDate - startDate).days + 1
+
+    report = {}
+    for doctorId in doctorIds:
+        availableUnits = 0
+        bookedUnits = 0
+        bookingCount = 0
+        for i in range(totalDays):
+            schedule = scheduleIndex.day(doctorId, startDate + timedelta(days=i))
+            availableUnits += schedule.availableMask.bit_count()
+            bookedUnits += (schedule.bookedMask & schedule.availableMask).bit_count()
+            bookingCount += len(schedule.bookings)
+
+        report[doctorId] = {
+            'available_minutes': availableUnits * GRANULARITY_MINUTES,
+            'booked_minutes': bookedUnits * GRANULARITY_MINUTES,
+            'appointments': bookingCount,
+            'occupancy_rate': round(bookedUnits / availableUnits, 4) if availableUnits else 0.0
+        }
+    return report
+
+
+def _on_appointment_change(changes):
+    """Apply committed bookings, cancellations and reschedules to loaded days"""
+    for change in changes:
+        values = change['values']
+        previousValues = dict(values)
+        previousValues.update(change['old'])
+
+        requiredKeys = ('doctor_id', 'appointment_date', 'appointment_time', 'status')
+        if not all(key in values for key in requiredKeys):
+            # Partially loaded row, just rebuild the doctor's days on next use
+            scheduleIndex.invalidate(values.get('doctor_id', previousValues.get('doctor_id')))
+            continue
+
+        scheduleIndex.remove_booking(previousValues['doctor_id'], previousValues['appointment_date'], change['id'])
+        if change['action'] != 'delete' and values['status'] == 'Booked':
+            scheduleIndex.add_booking(values['doctor_id'], values['appointment_date'], change['id'],
+                                      to_minutes(values['appointment_time']))
+
+
+def _on_availability_change(changes):
+    for change in changes:
+        previousValues = dict(change['values'])
+        previousValues.update(change['old'])
+        for values in (change['values'], previousValues):
+            scheduleIndex.invalidate(values.get('doctor_id'), values.get('date'))
+
+
+def _on_template_change(changes):
+    """A weekly template affects every date of that doctor"""
+    for change in changes:
+        scheduleIndex.invalidate(change['values'].get('doctor_id', change['old'].get('doctor_id')))
+
+
+def register_schedule_listeners():
+    from events import on_commit
+    scheduleIndex.configure(slot_minutes_setting())
+    on_commit(Appointment, _on_appointment_change)
+    on_commit(DoctorAvailability, _on_availability_change)
+    on_commit(AvailabilityException, _on_availability_change)
+    on_commit(AvailabilityTemplate, _on_template_change)
@@ -0,0 +1,331 @@
+from extensions import db
+from flask import current_app
+from sqlalchemy import or_, false, func, select, table, column, literal_column, text
+from sqlalchemy.exc import OperationalError
+from bisect import bisect_left, insort
+import re
+import threading
+
+# Full-text search over doctors and patients
+# SQLite FTS5 external-content tables mirror the searchable columns and are
+# kept in sync by triggers, so every writer (ORM, raw SQL, bulk loads) is covered.
+
+# Searchable columns per table with their bm25 weights (name matters most)
+SEARCH_COLUMNS = {
+    'doctors': [('full_name', 10.0), ('specialization', 4.0), ('phone', 1.0)],
+    'patients': [('full_name', 10.0), ('phone', 1.0)],
+}
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def _fts_statements(tableName):
+    """Build the DDL for one FTS table and its sync triggers"""
+    ftsName = f'{tableName}_fts'
+    columnNames = [name for name, weight in SEARCH_COLUMNS[tableName]]
+    columnList = ', '.join(columnNames)
+    newValues = ', '.join(f'new.{name}' for name in columnNames)
+    oldValues = ', '.join(f'old.{name}' for name in columnNames)
+
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {ftsName} USING fts5("
+        f"{columnList}, content='{tableName}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')",
+
+        f"CREATE TRIGGER IF NOT EXISTS {ftsName}_ai AFTER INSERT ON {tableName} BEGIN "
+        f"INSERT INTO {ftsName}(rowid, {columnList}) VALUES (new.id, {newValues}); END",
+
+        f"CREATE TRIGGER IF NOT EXISTS {ftsName}_ad AFTER DELETE ON {tableName} BEGIN "
+        f"INSERT INTO {ftsName}({ftsName}, rowid, {columnList}) VALUES ('delete', old.id, {oldValues}); END",
+
+        f"CREATE TRIGGER IF NOT EXISTS {ftsName}_au AFTER UPDATE OF {columnList} ON {tableName} BEGIN "
+        f"INSERT INTO {ftsName}({ftsName}, rowid, {columnList}) VALUES ('delete', old.id, {oldValues}); "
+        f"INSERT INTO {ftsName}(rowid, {columnList}) VALUES (new.id, {newValues}); END",
+    ]
+
+
+def install_fts(engine):
+    """Create FTS tables and triggers on engine, returns False if FTS5 is unavailable"""
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    try:
+        with engine.begin() as conn:
+            for tableName in SEARCH_COLUMNS:
+                ftsName = f'{tableName}_fts'
+                alreadyThere = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {'name': ftsName}
+                ).first()
+
+                for statement in _fts_statements(tableName):
+                    conn.exec_driver_sql(statement)
+
+                # Index rows that existed before the FTS table did
+                if alreadyThere is None:
+                    conn.exec_driver_sql(f"INSERT INTO {ftsName}({ftsName}) VALUES ('rebuild')")
+    except OperationalError as e:
+        print(f"Full-text search disabled: {e}")
+        return False
+
+    return True
+
+
+def setup_full_text_search():
+    """Install the FTS index for the current app (call inside app context)"""
+    isEnabled = install_fts(db.engine)
+    current_app.config['SEARCH_FTS_ENABLED'] = isEnabled
+    return isEnabled
+
+
+def build_match_expression(term):
+    """Turn free text into an FTS5 query: every token must match, as a prefix"""
+    tokens = TOKEN_PATTERN.findall(term.lower())
+    if not tokens:
+        return None
+
+    # Quote each token so FTS operators typed by users are treated as text
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def ranked_matches(tableName, term):
+    """Subquery of (id, rank) for rows matching term, best match has lowest rank"""
+    matchExpression = build_match_expression(term)
+    if matchExpression is None:
+        return None
+
+    ftsName = f'{tableName}_fts'
+    ftsTable = table(ftsName, column('rowid'))
+    weights = [weight for name, weight in SEARCH_COLUMNS[tableName]]
+
+    return select(
+        ftsTable.c.rowid.label('id'),
+        func.bm25(literal_column(ftsName), *weights).label('rank')
+    ).where(
+        literal_column(ftsName).op('MATCH')(matchExpression)
+    ).subquery()
+
+
+def apply_search(query, model, term, extraCriteria=None):
+    """Filter and rank an ORM query on model by the search term
+
+    extraCriteria are OR-ed with the text match (e.g. exact ID lookups).
+    Falls back to ILIKE scans when FTS5 is not available.
+    """
+    tableName = model.__tablename__
+    extraCriteria = extraCriteria or []
+
+    if not current_app.config.get('SEARCH_FTS_ENABLED'):
+        likeFilters = [getattr(model, name).ilike(f'%{term}%') for name, weight in SEARCH_COLUMNS[tableName]]
+        return query.filter(or_(*likeFilters, *extraCriteria))
+
+    ranked = ranked_matches(tableName, term)
+    if ranked is None:
+        return query.filter(or_(false(), *extraCriteria))
+
+    if extraCriteria:
+        query = query.outerjoin(ranked, model.id == ranked.c.id)
+        query = query.filter(or_(ranked.c.id.isnot(None), *extraCriteria))
+    else:
+        query = query.join(ranked, model.id == ranked.c.id)
+
+    return query.order_by(ranked.c.rank)
+
+
+# Typeahead autocomplete
+# An in-process sorted array of (key, id) pairs per entity type. A prefix
+# lookup is one bisect plus a short forward scan, so it never touches the DB.
+
+class PrefixIndex:
+    """Sorted-array prefix index with incremental add/remove"""
+
+    def __init__(self):
+        self.entries = []       # sorted list of (key, id)
+        self.records = {}       # id -> payload returned to clients
+        self.keysById = {}      # id -> keys currently indexed for that id
+        self.lock = threading.Lock()
+
+    def load(self, items):
+        """Replace the whole index from (id, record, keys) tuples"""
+        entries = []
+        records = {}
+        keysById = {}
+        for itemId, record, keys in items:
+            records[itemId] = record
+            keysById[itemId] = keys
+            for key in keys:
+                entries.append((key, itemId))
+        entries.sort()
+
+        with self.lock:
+            self.entries = entries
+            self.records = records
+            self.keysById = keysById
+
+    def add(self, itemId, record, keys):
+        with self.lock:
+            self._remove_locked(itemId)
+            self.records[itemId] = record
+            self.keysById[itemId] = keys
+            for key in keys:
+                insort(self.entries, (key, itemId))
+
+    def remove(self, itemId):
+        with self.lock:
+            self._remove_locked(itemId)
+
+    def _remove_locked(self, itemId):
+        for key in self.keysById.pop(itemId, []):
+            position = bisect_left(self.entries, (key, itemId))
+            if position < len(self.entries) and self.entries[position] == (key, itemId):
+                del self.entries[position]
+        self.records.pop(itemId, None)
+
+    def __contains__(self, itemId):
+        return itemId in self.records
+
+    def search(self, prefix, limit=10):
+        """Return up to limit records having a key that starts with prefix"""
+        prefix = normalize_key(prefix)
+        if not prefix:
+            return []
+
+        results = []
+        seenIds = set()
+        with self.lock:
+            position = bisect_left(self.entries, (prefix,))
+            while position < len(self.entries) and len(results) < limit:
+                key, itemId = self.entries[position]
+                if not key.startswith(prefix):
+                    break
+                if itemId not in seenIds:
+                    seenIds.add(itemId)
+                    results.append(self.records[itemId])
+                position += 1
+
+        return results
+
+
+def normalize_key(value):
+    return ' '.join(TOKEN_PATTERN.findall((value or '').lower()))
+
+
+def _index_keys(fullName, phone, extra=None):
+    """Keys are the full name, each later name token, the phone and extras"""
+    keys = set()
+    normalizedName = normalize_key(fullName)
+    if normalizedName:
+        keys.add(normalizedName)
+        nameTokens = normalizedName.split(' ')
+        for i in range(1, len(nameTokens)):
+            keys.add(' '.join(nameTokens[i:]))
+    if phone:
+        keys.add(normalize_key(phone))
+    if extra:
+        keys.add(normalize_key(extra))
+    keys.discard('')
+    return sorted(keys)
+
+
+def _patient_entry(row):
+    record = {'id': row['id'], 'full_name': row['full_name'], 'phone': row['phone']}
+    return row['id'], record, _index_keys(row['full_name'], row['phone'])
+
+
+def _doctor_entry(row):
+    record = {
+        'id': row['id'],
+        'full_name': row['full_name'],
+        'specialization': row['specialization'],
+        'department_id': row['department_id']
+    }
+    return row['id'], record, _index_keys(row['full_name'], row['phone'], row['specialization'])
+
+
+autocompleteIndexes = {
+    'patients': PrefixIndex(),
+    'doctors': PrefixIndex(),
+}
+
+_AUTOCOMPLETE_SOURCES = {
+    'patients': _patient_entry,
+    'doctors': _doctor_entry,
+}
+
+
+def _autocomplete_model(indexName):
+    from models import Patient, Doctor
+    return {'patients': Patient, 'doctors': Doctor}[indexName]
+
+
+def _load_rows(model, extraCriteria=None):
+    """Fetch only the columns the index needs, for active accounts
+
+    Uses its own connection because it also runs from after-commit hooks,
+    where the session cannot emit SQL.
+    """
+    from models import User
+    indexColumns = [model.id, model.full_name, model.phone]
+    if model.__tablename__ == 'doctors':
+        indexColumns += [model.specialization, model.department_id]
+
+    query = select(*indexColumns).join(User, User.id == model.user_id).where(User.is_active == True)
+    if extraCriteria is not None:
+        query = query.where(extraCriteria)
+    with db.engine.connect() as conn:
+        return [dict(row._mapping) for row in conn.execute(query)]
+
+
+def warm_autocomplete():
+    """Build both autocomplete indexes from the database (call inside app context)"""
+    for indexName, makeEntry in _AUTOCOMPLETE_SOURCES.items():
+        rows = _load_rows(_autocomplete_model(indexName))
+        autocompleteIndexes[indexName].load(makeEntry(row) for row in rows)
+
+
+def _refresh_entries(indexName, ids):
+    """Re-read the given rows and update the index (drops inactive ones)"""
+    if not ids:
+        return
+    model = _autocomplete_model(indexName)
+    activeRows = {row['id']: row for row in _load_rows(model, model.id.in_(ids))}
+    index = autocompleteIndexes[indexName]
+    for itemId in ids:
+        if itemId in activeRows:
+            index.add(*_AUTOCOMPLETE_SOURCES[indexName](activeRows[itemId]))
+        else:
+            index.remove(itemId)
+
+
+def _on_profile_change(indexName):
+    def handle_changes(changes):
+        index = autocompleteIndexes[indexName]
+        changedIds = []
+        for change in changes:
+            if change['action'] == 'delete':
+                index.remove(change['id'])
+            else:
+                changedIds.append(change['id'])
+        _refresh_entries(indexName, changedIds)
+    handle_changes.__name__ = f'autocomplete_{indexName}_changed'
+    return handle_changes
+
+
+def _on_user_change(changes):
+    """Deactivation/reactivation adds or drops the linked profile"""
+    from models import Patient, Doctor
+    userIds = [change['id'] for change in changes if 'is_active' in change['old']]
+    if not userIds:
+        return
+    for indexName, model in (('patients', Patient), ('doctors', Doctor)):
+        with db.engine.connect() as conn:
+            profileIds = [row[0] for row in conn.execute(select(model.id).where(model.user_id.in_(userIds)))]
+        _refresh_entries(indexName, profileIds)
+
+
+def register_autocomplete_listeners():
+    from events import on_commit
+    from models import Patient, Doctor, User
+    on_commit(Patient, _on_profile_change('patients'))
+    on_commit(Doctor, _on_profile_change('doctors'))
+    on_commit(User, _on_user_change)
@@ -0,0 +1,229 @@
+from extensions import db
+from models import Doctor, Patient, Appointment, Department, User, Treatment, Job
+import json
+
+# API serializers
+# A serializer is a list of (output key, column, converter) specs compiled
+# once, at import time, into a plain function that turns a row tuple into a
+# dict. The columns are selected directly, so rows come back as tuples from
+# one joined query - no ORM instances, no lazy loads, no attribute walks.
+# Dotted keys ('patient.name') become nested dicts.
+
+
+def iso_date(value):
+    return value.isoformat()
+
+
+def iso_datetime(value):
+    return value.isoformat()
+
+
+def json_value(value):
+    return json.loads(value)
+
+
+def hhmm(value):
+    return f'{value.hour:02d}:{value.minute:02d}'  # Same as strftime('%H:%M'), much cheaper
+
+
+class Serializer:
+    """Compiled row -> dict function plus the columns and joins it reads from"""
+
+    def __init__(self, name, base, fields, joins=()):
+        self.name = name
+        self.base = base
+        self.fields = fields
+        self.joins = joins  # (model, onclause, isOuter)
+        self.columns = [column for key, column, converter in fields]
+        self.keys = [key for key, column, converter in fields]
+        self.row_to_dict = _compile(name, fields)
+        self.sparseVersions = {}  # tuple of field specs -> pruned Serializer
+
+    def only(self, requestedKeys):
+        """Serializer for a subset of the fields, columns pruned from the SELECT too
+
+        A key selects itself, a prefix selects a nested group ('patient' ->
+        'patient.id', 'patient.name', ...). 'id' is always included. Raises
+        ValueError for keys the serializer doesn't have.
+        """
+        requestedKeys = set(requestedKeys) | {'id'}
+        unknownKeys = [key for key in requestedKeys
+                       if not any(field == key or field.startswith(key + '.') for field in self.keys)]
+        if unknownKeys:
+            raise ValueError(f"Unknown field(s): {', '.join(sorted(unknownKeys))}. "
+                             f"Available: {', '.join(self.keys)}")
+
+        selectedFields = tuple(spec for spec in self.fields
+                               if spec[0] in requestedKeys or spec[0].split('.')[0] in requestedKeys)
+        sparseSerializer = self.sparseVersions.get(selectedFields)
+        if sparseSerializer is None:
+            sparseSerializer = Serializer(f'{self.name}_sparse', self.base, list(selectedFields), self.joins)
+            self.sparseVersions[selectedFields] = sparseSerializer
+        return sparseSerializer
+
+    def select(self):
+        """SELECT of exactly these columns with the joins they need"""
+        statement = db.select(*self.columns).select_from(self.base)
+        for model, onclause, isOuter in self.joins:
+            statement = statement.join(model, onclause, isouter=isOuter)
+        return statement
+
+    def all(self, statement):
+        """Run a statement built from select() and serialize every row"""
+        row_to_dict = self.row_to_dict
+        return [row_to_dict(row) for row in db.session.execute(statement)]
+
+    def first(self, statement):
+        row = db.session.execute(statement).first()
+        return self.row_to_dict(row) if row is not None else None
+
+
+def _compile(name, fields):
+    """Generate the source of a dict literal for the specs and exec it once"""
+    namespace = {}
+    tree = {}  # nested key -> expression source, insertion ordered
+    for position, (key, column, converter) in enumerate(fields):
+        expression = f'row[{position}]'
+        if converter is not None:
+            converterName = f'convert_{position}'
+            namespace[converterName] = converter
+            expression = f'({converterName}({expression}) if {expression} is not None else None)'
+        node = tree
+        parts = key.split('.')
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = expression
+
+    def render(node):
+        return '{' + ', '.join(f'{key!r}: {render(value) if isinstance(value, dict) else value}'
+                               for key, value in node.items()) + '}'
+
+    source = f'def {name}(row):\n    return {render(tree)}\n'
+    exec(compile(source, f'<serializer {name}>', 'exec'), namespace)
+    return namespace[name]
+
+
+def sparse(serializer, fieldsParam):
+    """Serializer for a ?fields=a,b,c query parameter (all fields when empty)"""
+    requestedKeys = [key.strip() for key in (fieldsParam or '').split(',') if key.strip()]
+    if not requestedKeys:
+        return serializer
+    return serializer.only(requestedKeys)
+
+
+# Doctors
+_doctorJoins = (
+    (Department, Department.id == Doctor.department_id, False),
+    (User, User.id == Doctor.user_id, False),
+)
+
+DOCTOR_SUMMARY = Serializer('doctor_summary', Doctor, [
+    ('id', Doctor.id, None),
+    ('full_name', Doctor.full_name, None),
+    ('specialization', Doctor.specialization, None),
+    ('department', Department.name, None),
+    ('phone', Doctor.phone, None),
+    ('qualification', Doctor.qualification, None),
+    ('experience_years', Doctor.experience_years, None),
+    ('consultation_fee', Doctor.consultation_fee, None),
+], joins=_doctorJoins)
+
+DOCTOR_DETAIL = Serializer('doctor_detail', Doctor, [
+    ('id', Doctor.id, None),
+    ('full_name', Doctor.full_name, None),
+    ('specialization', Doctor.specialization, None),
+    ('department', Department.name, None),
+    ('department_id', Doctor.department_id, None),
+    ('phone', Doctor.phone, None),
+    ('qualification', Doctor.qualification, None),
+    ('experience_years', Doctor.experience_years, None),
+    ('consultation_fee', Doctor.consultation_fee, None),
+    ('email', User.email, None),
+], joins=_doctorJoins)
+
+# Patients - medical_history and address stay in the database
+PATIENT_SUMMARY = Serializer('patient_summary', Patient, [
+    ('id', Patient.id, None),
+    ('full_name', Patient.full_name, None),
+    ('phone', Patient.phone, None),
+    ('email', User.email, None),
+    ('gender', Patient.gender, None),
+    ('blood_group', Patient.blood_group, None),
+    ('date_of_birth', Patient.date_of_birth, iso_date),
+], joins=((User, User.id == Patient.user_id, False),))
+
+PATIENT_DETAIL = Serializer('patient_detail', Patient, [
+    ('id', Patient.id, None),
+    ('full_name', Patient.full_name, None),
+    ('phone', Patient.phone, None),
+    ('email', User.email, None),
+    ('date_of_birth', Patient.date_of_birth, iso_date),
+    ('gender', Patient.gender, None),
+    ('address', Patient.address, None),
+    ('blood_group', Patient.blood_group, None),
+    ('emergency_contact', Patient.emergency_contact, None),
+    ('medical_history', Patient.medical_history, None),
+], joins=((User, User.id == Patient.user_id, False),))
+
+# Appointments
+_appointmentJoins = (
+    (Patient, Patient.id == Appointment.patient_id, False),
+    (Doctor, Doctor.id == Appointment.doctor_id, False),
+)
+
+APPOINTMENT_SUMMARY = Serializer('appointment_summary', Appointment, [
+    ('id', Appointment.id, None),
+    ('patient_name', Patient.full_name, None),
+    ('doctor_name', Doctor.full_name, None),
+    ('appointment_date', Appointment.appointment_date, iso_date),
+    ('appointment_time', Appointment.appointment_time, hhmm),
+    ('status', Appointment.status, None),
+    ('reason', Appointment.reason, None),
+], joins=_appointmentJoins)
+
+APPOINTMENT_DETAIL = Serializer('appointment_detail', Appointment, [
+    ('id', Appointment.id, None),
+    ('patient.id', Patient.id, None),
+    ('patient.name', Patient.full_name, None),
+    ('patient.phone', Patient.phone, None),
+    ('doctor.id', Doctor.id, None),
+    ('doctor.name', Doctor.full_name, None),
+    ('doctor.specialization', Doctor.specialization, None),
+    ('appointment_date', Appointment.appointment_date, iso_date),
+    ('appointment_time', Appointment.appointment_time, hhmm),
+    ('status', Appointment.status, None),
+    ('reason', Appointment.reason, None),
+    ('created_at', Appointment.created_at, iso_datetime),
+], joins=_appointmentJoins)
+
+# Works on any (id, date, time) tuple, e.g. a just-created appointment
+APPOINTMENT_CREATED = Serializer('appointment_created', Appointment, [
+    ('id', Appointment.id, None),
+    ('appointment_date', Appointment.appointment_date, iso_date),
+    ('appointment_time', Appointment.appointment_time, hhmm),
+])
+
+TREATMENT_DETAIL = Serializer('treatment_detail', Treatment, [
+    ('diagnosis', Treatment.diagnosis, None),
+    ('prescription', Treatment.prescription, None),
+    ('notes', Treatment.notes, None),
+    ('follow_up_date', Treatment.follow_up_date, iso_date),
+])
+
+# Background jobs (jobs.py)
+JOB_DETAIL = Serializer('job_detail', Job, [
+    ('id', Job.id, None),
+    ('name', Job.name, None),
+    ('status', Job.status, None),
+    ('priority', Job.priority, None),
+    ('attempts', Job.attempts, None),
+    ('max_attempts', Job.max_attempts, None),
+    ('payload', Job.payload, json_value),
+    ('result', Job.result, json_value),
+    ('last_error', Job.last_error, None),
+    ('run_at', Job.run_at, iso_datetime),
+    ('created_by', Job.created_by, None),
+    ('created_at', Job.created_at, iso_datetime),
+    ('started_at', Job.started_at, iso_datetime),
+    ('finished_at', Job.finished_at, iso_datetime),
+])
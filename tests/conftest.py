@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app():
+    """App on a throwaway SQLite file, no background workers"""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+    os.environ['JOB_WORKERS'] = '0'
+    from app import create_app
+    flaskApp = create_app()
+    flaskApp.config['TESTING'] = True
+    return flaskApp
+
+
+@pytest.fixture
+def db(app):
+    """App context with the appointment/notification tables emptied afterwards"""
+    from extensions import db as database
+    from models import (Appointment, Treatment, ArchivedAppointment, ArchivedTreatment, Notification,
+                        WaitlistEntry)
+    from scheduling import scheduleIndex
+    from dashboards import partCache
+
+    with app.app_context():
+        yield database
+        database.session.rollback()
+        for modelClass in (Notification, WaitlistEntry, ArchivedTreatment, ArchivedAppointment,
+                           Treatment, Appointment):
+            database.session.query(modelClass).delete()
+        database.session.commit()
+        scheduleIndex.clear()
+        partCache.clear()
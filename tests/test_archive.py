@@ -0,0 +1,40 @@
+from datetime import date, time, timedelta
+from models import Appointment, Treatment, ArchivedAppointment, ArchivedTreatment, Doctor, Patient
+from archive import archive_old_appointments, appointment_history
+
+
+def add_completed(db, day, diagnosis='Checked'):
+    appointment = Appointment(patient_id=Patient.query.first().id, doctor_id=Doctor.query.first().id,
+                              appointment_date=day, appointment_time=time(9, 0), status='Completed')
+    db.session.add(appointment)
+    db.session.flush()
+    db.session.add(Treatment(appointment_id=appointment.id, diagnosis=diagnosis))
+    db.session.commit()
+    return appointment.id
+
+
+def test_archived_ids_are_not_reused(db):
+    oldDay = date.today() - timedelta(days=800)
+    firstId = add_completed(db, oldDay)
+    assert archive_old_appointments(365)['appointments'] == 1
+
+    # The highest id is gone from appointments - it must not be handed out again
+    secondId = add_completed(db, oldDay + timedelta(days=1))
+    assert secondId != firstId
+    summary = archive_old_appointments(365)
+    assert summary['appointments'] == 1
+    assert summary['treatments'] == 1
+
+    assert sorted(row.id for row in ArchivedAppointment.query) == sorted([firstId, secondId])
+    assert ArchivedTreatment.query.count() == 2
+    assert Appointment.query.count() == 0
+
+
+def test_history_reads_hot_and_archived(db):
+    oldId = add_completed(db, date.today() - timedelta(days=800), 'Old')
+    archive_old_appointments(365)
+    recentId = add_completed(db, date.today() - timedelta(days=2), 'Recent')
+
+    history = appointment_history(patientId=Patient.query.first().id, status='Completed')
+    assert [appointment.id for appointment in history] == [recentId, oldId]
+    assert [appointment.treatment.diagnosis for appointment in history] == ['Recent', 'Old']
@@ -0,0 +1,47 @@
+from datetime import date, timedelta
+from models import Appointment, Doctor, Patient
+from scheduling import free_slots
+import routes.api
+
+
+def race_setup(db, monkeypatch, app):
+    """Two free slots, the first already taken behind the pre-checks' back"""
+    doctor = Doctor.query.first()
+    patient, otherPatient = Patient.query.order_by(Patient.id).limit(2).all()
+    day = date.today() + timedelta(days=2)
+    while len(free_slots([doctor.id], day, day)[doctor.id].get(day, [])) < 2:
+        day += timedelta(days=1)
+    takenSlot, freeSlot = free_slots([doctor.id], day, day)[doctor.id][day][:2]
+    db.session.add(Appointment(patient_id=otherPatient.id, doctor_id=doctor.id, appointment_date=day,
+                               appointment_time=takenSlot, status='Booked'))
+    db.session.commit()
+
+    # The racing booking landed after both checks ran
+    monkeypatch.setattr(routes.api, 'batch_booking_problems', lambda slots: [None] * len(slots))
+    monkeypatch.setattr(routes.api, 'recheck_bookings', lambda slots: [None] * len(slots))
+
+    client = app.test_client()
+    client.post('/login', data={'username': patient.user.username, 'password': 'patient123'})
+    items = [{'doctor_id': doctor.id, 'appointment_date': day.isoformat(), 'appointment_time': slot.strftime('%H:%M')}
+             for slot in (takenSlot, freeSlot)]
+    return client, items, patient
+
+
+def test_best_effort_batch_keeps_items_that_did_not_collide(db, monkeypatch, app):
+    client, items, patient = race_setup(db, monkeypatch, app)
+    response = client.post('/api/appointments/batch', json={'mode': 'best_effort', 'appointments': items})
+
+    body = response.get_json()
+    assert response.status_code == 201 and body['booked'] == 1
+    assert [result['success'] for result in body['results']] == [False, True]
+    assert Appointment.query.filter_by(patient_id=patient.id).count() == 1
+
+
+def test_atomic_batch_rolls_back_on_a_collision(db, monkeypatch, app):
+    client, items, patient = race_setup(db, monkeypatch, app)
+    response = client.post('/api/appointments/batch', json={'mode': 'atomic', 'appointments': items})
+
+    body = response.get_json()
+    assert response.status_code == 409 and body['booked'] == 0
+    assert [result['success'] for result in body['results']] == [False, False]
+    assert Appointment.query.filter_by(patient_id=patient.id).count() == 0
@@ -0,0 +1,49 @@
+from models import Department
+from events import on_commit
+
+seenNames = []
+on_commit(Department, lambda changes: seenNames.extend(change['values']['name'] for change in changes))
+
+
+def test_rolled_back_savepoint_is_not_dispatched(db):
+    seenNames.clear()
+    db.session.add(Department(name='Outer'))
+    db.session.flush()
+
+    savepoint = db.session.begin_nested()
+    db.session.add(Department(name='Discarded'))
+    db.session.flush()
+    savepoint.rollback()
+
+    with db.session.begin_nested():
+        db.session.add(Department(name='Released'))
+    assert seenNames == []  # Released savepoint isn't a commit
+
+    db.session.commit()
+    assert seenNames == ['Outer', 'Released']
+
+    Department.query.filter(Department.name.in_(['Outer', 'Released'])).delete()
+    db.session.commit()
+
+
+def test_rollback_dispatches_nothing(db):
+    seenNames.clear()
+    db.session.add(Department(name='Never'))
+    db.session.flush()
+    db.session.rollback()
+    db.session.commit()
+    assert seenNames == []
+
+
+def test_changes_pending_before_the_savepoint_survive_its_rollback(db):
+    seenNames.clear()
+    db.session.add(Department(name='Pending'))  # Flushed by begin_nested
+    savepoint = db.session.begin_nested()
+    db.session.add(Department(name='Discarded'))
+    db.session.flush()
+    savepoint.rollback()
+    db.session.commit()
+    assert seenNames == ['Pending']
+
+    Department.query.filter_by(name='Pending').delete()
+    db.session.commit()
@@ -0,0 +1,60 @@
+from datetime import date, time, timedelta
+from models import Appointment, Treatment, Notification, Doctor, Patient
+from reminders import OutboxSink, run_scanner
+
+
+def add_booking(db, day, startTime):
+    appointment = Appointment(patient_id=Patient.query.first().id, doctor_id=Doctor.query.first().id,
+                              appointment_date=day, appointment_time=startTime, status='Booked')
+    db.session.add(appointment)
+    db.session.commit()
+    return appointment
+
+
+def notified(kind):
+    return sorted((row.source_id, row.due_date) for row in Notification.query.filter_by(kind=kind))
+
+
+def test_rescheduled_appointment_gets_a_reminder(db):
+    today = date.today()
+    tomorrow = today + timedelta(days=1)
+    later = add_booking(db, today + timedelta(days=20), time(9, 0))
+    soon = add_booking(db, tomorrow, time(10, 0))
+    laterId, soonId = later.id, soon.id
+
+    assert run_scanner('appointment_reminders', OutboxSink(), 1, today) == (1, 1)
+    assert notified('appointment_reminder') == [(soonId, tomorrow)]
+
+    # Moved into the window - its id sorts before rows already handled
+    later.appointment_date = tomorrow
+    db.session.commit()
+    assert run_scanner('appointment_reminders', OutboxSink(), 1, today)[0] == 1
+    assert notified('appointment_reminder') == sorted([(soonId, tomorrow), (laterId, tomorrow)])
+
+    # Nothing new - nothing sent twice
+    assert run_scanner('appointment_reminders', OutboxSink(), 1, today)[0] == 0
+
+
+def test_edited_follow_up_date_gets_a_notice(db):
+    today = date.today()
+    appointment = add_booking(db, today - timedelta(days=5), time(9, 0))
+    appointment.status = 'Completed'
+    treatment = Treatment(appointment_id=appointment.id, diagnosis='Sprain', follow_up_date=today + timedelta(days=30))
+    db.session.add(treatment)
+    db.session.commit()
+
+    assert run_scanner('follow_ups', OutboxSink(), 3, today)[0] == 0
+
+    treatment.follow_up_date = today + timedelta(days=2)
+    db.session.commit()
+    assert run_scanner('follow_ups', OutboxSink(), 3, today)[0] == 1
+    assert notified('follow_up') == [(treatment.id, today + timedelta(days=2))]
+
+
+def test_batches_cover_the_whole_window(db):
+    today = date.today()
+    for hour in range(9, 16):
+        add_booking(db, today + timedelta(days=1), time(hour, 0))
+
+    assert run_scanner('appointment_reminders', OutboxSink(), 1, today, batchSize=3) == (7, 3)
+    assert Notification.query.count() == 7
@@ -0,0 +1,52 @@
+from datetime import date, timedelta, datetime
+from models import Appointment, Doctor, Patient
+from scheduling import free_slots
+from rescheduling import apply_reschedule
+
+
+def common_slots(doctorIds):
+    """A future day and the slots every doctor in doctorIds has free on it"""
+    day = date.today() + timedelta(days=2)
+    while True:
+        slotsByDoctor = free_slots(doctorIds, day, day)
+        shared = set(slotsByDoctor[doctorIds[0]][day])
+        for doctorId in doctorIds[1:]:
+            shared &= set(slotsByDoctor[doctorId][day])
+        if len(shared) >= 2:
+            return day, sorted(shared)
+        day += timedelta(days=1)
+
+
+def test_move_skips_slots_the_patient_is_booked_elsewhere(db):
+    doctor, otherDoctor, colleague = Doctor.query.order_by(Doctor.id).limit(3).all()
+    firstPatient, secondPatient = Patient.query.order_by(Patient.id).limit(2).all()
+    originalDepartmentId = colleague.department_id
+    colleague.department_id = doctor.department_id
+    db.session.commit()
+    try:
+        day, slots = common_slots([doctor.id, otherDoctor.id, colleague.id])
+        firstSlot = slots[0]
+        nextSlot = (datetime.combine(day, firstSlot) + timedelta(minutes=30)).time()
+        assert nextSlot in slots
+
+        moving = Appointment(patient_id=firstPatient.id, doctor_id=doctor.id, appointment_date=day,
+                             appointment_time=firstSlot, status='Booked')
+        db.session.add_all([
+            moving,
+            Appointment(patient_id=firstPatient.id, doctor_id=otherDoctor.id, appointment_date=day,
+                        appointment_time=nextSlot, status='Booked'),
+            Appointment(patient_id=secondPatient.id, doctor_id=colleague.id, appointment_date=day,
+                        appointment_time=firstSlot, status='Booked')
+        ])
+        db.session.commit()
+
+        moves = apply_reschedule(doctor.id, day, day, markUnavailable=False)
+
+        assert len(moves) == 1 and moves[0]['appointment'].id == moving.id
+        assert (moves[0]['new_date'], moves[0]['new_time']) != (day, nextSlot)
+        patientTimes = [apt.appointment_time for apt in Appointment.query.filter_by(
+            patient_id=firstPatient.id, appointment_date=day, status='Booked')]
+        assert len(patientTimes) == len(set(patientTimes))
+    finally:
+        colleague.department_id = originalDepartmentId
+        db.session.commit()
@@ -0,0 +1,54 @@
+from datetime import date, time, timedelta
+from models import Appointment, AvailabilityException, WaitlistEntry, Doctor, Patient
+from scheduling import free_slots
+from waitlist import cancel_and_promote
+
+
+def setup_slot(db):
+    """A booked future slot for the first patient and a waiting entry for the second"""
+    doctor = Doctor.query.first()
+    firstPatient, secondPatient = Patient.query.order_by(Patient.id).limit(2).all()
+    day = date.today() + timedelta(days=2)
+    while not free_slots([doctor.id], day, day)[doctor.id].get(day):
+        day += timedelta(days=1)
+    slotTime = free_slots([doctor.id], day, day)[doctor.id][day][0]
+
+    appointment = Appointment(patient_id=firstPatient.id, doctor_id=doctor.id, appointment_date=day,
+                              appointment_time=slotTime, status='Booked')
+    db.session.add(appointment)
+    db.session.add(WaitlistEntry(patient_id=secondPatient.id, doctor_id=doctor.id, start_date=day, end_date=day))
+    db.session.commit()
+    return appointment, secondPatient
+
+
+def test_cancelled_slot_goes_to_the_waitlist(db):
+    appointment, waitingPatient = setup_slot(db)
+    entry = cancel_and_promote(appointment)
+    db.session.commit()
+
+    assert entry is not None and entry.status == 'Promoted'
+    assert entry.appointment.patient_id == waitingPatient.id
+
+
+def test_no_promotion_into_a_day_off(db):
+    appointment, waitingPatient = setup_slot(db)
+    db.session.add(AvailabilityException(doctor_id=appointment.doctor_id, date=appointment.appointment_date,
+                                         is_available=False, reason='Leave'))
+    db.session.commit()
+
+    assert cancel_and_promote(appointment) is None
+    db.session.commit()
+    assert WaitlistEntry.query.one().status == 'Waiting'
+    assert Appointment.query.filter_by(status='Booked').count() == 0
+
+
+def test_patient_booked_at_an_overlapping_time_is_skipped(db):
+    appointment, waitingPatient = setup_slot(db)
+    otherDoctor = Doctor.query.filter(Doctor.id != appointment.doctor_id).first()
+    startMinutes = appointment.appointment_time.hour * 60 + appointment.appointment_time.minute + 10
+    db.session.add(Appointment(patient_id=waitingPatient.id, doctor_id=otherDoctor.id,
+                               appointment_date=appointment.appointment_date,
+                               appointment_time=time(startMinutes // 60, startMinutes % 60), status='Booked'))
+    db.session.commit()
+
+    assert cancel_and_promote(appointment) is None
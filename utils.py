@@ -1,9 +1,113 @@
 from extensions import db
-from models import User, Department, Doctor, Patient, DoctorAvailability, Appointment
+from models import User, Department, Doctor, Patient, AvailabilityTemplate, Appointment, Treatment, \
+    ArchivedAppointment, ArchivedTreatment
 from functools import wraps
 from flask_login import current_user
 from flask import abort
 from datetime import datetime, timedelta, time
+from sqlalchemy import inspect, MetaData
+from sqlalchemy.schema import CreateTable
+
+# Schema changes that db.create_all() can't apply to existing tables
+def _use_autoincrement(conn, modelClass, archiveClass):
+    """Rebuild a table created without AUTOINCREMENT, so SQLite never hands out an archived id again"""
+    tableName = modelClass.__tablename__
+    createSql = conn.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (tableName,)
+    ).scalar()
+    if createSql is None or 'AUTOINCREMENT' in createSql.upper():
+        return
+
+    # New table under a temporary name, then swapped in - renaming the old one
+    # instead would repoint the foreign keys of other tables at it
+    newTableName = f'{tableName}_autoincrement'
+    scratchMetadata = MetaData()  # Copy of the schema so foreign keys resolve, create_all never sees it
+    for existingTable in db.metadata.tables.values():
+        existingTable.to_metadata(scratchMetadata)
+    newTable = modelClass.__table__.to_metadata(scratchMetadata, name=newTableName)
+    oldColumnNames = {column['name'] for column in inspect(conn).get_columns(tableName)}
+    columnList = ', '.join(column.name for column in newTable.columns if column.name in oldColumnNames)
+    conn.exec_driver_sql(f"DROP TABLE IF EXISTS {newTableName}")
+    conn.execute(CreateTable(newTable))
+    conn.exec_driver_sql(f"INSERT INTO {newTableName} ({columnList}) SELECT {columnList} FROM {tableName}")
+    conn.exec_driver_sql(f"DROP TABLE {tableName}")
+    conn.exec_driver_sql(f"ALTER TABLE {newTableName} RENAME TO {tableName}")
+    for index in modelClass.__table__.indexes:
+        if index.name != 'uq_appointments_booked_slot':  # Created below, after the duplicate check
+            index.create(conn, checkfirst=True)
+
+    # Ids already moved to the archive count as used too
+    highestId = max(
+        conn.exec_driver_sql(f"SELECT COALESCE(MAX(id), 0) FROM {tableName}").scalar(),
+        conn.exec_driver_sql(f"SELECT COALESCE(MAX(id), 0) FROM {archiveClass.__tablename__}").scalar()
+    )
+    conn.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = ?", (tableName,))
+    conn.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (tableName, highestId))
+    print(f"Rebuilt {tableName} with AUTOINCREMENT ids (next id after {highestId})")
+
+
+def upgrade_schema():
+    """Bring a database created by an older version up to date"""
+    with db.engine.begin() as conn:
+        if conn.dialect.name == 'sqlite':
+            _use_autoincrement(conn, Appointment, ArchivedAppointment)
+            _use_autoincrement(conn, Treatment, ArchivedTreatment)
+
+        # One availability row per doctor and day - only needed once, before the index exists
+        availabilityIndexes = {index['name'] for index in inspect(conn).get_indexes('doctor_availability')}
+        if 'uq_doctor_availability_doctor_date' not in availabilityIndexes:
+            # Keep the newest row per doctor and day before enforcing uniqueness
+            removedRows = conn.exec_driver_sql(
+                "DELETE FROM doctor_availability WHERE id NOT IN "
+                "(SELECT MAX(id) FROM doctor_availability GROUP BY doctor_id, date)"
+            ).rowcount
+            print(f"Removed {removedRows} duplicate doctor_availability rows before adding "
+                  f"uq_doctor_availability_doctor_date")
+            conn.exec_driver_sql(
+                "CREATE UNIQUE INDEX uq_doctor_availability_doctor_date ON doctor_availability (doctor_id, date)"
+            )
+
+        # Date indexes for the reminder/follow-up scans and the stale booking close-out
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_appointments_date ON appointments (appointment_date)")
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_treatments_follow_up_date ON treatments (follow_up_date)")
+        conn.exec_driver_sql(
+            "CREATE INDEX IF NOT EXISTS ix_appointments_status_date ON appointments (status, appointment_date)"
+        )
+
+        # Double booking guard - can't be added while duplicates exist, those need sorting out by hand
+        duplicateSlots = conn.exec_driver_sql(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM appointments WHERE status = 'Booked' "
+            "GROUP BY doctor_id, appointment_date, appointment_time HAVING COUNT(*) > 1)"
+        ).scalar()
+        if duplicateSlots:
+            print(f"Warning: {duplicateSlots} doctor slots have more than one Booked appointment, "
+                  f"uq_appointments_booked_slot not created")
+        else:
+            conn.exec_driver_sql(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_appointments_booked_slot "
+                "ON appointments (doctor_id, appointment_date, appointment_time) WHERE status = 'Booked'"
+            )
+
+        # Notification ledger key - reminders dedupe on it
+        duplicateNotifications = conn.exec_driver_sql(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM notifications GROUP BY kind, source_id, due_date HAVING COUNT(*) > 1)"
+        ).scalar()
+        if duplicateNotifications:
+            print(f"Warning: {duplicateNotifications} notifications are recorded more than once, "
+                  f"uq_notifications_kind_source_due not created")
+        else:
+            conn.exec_driver_sql(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_notifications_kind_source_due "
+                "ON notifications (kind, source_id, due_date)"
+            )
+
+        # updated_at (used for ETags) on tables that were created without it
+        for tableName in ('departments', 'doctors', 'patients'):
+            columnNames = {column['name'] for column in inspect(conn).get_columns(tableName)}
+            if 'updated_at' not in columnNames:
+                conn.exec_driver_sql(f"ALTER TABLE {tableName} ADD COLUMN updated_at DATETIME")
+                conn.exec_driver_sql(f"UPDATE {tableName} SET updated_at = created_at")
+
 
 # Setup function for initial data
 def create_admin():
@@ -106,18 +210,15 @@ def create_sample_data():
         db.session.add(newDoctor)
         db.session.flush()
         
-        # Add availability for next 7 days
-        today = datetime.now().date()
-        for i in range(7):
-            availDate = today + timedelta(days=i)
-            availability = DoctorAvailability(
+        # Weekly hours 9 to 5 every day - expanded for any date on demand
+        for weekday in range(7):
+            template = AvailabilityTemplate(
                 doctor_id=newDoctor.id,
-                date=availDate,
+                weekday=weekday,
                 start_time=time(9, 0),
-                end_time=time(17, 0),
-                is_available=True
+                end_time=time(17, 0)
             )
-            db.session.add(availability)
+            db.session.add(template)
     
     # Sample patients data
     samplePatients = [
@@ -0,0 +1,94 @@
+from extensions import db
+from models import Appointment, WaitlistEntry
+from scheduling import scheduleIndex, booking_problem, recheck_booking, to_minutes, from_minutes
+from sqlalchemy import or_, exists
+from datetime import datetime
+
+# Waitlist promotion
+# Waiting entries form a priority queue per doctor, stored in the database
+# and ordered by the (doctor_id, status, priority, created_at) index. When a
+# booked slot is cancelled, the first entry whose date range and time window
+# cover the slot gets the slot - in the caller's transaction, so the
+# cancellation and the new booking commit (or roll back) together. A slot
+# the doctor can no longer work (day off, changed hours) isn't handed out.
+
+
+def first_matching_entry(doctorId, day, slotTime, excludePatientId=None):
+    """Head of the doctor's queue that would accept the given slot, or None"""
+    # Patients already booked (with anyone) at an overlapping time are skipped
+    slotMinutes = scheduleIndex.slotMinutes
+    startMinute = to_minutes(slotTime)
+    clashingBooking = exists().where(
+        Appointment.patient_id == WaitlistEntry.patient_id,
+        Appointment.appointment_date == day,
+        Appointment.appointment_time >= from_minutes(max(startMinute - slotMinutes + 1, 0)),
+        Appointment.appointment_time <= from_minutes(min(startMinute + slotMinutes - 1, 24 * 60 - 1)),
+        Appointment.status == 'Booked'
+    )
+
+    query = WaitlistEntry.query.filter(
+        WaitlistEntry.doctor_id == doctorId,
+        WaitlistEntry.status == 'Waiting',
+        WaitlistEntry.start_date <= day,
+        WaitlistEntry.end_date >= day,
+        or_(WaitlistEntry.earliest_time.is_(None), WaitlistEntry.earliest_time <= slotTime),
+        or_(WaitlistEntry.latest_time.is_(None), WaitlistEntry.latest_time >= slotTime),
+        ~clashingBooking
+    )
+    if excludePatientId is not None:
+        query = query.filter(WaitlistEntry.patient_id != excludePatientId)
+
+    return query.order_by(
+        WaitlistEntry.priority.desc(),
+        WaitlistEntry.created_at,
+        WaitlistEntry.id
+    ).first()
+
+
+def promote_from_waitlist(cancelledAppointment):
+    """Give a just-cancelled slot to the first matching waitlisted patient
+
+    Call after setting the status to Cancelled and before committing. Adds
+    the new appointment to the session and returns the promoted entry, or
+    None if the slot is in the past, the doctor isn't available for it any
+    more, or nobody on the waitlist fits.
+    """
+    slotStart = datetime.combine(cancelledAppointment.appointment_date, cancelledAppointment.appointment_time)
+    if slotStart <= datetime.now():
+        return None
+
+    slotKey = (cancelledAppointment.doctor_id, cancelledAppointment.appointment_date,
+               cancelledAppointment.appointment_time)
+    if booking_problem(*slotKey, ignoreAppointmentId=cancelledAppointment.id) is not None or \
+            recheck_booking(*slotKey, ignoreAppointmentId=cancelledAppointment.id) is not None:
+        return None
+
+    entry = first_matching_entry(
+        cancelledAppointment.doctor_id,
+        cancelledAppointment.appointment_date,
+        cancelledAppointment.appointment_time,
+        excludePatientId=cancelledAppointment.patient_id
+    )
+    if entry is None:
+        return None
+
+    newAppointment = Appointment(
+        patient_id=entry.patient_id,
+        doctor_id=cancelledAppointment.doctor_id,
+        appointment_date=cancelledAppointment.appointment_date,
+        appointment_time=cancelledAppointment.appointment_time,
+        reason=entry.reason or 'Booked from waitlist',
+        status='Booked'
+    )
+    db.session.add(newAppointment)
+
+    entry.status = 'Promoted'
+    entry.appointment = newAppointment
+    entry.promoted_at = datetime.utcnow()
+    return entry
+
+
+def cancel_and_promote(appointment):
+    """Cancel a booked appointment and refill the slot from the waitlist (caller commits)"""
+    appointment.status = 'Cancelled'
+    return promote_from_waitlist(appointment)